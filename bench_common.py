@@ -0,0 +1,202 @@
+"""
+Harness shared by the benchmark modules.
+
+Runs an operation a number of times at a given concurrency, records the
+latency of every call and reports ops/sec and latency percentiles, both as
+a text table and as machine readable JSON meant to be diffed across runs
+and cluster configurations.
+"""
+import argparse
+import json
+import math
+import platform
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import elasticsearch
+from elasticsearch import Elasticsearch
+
+from suite_config import client_options, es_hosts
+from suite_connection import POOL_STATS
+from suite_transport import SuiteTransport
+
+# What a scenario sets up: the callable run for every operation (it gets
+# the operation number), how many documents one operation handles and what
+# to call once the run is over, if anything.
+Workload = namedtuple(
+    'Workload', ['operation', 'docs_per_operation', 'cleanup'])
+Workload.__new__.__defaults__ = (1, None)
+
+
+def percentile(samples, p):
+    '''Nearest-rank percentile of already sorted samples'''
+    if not samples:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+
+def measure(operation, operations, concurrency, warmup=0):
+    '''Run `operation(i)` for i in range(operations) on `concurrency`
+    threads and return (latencies in seconds of the calls that succeeded,
+    elapsed seconds, errors of those that failed)'''
+    for i in range(warmup):
+        operation(operations + i)
+    latencies = []
+    errors = []
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as e:
+            errors.append(repr(e))
+        else:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(operations)))
+    return latencies, time.perf_counter() - start, errors
+
+
+def summarize(latencies, elapsed, errors, docs_per_operation=1, **meta):
+    '''Result record of one measurement, its throughput and latencies
+    those of the calls that succeeded'''
+    latencies = sorted(latencies)
+    result = dict(meta)
+    result.update({
+        'operations': len(latencies) + len(errors),
+        'errors': len(errors),
+        'elapsed_s': round(elapsed, 6),
+        'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'docs_per_sec': round(
+            len(latencies) * docs_per_operation / elapsed, 2)
+        if elapsed else None,
+        'latency_ms': {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in (
+                ('p50', percentile(latencies, 50)),
+                ('p95', percentile(latencies, 95)),
+                ('p99', percentile(latencies, 99)),
+                ('mean', sum(latencies) / len(latencies)
+                 if latencies else None),
+                ('max', latencies[-1] if latencies else None))
+        }
+    })
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def make_client(concurrency=1, hosts=None, **kwargs):
+    '''Client able to keep `concurrency` requests in flight, tracking the
+    indices it touches so scenarios can clean up after themselves. Worker
+    processes pass the `hosts` of their parent'''
+    options = client_options()
+    options['maxsize'] = max(options['maxsize'], concurrency)
+    options['timeout'] = 60
+    options.update(kwargs)
+    return Elasticsearch(
+        hosts or es_hosts(),
+        transport_class=SuiteTransport,
+        **options)
+
+
+def argument_parser(description, scenarios, concurrency=(1, 4),
+                    doc_size=(100,), operations=500, warmup=20):
+    '''Command line options common to all benchmark modules, with their
+    defaults. Modules that don't measure a number of calls pass None as
+    `operations` or `warmup`, and modules that don't run concurrent
+    clients None as `concurrency`, to leave the option out'''
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--scenarios', nargs='+', choices=sorted(scenarios),
+        default=list(scenarios), metavar='SCENARIO',
+        help='scenarios to run: %s (default: all)' % ', '.join(scenarios))
+    if concurrency is not None:
+        parser.add_argument(
+            '--concurrency', nargs='+', type=int, default=list(concurrency),
+            help='numbers of concurrent clients (default: %s)' % ' '.join(
+                map(str, concurrency)))
+    parser.add_argument(
+        '--doc-size', nargs='+', type=int, default=list(doc_size),
+        help='approximate document sizes in bytes (default: %s)' % ' '.join(
+            map(str, doc_size)))
+    if operations is not None:
+        parser.add_argument(
+            '--operations', type=int, default=operations,
+            help='measured operations per run (default: %d)' % operations)
+    if warmup is not None:
+        parser.add_argument(
+            '--warmup', type=int, default=warmup,
+            help='unmeasured operations before each run (default: %d)'
+                 % warmup)
+    parser.add_argument(
+        '--output', metavar='FILE',
+        help='write the results as JSON to FILE')
+    return parser
+
+
+def run_matrix(es, scenarios, args):
+    '''Measure every selected scenario for every document size and
+    concurrency, dropping the indices a scenario touched after each run'''
+    results = []
+    for name in args.scenarios:
+        for doc_size in args.doc_size:
+            for concurrency in args.concurrency:
+                workload = None
+                try:
+                    workload = scenarios[name](es, args, doc_size)
+                    latencies, elapsed, errors = measure(
+                        workload.operation, args.operations, concurrency,
+                        args.warmup)
+                finally:
+                    if workload is not None and workload.cleanup:
+                        workload.cleanup()
+                    es.transport.drop_touched_indices()
+                results.append(summarize(
+                    latencies, elapsed, errors, workload.docs_per_operation,
+                    scenario=name, concurrency=concurrency,
+                    doc_size=doc_size))
+                print_result(results[-1])
+    return results
+
+
+def print_result(result, label=None, details=''):
+    '''Print a result on one line: its scenario, or `label`, concurrency
+    and document size, its throughput, the latency and errors of its calls
+    when it measured calls, and the `details` its module adds'''
+    line = '%-30s conc=%-3d size=%-6d' % (
+        label or result['scenario'], result['concurrency'],
+        result['doc_size'])
+    if 'ops_per_sec' in result:
+        line += ' %10.1f ops/s' % (result['ops_per_sec'] or 0)
+    line += ' %10.1f docs/s' % (result['docs_per_sec'] or 0)
+    latency = result.get('latency_ms')
+    if latency is not None:
+        line += '  p50=%.2fms p95=%.2fms p99=%.2fms errors=%d' % (
+            latency['p50'] or 0, latency['p95'] or 0, latency['p99'] or 0,
+            result['errors'])
+    if details:
+        line += '  ' + details
+    print(line)
+
+
+def write_report(es, results, args, path):
+    '''Write results with enough context to compare runs'''
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'cluster_version': es.info()['version']['number'],
+            'client_version': elasticsearch.__versionstr__,
+            'python_version': platform.python_version(),
+            'host': platform.node(),
+            'arguments': vars(args)
+        },
+        'results': results,
+        'connection_pool': POOL_STATS.snapshot()
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,171 @@
+"""
+Throughput and latency of the Document API calls covered by tests_es_py.py.
+
+Every scenario drives one call (es.index, es.get, es.mget, helpers.bulk,
+bulk of pre-encoded NDJSON, es.update_by_query, es.reindex) with the
+documents of the functional tests at the requested concurrencies and
+document sizes, and reports ops/sec, docs/sec and p50/p95/p99 latency.
+Both bulk scenarios index the same generated characters (see
+fixtures.generate), so their numbers compare like with like:
+
+    python bench_document_api.py --concurrency 1 8 --doc-size 100 10000 \
+        --output results.json
+
+All indices are prefixed with `bench_` and dropped after each run.
+"""
+import mmap
+import sys
+
+from elasticsearch.helpers import bulk
+
+from bench_common import (
+    Workload,
+    argument_parser,
+    make_client,
+    run_matrix,
+    write_report,
+)
+from fixtures import CHARACTERS, TWEETS, generate, ndjson_fixture, sized
+from suite_ndjson import ndjson_chunks, send_chunk
+
+
+def seed(es, index, docs, count):
+    '''Index `count` documents cycling through `docs` and make them
+    searchable'''
+    bulk(es, (
+        {'_index': index, '_id': i, '_source': docs[i % len(docs)]}
+        for i in range(count)
+    ))
+    es.indices.refresh(index=index)
+
+
+def bench_index(es, args, doc_size):
+    '''es.index of tweets with explicit ids'''
+    tweets = [sized(doc, doc_size) for doc in TWEETS]
+
+    def operation(i):
+        es.index(index='twitter', id=i, body=tweets[i % len(tweets)])
+    return Workload(operation)
+
+
+def bench_get(es, args, doc_size):
+    '''es.get of seeded tweets'''
+    seed(es, 'twitter', [sized(doc, doc_size) for doc in TWEETS],
+         args.seed_docs)
+
+    def operation(i):
+        es.get(index='twitter', id=i % args.seed_docs)
+    return Workload(operation)
+
+
+def bench_mget(es, args, doc_size):
+    '''es.mget of consecutive Rick and Morty ids'''
+    seed(es, 'rick&morty', [sized(doc, doc_size) for doc in CHARACTERS],
+         args.seed_docs)
+
+    def operation(i):
+        es.mget(index='rick&morty', body={'ids': [
+            (i * args.mget_size + j) % args.seed_docs
+            for j in range(args.mget_size)
+        ]})
+    return Workload(operation, args.mget_size)
+
+
+def bench_bulk(es, args, doc_size):
+    '''helpers.bulk indexing generated characters, the i-th call those
+    at positions i * bulk size onwards'''
+    characters = list(generate(
+        'character', (args.operations + args.warmup) * args.bulk_size,
+        size=doc_size))
+
+    def operation(i):
+        bulk(es, (
+            {
+                '_index': 'rick&morty',
+                '_id': position,
+                '_source': characters[position]
+            }
+            for position in range(
+                i * args.bulk_size, (i + 1) * args.bulk_size)
+        ))
+    return Workload(operation, args.bulk_size)
+
+
+def bench_bulk_ndjson(es, args, doc_size):
+    '''Bulk indexing of generated characters, encoded once into a cached
+    NDJSON file and sent from a memory map of it chunk by chunk without
+    re-serializing'''
+    path = ndjson_fixture(
+        'character', (args.operations + args.warmup) * args.bulk_size,
+        size=doc_size)
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    chunks = list(ndjson_chunks(data, args.bulk_size))
+
+    def operation(i):
+        for ok, item in send_chunk(es, data, chunks[i], index='rick&morty'):
+            if not ok:
+                raise RuntimeError('bulk failed: %r' % (item,))
+    return Workload(operation, args.bulk_size, data.close)
+
+
+def bench_update_by_query(es, args, doc_size):
+    '''es.update_by_query over the seeded tweets of kimchy'''
+    seed(es, 'twitter', [sized(doc, doc_size) for doc in TWEETS],
+         args.seed_docs)
+
+    def operation(i):
+        es.update_by_query(
+            index='twitter',
+            body={"query": {"term": {"user": "kimchy"}}},
+            conflicts='proceed')
+    return Workload(operation, (args.seed_docs + 1) // 2)
+
+
+def bench_reindex(es, args, doc_size):
+    '''es.reindex of the seeded tweets from twitter to new_twitter'''
+    seed(es, 'twitter', [sized(doc, doc_size) for doc in TWEETS],
+         args.seed_docs)
+
+    def operation(i):
+        es.reindex(body={
+            "source": {"index": "twitter"},
+            "dest": {"index": "new_twitter"}
+        })
+    return Workload(operation, args.seed_docs)
+
+
+SCENARIOS = {
+    'index': bench_index,
+    'get': bench_get,
+    'mget': bench_mget,
+    'bulk': bench_bulk,
+    'bulk_ndjson': bench_bulk_ndjson,
+    'update_by_query': bench_update_by_query,
+    'reindex': bench_reindex,
+}
+
+
+def main(argv=None):
+    parser = argument_parser(__doc__.split('\n\n')[0], SCENARIOS)
+    parser.add_argument(
+        '--seed-docs', type=int, default=1000,
+        help='documents seeded for get, mget, update_by_query and reindex '
+             '(default: 1000)')
+    parser.add_argument(
+        '--mget-size', type=int, default=10,
+        help='ids per mget request (default: 10)')
+    parser.add_argument(
+        '--bulk-size', type=int, default=100,
+        help='actions per bulk request (default: 100)')
+    args = parser.parse_args(argv)
+
+    es = make_client(max(args.concurrency), index_prefix='bench_')
+    results = run_matrix(es, SCENARIOS, args)
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
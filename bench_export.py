@@ -0,0 +1,171 @@
+"""
+Export of a whole index by scroll, sliced scroll and search_after.
+
+Seeds the `twitter` index with generated tweets (see fixtures.generate) of
+every `--doc-size`, each holding its position as a unique `position`
+field, then reads all of it back with every strategy of suite_export.py,
+the scenarios of the benchmark, and reports docs/sec and the peak memory
+of the reading processes. The concurrency is the number of slices, and
+of processes, of sliced scrolls; the other strategies read on one:
+
+    python bench_export.py --docs 1000000 --size 1000 5000 \
+        --concurrency 4 --output export.json
+
+Every strategy runs in freshly started processes (one per slice), which
+report their peak resident memory before and after the export, so the
+growth tells whether memory stayed bounded. Every seeded id must be
+returned exactly once, otherwise the run fails. All indices are prefixed
+with `bench_` and dropped afterwards.
+"""
+import multiprocessing
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from elasticsearch.helpers import bulk
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    print_result,
+    write_report,
+)
+from fixtures import generate
+from suite_config import es_hosts
+from suite_export import IdTally, scroll_export, search_after_export
+
+STRATEGIES = ('scroll', 'sliced_scroll', 'search_after')
+
+
+def seed(es, args, doc_size):
+    '''Index `--docs` tweets with ids and positions 0 to docs - 1'''
+    es.indices.delete(index='twitter', ignore_unavailable=True)
+    es.indices.create(index='twitter', body={
+        'mappings': {'properties': {'position': {'type': 'long'}}}})
+    bulk(es, (
+        {'_index': 'twitter', '_id': i, '_source': dict(doc, position=i)}
+        for i, doc in enumerate(generate('tweet', args.docs, doc_size))
+    ), chunk_size=5000)
+    es.indices.refresh(index='twitter')
+
+
+def peak_rss_mb():
+    '''Peak resident memory of this process so far'''
+    # getrusage keeps the peak of the parent across fork and exec, the
+    # high water mark of /proc starts over with the new process.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:  # not Linux
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def export(spec):
+    '''Export an index or a slice of it in a worker process, returning the
+    IdTally, the seconds it took and the peak memory before and after'''
+    hosts, prefix, strategy, size, slice_id, slices, docs = spec
+    es = make_client(hosts=hosts, index_prefix=prefix, timeout=300)
+    tally = IdTally(docs)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        if strategy == 'search_after':
+            hits = search_after_export(es, 'twitter', 'position', size)
+        else:
+            hits = scroll_export(
+                es, 'twitter', size, slice_id=slice_id, slices=slices)
+        for hit in hits:
+            tally.add(hit['_id'])
+    finally:
+        es.close()
+    return tally, time.perf_counter() - start, baseline, peak_rss_mb()
+
+
+def run(es, args, strategy, doc_size, size, slices):
+    '''Export the seeded index with a strategy on fresh processes'''
+    specs = [
+        (es_hosts(), es.transport.index_prefix, strategy, size, slice_id,
+         slices, args.docs)
+        for slice_id in range(slices)
+    ]
+    # Spawned, not forked, so no process starts out with the memory of
+    # this one (or of the stand-in node it may be running).
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(slices, mp_context=context) as executor:
+        # Workers are started ahead of the clock.
+        list(executor.map(abs, range(slices)))
+        start = time.perf_counter()
+        outcomes = list(executor.map(export, specs))
+        elapsed = time.perf_counter() - start
+    tally = outcomes[0][0]
+    for other, _, _, _ in outcomes[1:]:
+        tally.merge(other)
+    returned = sum(tally.seen) + tally.unexpected
+    return {
+        'scenario': strategy,
+        'concurrency': slices,
+        'doc_size': doc_size,
+        'size': size,
+        'docs': args.docs,
+        'returned': returned,
+        'missing': tally.missing(),
+        'duplicates': tally.duplicates(),
+        'unexpected': tally.unexpected,
+        'elapsed_s': round(elapsed, 6),
+        'docs_per_sec': round(returned / elapsed, 2) if elapsed else None,
+        'slowest_slice_s': round(max(o[1] for o in outcomes), 6),
+        'baseline_rss_mb': round(max(o[2] for o in outcomes), 1),
+        'peak_rss_mb': round(max(o[3] for o in outcomes), 1),
+    }
+
+
+def failed(result):
+    return result['missing'] or result['duplicates'] or result['unexpected']
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], STRATEGIES, concurrency=(2, 4),
+        doc_size=(200,), operations=None, warmup=None)
+    parser.add_argument(
+        '--docs', type=int, default=100000,
+        help='seeded documents (default: 100000)')
+    parser.add_argument(
+        '--size', nargs='+', type=int, default=[1000],
+        help='hits per page (default: 1000)')
+    args = parser.parse_args(argv)
+
+    es = make_client(index_prefix='bench_', timeout=300)
+    results = []
+    try:
+        for doc_size in args.doc_size:
+            seed(es, args, doc_size)
+            for strategy in args.scenarios:
+                for size in args.size:
+                    for slices in (args.concurrency
+                                   if strategy == 'sliced_scroll' else [1]):
+                        result = run(
+                            es, args, strategy, doc_size, size, slices)
+                        results.append(result)
+                        print_result(
+                            result, '%s page=%d' % (strategy, size),
+                            'rss=%.1fMB (+%.1fMB) missing=%d '
+                            'duplicates=%d%s' % (
+                                result['peak_rss_mb'],
+                                result['peak_rss_mb']
+                                - result['baseline_rss_mb'],
+                                result['missing'], result['duplicates'],
+                                '  FAILED' if failed(result) else ''))
+    finally:
+        es.transport.drop_touched_indices()
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(failed(result) for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
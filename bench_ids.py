@@ -0,0 +1,161 @@
+"""
+Indexing with auto-generated against explicit document ids.
+
+Indexes generated tweets (see fixtures.generate) with `es.index` and with
+`helpers.bulk`, under four id strategies, the scenarios of the benchmark:
+
+    auto        ids generated by the node (no `_id`), which can skip the
+                lookup of an existing version of the document
+    sequential  explicit ids 0, 1, 2, ... in indexing order
+    uuid        explicit random UUIDs (seeded, the same every run)
+    create      sequential explicit ids with `op_type=create`
+
+and reports docs/sec, latency and the size of the index afterwards (store
+size and bytes per document, after a refresh, without merging):
+
+    python bench_ids.py --docs-per-run 100000 --apis bulk \
+        --concurrency 1 8 --batch-size 1000 --output ids.json
+
+Every run writes a fresh index, which must hold exactly as many documents
+as were written, otherwise the run fails. All indices are prefixed with
+`bench_` and dropped after every run.
+"""
+import random
+import sys
+import uuid
+
+from elasticsearch.helpers import bulk
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    measure,
+    print_result,
+    summarize,
+    write_report,
+)
+from fixtures import generate
+
+STRATEGIES = ('auto', 'sequential', 'uuid', 'create')
+APIS = ('index', 'bulk')
+
+
+def ids_of(strategy, count):
+    '''Ids of the documents in indexing order, None to let the node pick'''
+    if strategy == 'auto':
+        return [None] * count
+    if strategy == 'uuid':
+        rng = random.Random(0)
+        return [str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                for _ in range(count)]
+    return [str(i) for i in range(count)]
+
+
+def workload(es, api, strategy, docs, ids, batch_size):
+    '''The operation of the i-th call and the documents it writes'''
+    op_type = 'create' if strategy == 'create' else 'index'
+
+    def index(i):
+        if ids[i] is None:
+            es.index(index='twitter', body=docs[i])
+        else:
+            es.index(index='twitter', id=ids[i], body=docs[i],
+                     op_type=op_type)
+
+    def action(j):
+        action = {'_op_type': op_type, '_index': 'twitter',
+                  '_source': docs[j]}
+        if ids[j] is not None:
+            action['_id'] = ids[j]
+        return action
+
+    def bulk_batch(i):
+        start = i * batch_size
+        bulk(es, (action(j) for j in range(start, start + batch_size)),
+             chunk_size=batch_size)
+    if api == 'index':
+        return index, 1
+    return bulk_batch, batch_size
+
+
+def index_size(es):
+    '''Documents and store size of the benchmark index'''
+    es.indices.refresh(index='twitter')
+    stats = es.indices.stats(index='twitter', metric='docs,store')
+    primaries = stats['_all']['primaries']
+    return primaries['docs']['count'], primaries['store']['size_in_bytes']
+
+
+def failed(result):
+    return result['errors'] or result['stored_docs'] != result['written_docs']
+
+
+def run(es, args, api, strategy, docs, concurrency, doc_size):
+    '''Measure an API writing under an id strategy, returning the
+    result'''
+    ids = ids_of(strategy, args.docs_per_run)
+    operation, batch = workload(
+        es, api, strategy, docs, ids, args.batch_size)
+    operations = args.docs_per_run // batch
+    try:
+        # No warmup: it would write documents the index size and the
+        # count check then have to account for.
+        latencies, elapsed, errors = measure(
+            operation, operations, concurrency)
+        stored, size = index_size(es)
+    finally:
+        es.transport.drop_touched_indices()
+    result = summarize(
+        latencies, elapsed, errors, batch, scenario=strategy, api=api,
+        concurrency=concurrency, batch_size=batch, doc_size=doc_size)
+    result.update({
+        'written_docs': operations * batch,
+        'stored_docs': stored,
+        'store_bytes': size,
+        'bytes_per_doc': round(size / stored, 1) if stored else None,
+    })
+    return result
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], STRATEGIES, doc_size=(200,),
+        operations=None, warmup=None)
+    parser.add_argument(
+        '--apis', nargs='+', choices=APIS, default=list(APIS),
+        help='APIs to measure (default: both)')
+    parser.add_argument(
+        '--docs-per-run', type=int, default=20000,
+        help='documents written by every measured run (default: 20000)')
+    parser.add_argument(
+        '--batch-size', type=int, default=500,
+        help='documents per bulk call (default: 500)')
+    args = parser.parse_args(argv)
+
+    es = make_client(max(args.concurrency), index_prefix='bench_')
+    results = []
+    for doc_size in args.doc_size:
+        docs = list(generate('tweet', args.docs_per_run, doc_size))
+        for api in args.apis:
+            for concurrency in args.concurrency:
+                for strategy in args.scenarios:
+                    result = run(
+                        es, args, api, strategy, docs, concurrency,
+                        doc_size)
+                    results.append(result)
+                    print_result(
+                        result, '%s %s' % (strategy, api),
+                        'store=%.1fMB (%.0f B/doc)%s' % (
+                            result['store_bytes'] / 1024.0 / 1024,
+                            result['bytes_per_doc'] or 0,
+                            '' if result['stored_docs']
+                            == result['written_docs']
+                            else '  COUNT MISMATCH (%d stored)'
+                            % result['stored_docs']))
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(failed(result) for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
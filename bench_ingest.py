@@ -0,0 +1,217 @@
+"""
+Indexing through ingest pipelines against the unpipelined path.
+
+Indexes generated tweets (see fixtures.generate), each with a `post_date`,
+one at a time with `es.index` and in batches with `helpers.bulk`, without a
+pipeline and through each pipeline of fixtures.PIPELINES (a set, a script,
+a date and a rename processor, and all four together), the scenarios of
+the benchmark, and reports docs/sec, latency, the overhead against the
+unpipelined run of the same API, concurrency and document size, and the
+time the node reports spending in the pipeline (`_nodes/stats/ingest`):
+
+    python bench_ingest.py --scenarios none set date all --apis bulk \
+        --concurrency 1 8 --batch-size 500 --output ingest.json
+
+Every pipeline is checked with `_simulate` before it is measured, and a
+sample of the documents indexed through it must read back exactly as
+`_simulate` transforms them, otherwise the run fails. Indices and
+pipelines are namespaced with `bench_<pid>_`, so concurrent runs don't
+overwrite each other's pipelines; pipelines are deleted afterwards and
+indices dropped after every run.
+"""
+import os
+import random
+import sys
+
+from elasticsearch.helpers import bulk
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    measure,
+    print_result,
+    summarize,
+    write_report,
+)
+from fixtures import PIPELINES, generate
+
+APIS = ('index', 'bulk')
+# Fields every pipeline adds to a tweet.
+ADDED_FIELDS = {
+    'set': {'source'},
+    'script': {'handle'},
+    'date': {'@timestamp'},
+    'rename': {'author'},
+    'all': {'source', 'handle', '@timestamp', 'author'},
+}
+SAMPLE = 20
+
+
+def pipeline_id(es, kind):
+    if kind == 'none':
+        return None
+    return '%s%s' % (es.transport.index_prefix, kind)
+
+
+def tweets(count, size):
+    '''Generated tweets, the i-th posted i seconds after the first'''
+    return [
+        dict(doc, post_date='2020-05-%02d %02d:%02d:%02d' % (
+            1 + i // 86400 % 28, i // 3600 % 24, i // 60 % 60, i % 60))
+        for i, doc in enumerate(generate('tweet', count, size))
+    ]
+
+
+def simulate(es, kind, docs):
+    '''_source of documents after a pipeline'''
+    if kind == 'none':
+        return docs
+    return [
+        result['doc']['_source'] for result in es.ingest.simulate(
+            id=pipeline_id(es, kind),
+            body={'docs': [{'_source': doc} for doc in docs]})['docs']
+    ]
+
+
+def check_simulated(es, kind, docs):
+    '''Fail unless the pipeline adds the fields it should'''
+    for doc in simulate(es, kind, docs):
+        missing = ADDED_FIELDS.get(kind, set()) - set(doc)
+        if missing:
+            raise AssertionError('pipeline %s did not add %s to %r' % (
+                kind, ', '.join(sorted(missing)), doc))
+
+
+def mismatches(es, kind, docs, written):
+    '''Sampled documents stored differently from their simulation'''
+    ids = random.Random(0).sample(range(written), min(SAMPLE, written))
+    stored = es.mget(index='twitter', body={'ids': ids})['docs']
+    expected = simulate(es, kind, [docs[i] for i in ids])
+    return sum(
+        1 for doc, source in zip(stored, expected)
+        if doc.get('_source') != source)
+
+
+def workload(es, api, kind, docs, batch_size):
+    '''The operation of the i-th call and the documents it writes'''
+    pipeline = pipeline_id(es, kind)
+
+    def index(i):
+        es.index(index='twitter', id=i, body=docs[i], pipeline=pipeline)
+
+    def bulk_batch(i):
+        start = i * batch_size
+        bulk(es, (
+            {'_index': 'twitter', '_id': j, '_source': docs[j]}
+            for j in range(start, start + batch_size)
+        ), chunk_size=batch_size, pipeline=pipeline)
+    if api == 'index':
+        return index, 1
+    return bulk_batch, batch_size
+
+
+def ingest_millis(es, kind):
+    '''Milliseconds the nodes spent in a pipeline so far'''
+    if kind == 'none':
+        return 0
+    return sum(
+        node.get('ingest', {}).get('pipelines', {}).get(
+            pipeline_id(es, kind), {}).get('time_in_millis', 0)
+        for node in es.nodes.stats(metric='ingest')['nodes'].values())
+
+
+def add_overhead(results):
+    '''Relative docs/sec lost against the unpipelined run of the same API,
+    concurrency and document size'''
+    def key(result):
+        return result['api'], result['concurrency'], result['doc_size']
+    baselines = {
+        key(r): r['docs_per_sec'] for r in results if r['scenario'] == 'none'
+    }
+    for result in results:
+        baseline = baselines.get(key(result))
+        result['overhead_pct'] = round(
+            100 * (1 - result['docs_per_sec'] / baseline), 1
+        ) if baseline and result['docs_per_sec'] else None
+
+
+def failed(result):
+    return result['errors'] or result['mismatches']
+
+
+def run(es, args, api, kind, docs, concurrency, doc_size):
+    '''Measure an API writing through a pipeline, returning the result'''
+    operation, batch = workload(es, api, kind, docs, args.batch_size)
+    try:
+        # Warmed up here, so the pipeline time of the warmup calls stays
+        # out of `ingest_ms`.
+        for i in range(args.warmup):
+            operation(args.operations + i)
+        before = ingest_millis(es, kind)
+        latencies, elapsed, errors = measure(
+            operation, args.operations, concurrency)
+        ingested = ingest_millis(es, kind) - before
+        result = summarize(
+            latencies, elapsed, errors, batch, scenario=kind, api=api,
+            concurrency=concurrency, batch_size=batch, doc_size=doc_size)
+        result['ingest_ms'] = ingested
+        result['mismatches'] = mismatches(
+            es, kind, docs, args.operations * batch)
+    finally:
+        es.transport.drop_touched_indices()
+    return result
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], ['none'] + list(PIPELINES),
+        doc_size=(200,))
+    parser.add_argument(
+        '--apis', nargs='+', choices=APIS, default=list(APIS),
+        help='APIs to measure (default: both)')
+    parser.add_argument(
+        '--batch-size', type=int, default=100,
+        help='documents per bulk call (default: 100)')
+    args = parser.parse_args(argv)
+
+    es = make_client(
+        max(args.concurrency), index_prefix='bench_%d_' % os.getpid())
+    largest = args.batch_size if 'bulk' in args.apis else 1
+    kinds = [kind for kind in args.scenarios if kind != 'none']
+    results = []
+    try:
+        for kind in kinds:
+            es.ingest.put_pipeline(id=pipeline_id(es, kind), body={
+                'description': 'bench_ingest.py: %s' % kind,
+                'processors': PIPELINES[kind]})
+        for doc_size in args.doc_size:
+            docs = tweets(
+                (args.operations + args.warmup) * largest, doc_size)
+            for kind in kinds:
+                check_simulated(es, kind, docs[:SAMPLE])
+            for api in args.apis:
+                for concurrency in args.concurrency:
+                    for kind in args.scenarios:
+                        results.append(run(
+                            es, args, api, kind, docs, concurrency,
+                            doc_size))
+        add_overhead(results)
+        for result in results:
+            overhead = result['overhead_pct']
+            print_result(
+                result, '%s %s' % (result['scenario'], result['api']),
+                'overhead=%s ingest=%dms%s' % (
+                    '-' if overhead is None else '%.1f%%' % overhead,
+                    result['ingest_ms'],
+                    '  MISMATCHED' if result['mismatches'] else ''))
+    finally:
+        for kind in kinds:
+            es.ingest.delete_pipeline(
+                id=pipeline_id(es, kind), ignore=404)
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(failed(result) for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
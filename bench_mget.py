@@ -0,0 +1,180 @@
+"""
+High-volume mget, split into concurrent chunks.
+
+Fetches tens of thousands of ids (a share of them missing) from an index
+seeded with generated characters (see fixtures.generate), splitting them
+into chunks of every given size issued on a thread pool, and reassembles
+the documents in request order. Every fetch is verified: each position
+must hold the requested id, found exactly when the id was seeded, and
+only the requested fields. Latency is reported per chunk request so the
+best chunk size for a read path can be picked:
+
+    python bench_mget.py --ids 50000 --chunk-size 100 500 2000 \
+        --concurrency 1 8 --source-includes name --output mget.json
+
+The concurrency is the number of chunks in flight at once. All indices
+are prefixed with `bench_` and dropped afterwards.
+"""
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    print_result,
+    summarize,
+    write_report,
+)
+from bench_document_api import seed
+from fixtures import generate
+
+
+def chunked(ids, chunk_size):
+    return [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+
+def chunked_mget(es, executor, index, ids, chunk_size, **params):
+    '''mget `ids` in chunks of `chunk_size` issued on `executor`. Returns
+    the docs in the order of `ids` and the latency of every chunk'''
+    def fetch(chunk):
+        start = time.perf_counter()
+        docs = es.mget(index=index, body={'ids': chunk}, **params)['docs']
+        return docs, time.perf_counter() - start
+    docs = []
+    latencies = []
+    # map keeps the order of the chunks, whichever completes first.
+    for chunk_docs, latency in executor.map(fetch, chunked(ids, chunk_size)):
+        docs.extend(chunk_docs)
+        latencies.append(latency)
+    return docs, latencies
+
+
+def requested_ids(args):
+    '''Seeded and missing ids in a reproducible random order'''
+    missing = int(args.ids * args.missing_ratio)
+    ids = [str(i) for i in range(args.ids - missing)]
+    ids += [str(args.seed_docs + i) for i in range(missing)]
+    random.Random(args.seed).shuffle(ids)
+    return ids
+
+
+def verify(docs, ids, args):
+    '''Problems with the docs an mget of `ids` returned'''
+    if len(docs) != len(ids):
+        return ['%d docs for %d ids' % (len(docs), len(ids))]
+    problems = []
+    for position, (doc, doc_id) in enumerate(zip(docs, ids)):
+        expected = int(doc_id) < args.seed_docs
+        if doc['_id'] != doc_id:
+            problems.append('position %d holds %s instead of %s' % (
+                position, doc['_id'], doc_id))
+        elif doc.get('found') != expected:
+            problems.append('%s found=%s, expected %s' % (
+                doc_id, doc.get('found'), expected))
+        elif expected and args.stored_fields is not None:
+            if '_source' in doc:
+                problems.append(
+                    '%s returned _source with stored_fields' % doc_id)
+        elif expected and args.source_includes:
+            extra = set(doc.get('_source', {})) - set(args.source_includes)
+            if extra:
+                problems.append('%s returned %s' % (doc_id, sorted(extra)))
+        elif expected and args.source_excludes:
+            extra = set(doc.get('_source', {})) & set(args.source_excludes)
+            if extra:
+                problems.append('%s returned %s' % (doc_id, sorted(extra)))
+        if len(problems) >= 10:
+            break
+    return problems
+
+
+def mget_params(args):
+    params = {}
+    if args.source_includes:
+        params['_source_includes'] = args.source_includes
+    if args.source_excludes:
+        params['_source_excludes'] = args.source_excludes
+    if args.stored_fields is not None:
+        params['stored_fields'] = args.stored_fields
+    return params
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], ('mget',), operations=None, warmup=None)
+    parser.add_argument(
+        '--ids', type=int, default=20000,
+        help='ids per fetch (default: 20000)')
+    parser.add_argument(
+        '--missing-ratio', type=float, default=0.1,
+        help='share of requested ids that were never indexed (default: 0.1)')
+    parser.add_argument(
+        '--chunk-size', nargs='+', type=int, default=[100, 1000, 5000],
+        help='ids per mget request (default: 100 1000 5000)')
+    parser.add_argument(
+        '--fetches', type=int, default=3,
+        help='measured fetches of all ids per run (default: 3)')
+    parser.add_argument(
+        '--source-includes', nargs='+', metavar='FIELD',
+        help='fields to return in _source')
+    parser.add_argument(
+        '--source-excludes', nargs='+', metavar='FIELD',
+        help='fields to leave out of _source')
+    parser.add_argument(
+        '--stored-fields', nargs='*', metavar='FIELD',
+        help='stored fields to return instead of _source')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='seed of the order of the ids (default: 0)')
+    args = parser.parse_args(argv)
+    missing = int(args.ids * args.missing_ratio)
+    args.seed_docs = args.ids - missing
+
+    es = make_client(max(args.concurrency), index_prefix='bench_')
+    ids = requested_ids(args)
+    params = mget_params(args)
+    results = []
+    try:
+        for doc_size in args.doc_size:
+            seed(es, 'rick&morty',
+                 list(generate('character', args.seed_docs, doc_size)),
+                 args.seed_docs)
+            for chunk_size in args.chunk_size:
+                for concurrency in args.concurrency:
+                    latencies = []
+                    problems = []
+                    fetches = []
+                    with ThreadPoolExecutor(
+                            max_workers=concurrency) as executor:
+                        for _ in range(args.fetches):
+                            start = time.perf_counter()
+                            docs, chunk_latencies = chunked_mget(
+                                es, executor, 'rick&morty', ids, chunk_size,
+                                **params)
+                            fetches.append(time.perf_counter() - start)
+                            latencies += chunk_latencies
+                            problems += verify(docs, ids, args)
+                    result = summarize(
+                        latencies, sum(fetches), [],
+                        len(ids) / len(chunked(ids, chunk_size)),
+                        scenario='mget',
+                        concurrency=concurrency, doc_size=doc_size,
+                        chunk_size=chunk_size, ids=len(ids))
+                    result['fetch_ms'] = [
+                        round(fetch * 1000, 3) for fetch in fetches]
+                    result['problems'] = problems
+                    results.append(result)
+                    print_result(result, 'mget chunk=%d' % chunk_size)
+                    for problem in problems:
+                        print('    %s' % problem)
+    finally:
+        es.transport.drop_touched_indices()
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(result['problems'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
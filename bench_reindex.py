@@ -0,0 +1,203 @@
+"""
+Server-side reindex against a client-side scan and bulk pipeline.
+
+Seeds a source index with generated tweets (see fixtures.generate), then
+copies it to `new_twitter` with `es.reindex` for every combination of
+batch size, slices and throttling, and with `helpers.reindex` for every
+batch size. Every copy is checked by document count and by comparing the
+`_source` of a sample of copied documents, fetched with one mget, with the
+tweets generated for their ids, instead of reading both indices in full:
+
+    python bench_reindex.py --docs 1000000 --shards 4 --slices 1 auto 8 \
+        --batch-size 1000 5000 --output reindex.json
+
+The scenarios are `server` and `client`. Both copy over one client
+connection, so the benchmark takes no `--concurrency`. Server-side runs
+are timed by the running time of their task, followed through the Tasks
+API, and report the throughput of every slice. All indices are prefixed
+with `bench_` and dropped afterwards.
+"""
+import random
+import sys
+import time
+
+from elasticsearch.helpers import reindex, streaming_bulk
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    print_result,
+    write_report,
+)
+from fixtures import generate
+from suite_tasks import follow_task, slice_rates
+
+# es.reindex run on the node and helpers.reindex run by the client, the
+# scenarios of the benchmark.
+METHODS = ('server', 'client')
+
+
+def seed(es, args, doc_size):
+    '''Index `--docs` tweets into a new source index'''
+    es.indices.delete(index='twitter', ignore_unavailable=True)
+    es.indices.create(index='twitter', body={
+        'settings': {'number_of_shards': args.shards}})
+    for ok, item in streaming_bulk(es, (
+            {'_index': 'twitter', '_id': i, '_source': doc}
+            for i, doc in enumerate(generate('tweet', args.docs, doc_size))
+    ), chunk_size=1000):
+        if not ok:
+            raise RuntimeError('seeding failed: %r' % (item,))
+    es.indices.refresh(index='twitter')
+
+
+def recreate_destination(es, args):
+    es.indices.delete(index='new_twitter', ignore_unavailable=True)
+    es.indices.create(index='new_twitter', body={
+        'settings': {'number_of_shards': args.shards}})
+
+
+def server_reindex(es, args, batch_size, slices):
+    '''es.reindex run as a task, returning (seconds, per slice rates)'''
+    task = es.reindex(
+        body={
+            'source': {'index': 'twitter', 'size': batch_size},
+            'dest': {'index': 'new_twitter'}
+        },
+        slices=slices,
+        requests_per_second=args.requests_per_second,
+        wait_for_completion=False)['task']
+    finished = follow_task(es, task, args.poll_interval)
+    failures = finished.response['failures']
+    if failures:
+        raise RuntimeError('reindex failed: %r' % (failures[0],))
+    return finished.elapsed, slice_rates(finished)
+
+
+def client_reindex(es, args, batch_size):
+    '''helpers.reindex, scanning and bulk indexing `batch_size` docs at a
+    time, returning (seconds, None)'''
+    start = time.perf_counter()
+    _, failed = reindex(
+        es, 'twitter', 'new_twitter',
+        chunk_size=batch_size,
+        scan_kwargs={'size': batch_size})
+    if failed:
+        raise RuntimeError('helpers.reindex failed: %r' % (failed,))
+    return time.perf_counter() - start, None
+
+
+def verify(es, args, doc_size):
+    '''Compare document counts, and the `_source` of `--sample` random
+    copied documents with the tweets seeded under their ids, returning a
+    list of problems'''
+    es.indices.refresh(index='new_twitter')
+    problems = []
+    copied = es.count(index='new_twitter')['count']
+    if copied != args.docs:
+        problems.append('new_twitter has %d docs, expected %d' % (
+            copied, args.docs))
+    ids = random.Random(args.seed).sample(
+        range(args.docs), min(args.sample, args.docs))
+    copies = es.mget(index='new_twitter', body={'ids': ids})['docs']
+    for doc_id, copy in zip(ids, copies):
+        seeded = next(generate('tweet', 1, doc_size, start=doc_id))
+        if copy.get('_source') != seeded:
+            problems.append('_source of %s differs' % doc_id)
+    return problems
+
+
+def runs(args):
+    '''(method, batch size, slices) of every measurement'''
+    for batch_size in args.batch_size:
+        if 'server' in args.scenarios:
+            for slices in args.slices:
+                yield 'server', batch_size, slices
+        if 'client' in args.scenarios:
+            yield 'client', batch_size, None
+
+
+def print_slice_rates(result):
+    for rate in result.get('slice_rates') or []:
+        print('    slice %-3d %8d docs %10s docs/s %6d batches '
+              'throttled %dms' % (
+                  rate['slice_id'], rate['docs'], rate['docs_per_sec'],
+                  rate['batches'], rate['throttled_ms']))
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], METHODS, concurrency=None,
+        operations=None, warmup=None)
+    parser.add_argument(
+        '--docs', type=int, default=100000,
+        help='documents in the source index (default: 100000)')
+    parser.add_argument(
+        '--shards', type=int, default=1,
+        help='number_of_shards of both indices (default: 1)')
+    parser.add_argument(
+        '--batch-size', nargs='+', type=int, default=[1000],
+        help='source.size of es.reindex, scan size and chunk_size of '
+             'helpers.reindex (default: 1000)')
+    parser.add_argument(
+        '--slices', nargs='+', default=['1', 'auto'],
+        help='slices of es.reindex (default: 1 auto)')
+    parser.add_argument(
+        '--requests-per-second', type=float, default=-1,
+        help='throttling of es.reindex, -1 for none (default: -1)')
+    parser.add_argument(
+        '--sample', type=int, default=100,
+        help='documents whose _source is compared (default: 100)')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='seed picking the sampled documents (default: 0)')
+    parser.add_argument(
+        '--poll-interval', type=float, default=0.05,
+        help='seconds between Tasks API polls (default: 0.05)')
+    args = parser.parse_args(argv)
+
+    es = make_client(index_prefix='bench_', timeout=600)
+    results = []
+    try:
+        for doc_size in args.doc_size:
+            seed(es, args, doc_size)
+            for method, batch_size, slices in runs(args):
+                recreate_destination(es, args)
+                if method == 'server':
+                    elapsed, rates = server_reindex(
+                        es, args, batch_size, slices)
+                else:
+                    elapsed, rates = client_reindex(es, args, batch_size)
+                result = {
+                    'scenario': method,
+                    'concurrency': 1,
+                    'doc_size': doc_size,
+                    'docs': args.docs,
+                    'batch_size': batch_size,
+                    'slices': slices,
+                    'requests_per_second': args.requests_per_second
+                    if method == 'server' else None,
+                    'elapsed_s': round(elapsed, 6),
+                    'docs_per_sec': round(args.docs / elapsed, 2)
+                    if elapsed else None,
+                    'slice_rates': rates,
+                    'problems': verify(es, args, doc_size)
+                }
+                results.append(result)
+                print_result(
+                    result, '%s batch=%d slices=%s' % (
+                        method, batch_size, slices or '-'),
+                    '%.3fs %s' % (
+                        result['elapsed_s'],
+                        result['problems'][0] if result['problems']
+                        else 'ok'))
+                print_slice_rates(result)
+    finally:
+        es.transport.drop_touched_indices()
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(result['problems'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Scripted updates with inline and stored scripts.
+
+Seeds the `test` index with counters of every `--doc-size`, then measures
+`es.update` and `es.update_by_query` incrementing them with three kinds of
+scripts, the scenarios of the benchmark:
+
+    inline_literal  the increment written into the source, a new script
+                    every call, compiled every call
+    inline_params   one source taking the increment from `params`
+    stored          the same source stored once with `PUT _scripts`,
+                    called by id
+
+and reports updates/sec and latency of the calls that succeeded, the
+compilations the node made (`_nodes/stats/script`) and how many calls,
+and which share of them, the node rejected because scripts were compiled
+faster than `script.max_compilations_rate` allows
+(`circuit_breaking_exception`):
+
+    python bench_scripts.py --operations 2000 --concurrency 1 8 \
+        --max-compilations-rate 75/5m --output scripts.json
+
+`--max-compilations-rate` is set as a transient cluster setting for the
+run and reset afterwards; without it the cluster's own limit applies.
+Rejections by the limit are what the literal scripts are there to
+provoke, so they are counted apart and only other errors fail the run.
+All indices are prefixed with `bench_` and dropped afterwards.
+"""
+import itertools
+import sys
+
+from elasticsearch.helpers import bulk
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    measure,
+    print_result,
+    summarize,
+    write_report,
+)
+from fixtures import sized
+
+KINDS = ('inline_literal', 'inline_params', 'stored')
+APIS = ('update', 'update_by_query')
+SOURCE = 'ctx._source.counter += params.value'
+STORED_ID = 'bench_increment'
+# Increments of literal scripts, never repeated so none is found compiled.
+LITERALS = itertools.count(1)
+
+
+def script_of(kind, i):
+    '''The script of the i-th call'''
+    if kind == 'inline_literal':
+        return {'source': 'ctx._source.counter += %d' % next(LITERALS)}
+    if kind == 'inline_params':
+        return {'source': SOURCE, 'params': {'value': i + 1}}
+    return {'id': STORED_ID, 'params': {'value': i + 1}}
+
+
+def seed(es, args, doc_size):
+    '''Index `--docs` counters, padded to `doc_size` bytes'''
+    es.indices.delete(index='test', ignore_unavailable=True)
+    counter = sized({'counter': 0}, doc_size)
+    bulk(es, (
+        {'_index': 'test', '_id': i, '_source': counter}
+        for i in range(args.docs)
+    ))
+    es.indices.refresh(index='test')
+
+
+def workload(es, args, kind, api):
+    '''The operation of the i-th call and the documents it updates'''
+    def update(i):
+        es.update(index='test', id=i % args.docs,
+                  body={'script': script_of(kind, i)},
+                  retry_on_conflict=args.retry_on_conflict)
+
+    def update_by_query(i):
+        ids = [str((i * args.batch_size + j) % args.docs)
+               for j in range(args.batch_size)]
+        response = es.update_by_query(
+            index='test', conflicts='proceed', body={
+                'query': {'ids': {'values': ids}},
+                'script': script_of(kind, i)
+            })
+        if response['failures']:
+            raise AssertionError(response['failures'][0])
+    if api == 'update':
+        return update, 1
+    return update_by_query, args.batch_size
+
+
+def script_stats(es):
+    '''Script stats summed over all nodes'''
+    totals = {'compilations': 0, 'compilation_limit_triggered': 0}
+    for node in es.nodes.stats(metric='script')['nodes'].values():
+        for key in totals:
+            totals[key] += node['script'].get(key, 0)
+    return totals
+
+
+def is_compilation_limit(error):
+    '''Whether an error is a rejection by script.max_compilations_rate'''
+    return ('circuit_breaking_exception' in error
+            or 'Too many dynamic script compilations' in error)
+
+
+def run(es, args, kind, api, concurrency, doc_size):
+    '''Measure the calls of a kind of script on an API, returning the
+    result'''
+    operation, docs = workload(es, args, kind, api)
+    # Warming up would only spend compilations of the limit.
+    warmup = 0 if kind == 'inline_literal' else args.warmup
+    before = script_stats(es)
+    latencies, elapsed, errors = measure(
+        operation, args.operations, concurrency, warmup)
+    after = script_stats(es)
+    result = summarize(
+        latencies, elapsed, errors, docs, scenario=kind, api=api,
+        concurrency=concurrency, doc_size=doc_size, batch_size=docs)
+    result['compilations'] = after['compilations'] - before['compilations']
+    result['compilation_limit_triggered'] = \
+        after['compilation_limit_triggered'] \
+        - before['compilation_limit_triggered']
+    result['compilation_limit_errors'] = sum(
+        1 for error in errors if is_compilation_limit(error))
+    result['unexpected_errors'] = \
+        result['errors'] - result['compilation_limit_errors']
+    result['rejected_pct'] = round(
+        100.0 * result['compilation_limit_errors'] / result['operations'], 1)
+    return result
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], KINDS, concurrency=(1,),
+        operations=1000, warmup=5)
+    parser.add_argument(
+        '--apis', nargs='+', choices=APIS, default=list(APIS),
+        help='APIs to measure (default: both)')
+    parser.add_argument(
+        '--docs', type=int, default=1000,
+        help='seeded documents (default: 1000)')
+    parser.add_argument(
+        '--batch-size', type=int, default=10,
+        help='documents per update_by_query call (default: 10)')
+    parser.add_argument(
+        '--retry-on-conflict', type=int, default=5,
+        help='retry_on_conflict of updates (default: 5)')
+    parser.add_argument(
+        '--max-compilations-rate', metavar='RATE',
+        help='script.max_compilations_rate for the run, like 75/5m or '
+             'unlimited (default: leave the cluster setting alone)')
+    args = parser.parse_args(argv)
+
+    es = make_client(max(args.concurrency), index_prefix='bench_')
+    results = []
+    try:
+        if args.max_compilations_rate:
+            es.cluster.put_settings(body={'transient': {
+                'script.max_compilations_rate': args.max_compilations_rate}})
+        if 'stored' in args.scenarios:
+            es.put_script(id=STORED_ID, body={
+                'script': {'lang': 'painless', 'source': SOURCE}})
+        # Literal scripts go last, so the compilations they spend don't
+        # starve the others of the one compilation they need.
+        kinds = sorted(
+            args.scenarios, key=lambda kind: kind == 'inline_literal')
+        for kind in kinds:
+            for doc_size in args.doc_size:
+                seed(es, args, doc_size)
+                for api in args.apis:
+                    for concurrency in args.concurrency:
+                        result = run(
+                            es, args, kind, api, concurrency, doc_size)
+                        results.append(result)
+                        print_result(
+                            result, '%s %s' % (kind, api),
+                            'compilations=%d rejected=%d/%d (%.1f%%) '
+                            'limit_triggered=%d unexpected_errors=%d' % (
+                                result['compilations'],
+                                result['compilation_limit_errors'],
+                                result['operations'], result['rejected_pct'],
+                                result['compilation_limit_triggered'],
+                                result['unexpected_errors']))
+    finally:
+        if 'stored' in args.scenarios:
+            es.delete_script(id=STORED_ID, ignore=404)
+        if args.max_compilations_rate:
+            es.cluster.put_settings(body={'transient': {
+                'script.max_compilations_rate': None}})
+        es.transport.drop_touched_indices()
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(
+        result['unexpected_errors'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
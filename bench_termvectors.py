@@ -0,0 +1,203 @@
+"""
+Term vectors of large text documents, one at a time and in batches.
+
+Seeds the `client` index with documents whose `text` field holds the given
+number of bytes of words drawn from a Zipf-like vocabulary, then measures
+`es.termvectors` against `es.mtermvectors` at every batch size, for every
+set of options (term statistics, positions, offsets, realtime), and
+reports latency, docs/sec and the response bytes per document:
+
+    python bench_termvectors.py --doc-size 2000 20000 \
+        --batch-size 1 10 50 200 --output termvectors.json
+
+The scenarios are the two APIs; the options of bench_common.py
+(`--scenarios`, `--concurrency`, `--doc-size`, `--warmup`, `--output`)
+apply as in the other benchmarks. When docs/sec no longer grows with the
+batch size, batching stopped paying off. All indices are prefixed with
+`bench_` and dropped afterwards.
+"""
+import random
+import sys
+
+from elasticsearch.helpers import bulk
+
+from bench_common import (
+    argument_parser,
+    make_client,
+    measure,
+    print_result,
+    summarize,
+    write_report,
+)
+from fixtures import CLIENTS
+from suite_timing import REQUEST_LOG
+
+APIS = ('termvectors', 'mtermvectors')
+# Options of every profile, on top of `fields: ["text"]`.
+PROFILES = {
+    'minimal': {'term_statistics': False, 'field_statistics': False,
+                'positions': False, 'offsets': False},
+    'term_statistics': {'term_statistics': True, 'field_statistics': True,
+                        'positions': False, 'offsets': False},
+    'positions': {'term_statistics': False, 'field_statistics': False,
+                  'positions': True, 'offsets': False},
+    'offsets': {'term_statistics': False, 'field_statistics': False,
+                'positions': False, 'offsets': True},
+    'full': {'term_statistics': True, 'field_statistics': True,
+             'positions': True, 'offsets': True},
+    'not_realtime': {'term_statistics': False, 'field_statistics': False,
+                     'positions': False, 'offsets': False,
+                     'realtime': False},
+}
+
+
+def vocabulary(size, rng):
+    '''`size` made up words, the first ones the most frequent'''
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [
+        ''.join(rng.choice(letters) for _ in range(rng.randint(3, 10)))
+        for _ in range(size)
+    ]
+
+
+def text_of(size, words, weights, rng):
+    '''About `size` bytes of words drawn with the given weights'''
+    text = []
+    length = 0
+    while length < size:
+        word = rng.choices(words, weights)[0]
+        text.append(word)
+        length += len(word) + 1
+    return ' '.join(text)
+
+
+def seed(es, args, doc_size):
+    '''Index `--docs` clients with `doc_size` bytes of text each'''
+    rng = random.Random(args.seed)
+    words = vocabulary(args.vocabulary, rng)
+    weights = [1.0 / rank for rank in range(1, len(words) + 1)]
+    es.indices.delete(index='client', ignore_unavailable=True)
+    bulk(es, (
+        {
+            '_index': 'client',
+            '_id': i,
+            '_source': dict(
+                CLIENTS[i % len(CLIENTS)],
+                text=text_of(doc_size, words, weights, rng))
+        }
+        for i in range(args.docs)
+    ), chunk_size=max(1, 5000000 // max(doc_size, 1)))
+    es.indices.refresh(index='client')
+
+
+def runs(args):
+    '''(api, batch size) of every measurement'''
+    if 'termvectors' in args.scenarios:
+        yield 'termvectors', 1
+    if 'mtermvectors' in args.scenarios:
+        for batch_size in args.batch_size:
+            yield 'mtermvectors', batch_size
+
+
+def workload(es, args, api, batch_size, options):
+    '''The operation fetching the term vectors of batch `i`'''
+    def ids(i):
+        return [str((i * batch_size + j) % args.docs)
+                for j in range(batch_size)]
+
+    def termvectors(i):
+        response = es.termvectors(
+            index='client', id=ids(i)[0], fields='text', **options)
+        if 'text' not in response.get('term_vectors', {}):
+            raise AssertionError('no term vectors for %s' % response['_id'])
+
+    def mtermvectors(i):
+        docs = es.mtermvectors(
+            index='client', body={'ids': ids(i)}, fields='text',
+            **options)['docs']
+        missing = [doc['_id'] for doc in docs
+                   if 'text' not in doc.get('term_vectors', {})]
+        if len(docs) != batch_size or missing:
+            raise AssertionError('%d docs, no term vectors for %s' % (
+                len(docs), missing))
+    return termvectors if api == 'termvectors' else mtermvectors
+
+
+def main(argv=None):
+    parser = argument_parser(
+        __doc__.split('\n\n')[0], APIS, concurrency=(1,),
+        doc_size=(2000, 20000), operations=None, warmup=5)
+    parser.add_argument(
+        '--docs', type=int, default=1000,
+        help='seeded documents (default: 1000)')
+    parser.add_argument(
+        '--vocabulary', type=int, default=5000,
+        help='distinct words of the corpus (default: 5000)')
+    parser.add_argument(
+        '--batch-size', nargs='+', type=int, default=[1, 10, 50, 200],
+        help='documents per mtermvectors request (default: 1 10 50 200)')
+    parser.add_argument(
+        '--profiles', nargs='+', choices=list(PROFILES),
+        default=list(PROFILES), metavar='PROFILE',
+        help='option sets to measure: %s (default: all)' % ', '.join(PROFILES))
+    parser.add_argument(
+        '--documents', type=int, default=1000,
+        help='documents fetched per measurement (default: 1000)')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='seed of the generated corpus (default: 0)')
+    args = parser.parse_args(argv)
+
+    # Response sizes are taken from the timed requests.
+    REQUEST_LOG.enabled = True
+    es = make_client(
+        max(args.concurrency), index_prefix='bench_', timeout=300)
+    results = []
+    try:
+        for doc_size in args.doc_size:
+            seed(es, args, doc_size)
+            for profile in args.profiles:
+                options = PROFILES[profile]
+                for api, batch_size in runs(args):
+                    for concurrency in args.concurrency:
+                        operation = workload(
+                            es, args, api, batch_size, options)
+                        requests = max(1, args.documents // batch_size)
+                        del REQUEST_LOG.records[:]
+                        latencies, elapsed, errors = measure(
+                            operation, requests, concurrency,
+                            args.warmup)
+                        measured = REQUEST_LOG.records[args.warmup:]
+                        response_bytes = sum(
+                            record['bytes_in'] for record in measured)
+                        result = summarize(
+                            latencies, elapsed, errors, batch_size,
+                            scenario=api, profile=profile, options=options,
+                            doc_size=doc_size, batch_size=batch_size,
+                            concurrency=concurrency)
+                        docs = len(latencies) * batch_size
+                        result['ms_per_doc'] = round(
+                            result['latency_ms']['mean'] / batch_size, 4) \
+                            if latencies else None
+                        result['response_bytes_per_request'] = \
+                            response_bytes // len(measured) \
+                            if measured else None
+                        result['response_bytes_per_doc'] = \
+                            response_bytes // docs if docs else None
+                        results.append(result)
+                        print_result(
+                            result, '%s %s batch=%d' % (
+                                api, profile, batch_size),
+                            '%.3fms/doc %d bytes/doc' % (
+                                result['ms_per_doc'] or 0,
+                                result['response_bytes_per_doc'] or 0))
+    finally:
+        REQUEST_LOG.enabled = False
+        es.transport.drop_touched_indices()
+    if args.output:
+        write_report(es, results, args, args.output)
+    return 1 if any(result['errors'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
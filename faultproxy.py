@@ -0,0 +1,351 @@
+"""
+HTTP proxy injecting faults between the client and a node.
+
+Relays every request to the target node (a cluster or the stand-in) and
+can, on the way:
+
+    delay        hold the request for a while before relaying it
+    reject       answer `429 es_rejected_execution_exception` instead of
+                 relaying it, as a node with a full write queue does
+    reject_items relay a bulk request without some of its actions, which
+                 are answered as rejected with a 429 item each
+    drop         close the connection without relaying the request
+    drop_after   relay the request, then close the connection without
+                 passing the response on
+
+Faults are either queued for the next requests, optionally only those
+whose `METHOD /path` matches a regular expression, which makes tests
+deterministic:
+
+    with FaultProxy(es_hosts()[0]) as proxy:
+        proxy.inject('drop', times=2)
+        proxy.inject('reject_items', match='_bulk', every=3)
+        es = Elasticsearch([{'host': proxy.host, 'port': proxy.port}])
+
+or drawn at random for every request, from a seeded generator, to run
+anything through a flaky node:
+
+    python faultproxy.py --target localhost:9200 --port 9201 \
+        --latency 0.02 --reject-rate 0.01 --drop-rate 0.01
+
+What the proxy did is counted in `stats`.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from suite_ndjson import ndjson_actions
+
+FAULTS = ('delay', 'reject', 'reject_items', 'drop', 'drop_after')
+REJECTED = {
+    'type': 'es_rejected_execution_exception',
+    'reason': 'rejected execution of coordinating operation [shard_detail='
+              '[faultproxy]], queue capacity exceeded'
+}
+
+
+class Fault(object):
+    """
+    A fault queued for the next `times` requests matching `match`.
+    """
+
+    def __init__(self, kind, times=1, match=None, seconds=0.0, every=1):
+        if kind not in FAULTS:
+            raise ValueError('Unknown fault %r, expected one of %s' % (
+                kind, ', '.join(FAULTS)))
+        self.kind = kind
+        self.times = times
+        self.match = re.compile(match) if match else None
+        self.seconds = seconds
+        self.every = every
+
+    def matches(self, method, path):
+        return self.match is None or bool(
+            self.match.search('%s %s' % (method, path)))
+
+
+def rejected_items(body, every, rejected=None):
+    '''Split a bulk body into the body of the actions to relay and the
+    positions and metadata of the rejected ones: every `every`-th action,
+    or those `rejected(position)` is true for'''
+    kept = []
+    dropped = []
+    for position, (_, start, end) in enumerate(ndjson_actions(body)):
+        if rejected(position) if rejected else position % every == 0:
+            (op_type, meta), = json.loads(body[start:body.index(
+                b'\n', start)]).items()
+            dropped.append((position, op_type, meta))
+        else:
+            kept.append(body[start:end])
+    return b''.join(kept), dropped
+
+
+def merge_items(response, dropped):
+    '''Put the rejected actions back into the response of a bulk request'''
+    items = response.get('items', [])
+    for position, op_type, meta in dropped:
+        items.insert(position, {op_type: {
+            '_index': meta.get('_index'),
+            '_type': '_doc',
+            '_id': meta.get('_id'),
+            'status': 429,
+            'error': dict(REJECTED)
+        }})
+    return dict(response, errors=True, items=items)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    """
+    Relays requests to the target of the server's FaultProxy.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    upstream = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def relay(self, body):
+        '''Send the request to the target, returning (status, headers,
+        data) of its response'''
+        proxy = self.server.proxy
+        if self.upstream is None:
+            self.upstream = http.client.HTTPConnection(
+                proxy.target_host, proxy.target_port, timeout=proxy.timeout)
+        headers = {
+            key: value for key, value in self.headers.items()
+            if key.lower() not in (
+                'host', 'connection', 'content-length', 'content-encoding')
+        }
+        try:
+            self.upstream.request(self.command, self.path, body or None,
+                                  headers)
+            response = self.upstream.getresponse()
+            return response.status, response.getheaders(), response.read()
+        except (OSError, http.client.HTTPException):
+            self.upstream.close()
+            self.upstream = None
+            raise
+
+    def respond(self, status, headers, data):
+        self.send_response(status)
+        for key, value in headers:
+            if key.lower() not in ('content-length', 'connection',
+                                   'transfer-encoding'):
+                self.send_header(key, value)
+        self.send_header('content-length', str(len(data)))
+        if self.close_connection:
+            self.send_header('connection', 'close')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def respond_json(self, status, payload):
+        self.respond(status, [('content-type', 'application/json')],
+                     json.dumps(payload).encode('utf-8'))
+
+    def dispatch(self):
+        proxy = self.server.proxy
+        body = self.read_body()
+        fault = proxy.take(self.command, self.path)
+        proxy.count('requests')
+        kind = fault.kind if fault else None
+        if kind == 'delay':
+            proxy.count('delayed')
+            time.sleep(fault.seconds)
+        elif proxy.latency:
+            time.sleep(proxy.latency)
+        if kind == 'drop':
+            proxy.count('dropped')
+            self.close_connection = True
+            return
+        if kind == 'reject':
+            proxy.count('rejected')
+            self.respond_json(429, {'error': dict(
+                REJECTED, root_cause=[REJECTED]), 'status': 429})
+            return
+        dropped = []
+        if kind == 'reject_items' or (
+                proxy.item_reject_rate and '_bulk' in self.path):
+            # Other faults still apply to the rest of the bulk, whose
+            # items are rejected at the proxy's rate.
+            if kind == 'reject_items':
+                body, dropped = rejected_items(body, fault.every)
+            else:
+                body, dropped = rejected_items(
+                    body, 1, proxy.reject_item)
+            proxy.count('rejected_items', len(dropped))
+            if not body:
+                self.respond_json(200, merge_items(
+                    {'took': 0, 'items': []}, dropped))
+                return
+        try:
+            status, headers, data = self.relay(body)
+        except (OSError, http.client.HTTPException):
+            proxy.count('failed')
+            self.close_connection = True
+            return
+        proxy.count('relayed')
+        if kind == 'drop_after':
+            proxy.count('dropped_after')
+            self.close_connection = True
+            return
+        if dropped and status == 200:
+            data = json.dumps(merge_items(
+                json.loads(data), dropped)).encode('utf-8')
+        try:
+            self.respond(status, headers, data)
+        except OSError:  # the client gave up waiting
+            self.close_connection = True
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = dispatch
+
+    def finish(self):
+        if self.upstream is not None:
+            self.upstream.close()
+        super().finish()
+
+
+class FaultProxy(object):
+    """
+    Proxy to a target node, serving from a background thread. Port 0
+    picks a free port.
+    """
+
+    def __init__(self, target, host='127.0.0.1', port=0, latency=0.0,
+                 reject_rate=0.0, item_reject_rate=0.0, drop_rate=0.0,
+                 drop_after_rate=0.0, seed=0, timeout=60):
+        self.target_host = target['host']
+        self.target_port = target['port']
+        self.latency = latency
+        self.rates = [
+            ('reject', reject_rate),
+            ('drop', drop_rate),
+            ('drop_after', drop_after_rate),
+        ]
+        self.item_reject_rate = item_reject_rate
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.faults = []
+        self.stats = Counter()
+        self.httpd = ThreadingHTTPServer((host, port), ProxyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.proxy = self
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def inject(self, kind, times=1, match=None, seconds=0.0, every=1):
+        '''Queue a fault for the next `times` requests matching `match`'''
+        with self.lock:
+            self.faults.append(Fault(kind, times, match, seconds, every))
+
+    def reset(self):
+        '''Drop queued faults and zero the counters'''
+        with self.lock:
+            self.faults = []
+            self.stats.clear()
+
+    def take(self, method, path):
+        '''The fault to inject into a request, if any'''
+        with self.lock:
+            for fault in self.faults:
+                if fault.matches(method, path):
+                    fault.times -= 1
+                    if not fault.times:
+                        self.faults.remove(fault)
+                    return fault
+            for kind, rate in self.rates:
+                if rate and self.random.random() < rate:
+                    return Fault(kind)
+        return None
+
+    def reject_item(self, position):
+        with self.lock:
+            return self.random.random() < self.item_reject_rate
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name='faultproxy', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--target', default='localhost:9200',
+        help='node to relay to, host:port (default: localhost:9200)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='seconds added to every request (default: 0)')
+    parser.add_argument(
+        '--reject-rate', type=float, default=0.0,
+        help='share of requests answered with 429 (default: 0)')
+    parser.add_argument(
+        '--item-reject-rate', type=float, default=0.0,
+        help='share of bulk actions answered with 429 (default: 0)')
+    parser.add_argument(
+        '--drop-rate', type=float, default=0.0,
+        help='share of connections closed before relaying (default: 0)')
+    parser.add_argument(
+        '--drop-after-rate', type=float, default=0.0,
+        help='share of connections closed after relaying (default: 0)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    host, _, port = args.target.rpartition(':')
+    proxy = FaultProxy(
+        {'host': host, 'port': int(port)}, args.host, args.port,
+        latency=args.latency, reject_rate=args.reject_rate,
+        item_reject_rate=args.item_reject_rate, drop_rate=args.drop_rate,
+        drop_after_rate=args.drop_after_rate, seed=args.seed)
+    print('Fault proxy listening on http://%s:%d, relaying to %s' % (
+        proxy.host, proxy.port, args.target))
+    try:
+        proxy.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.httpd.server_close()
+        print(dict(proxy.stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Documents the suite is built around.
+
+The functional tests spell these bodies out inline; the benchmark and
+scaled modes take them from here so their numbers tie back to the
+functional coverage.
+
+For volume, `generate` makes any number of synthetic documents of the same
+shapes (tweets, characters, clients), lazily and deterministically: a
+document depends only on the seed, its shape, its position and the size
+asked for, so every run on every machine indexes the same data, and a
+range of positions can be generated on its own. Sizes are fixed or drawn
+from a distribution around the given size:
+
+    for doc in generate('tweet', 1000000, size=2000, distribution='lognormal'):
+        ...
+
+`ndjson_fixture` writes the same documents once as bulk NDJSON to a cache
+directory (ES_FIXTURE_CACHE, by default `es-fixtures` in the temporary
+directory) and returns the path, for suite_ndjson.py to send without
+generating or encoding them again on later runs.
+
+PIPELINES holds the processors of the ingest pipelines the ingest tests
+and benchmark index tweets through.
+"""
+import json
+import math
+import os
+import random
+import tempfile
+
+TWEETS = (
+    {"user": "kimchy", "twits": "1"},
+    {"user": "japchae", "twits": "1"},
+)
+CHARACTERS = (
+    {'name': 'Rick'},
+    {'name': 'Morty'},
+)
+CLIENTS = (
+    {"fullname": "John Doe", "text": "client test test test "},
+    {"fullname": "Jane Doe", "text": "Another bank test ..."},
+)
+FILLER_WORDS = ('client', 'test', 'another', 'bank', 'rick', 'morty')
+# Processors of ingest pipelines over tweets with a `post_date`: one of
+# each kind, and all of them in a single pipeline.
+PIPELINES = {
+    'set': [{'set': {'field': 'source', 'value': 'twitter:{{user}}'}}],
+    'script': [{'script': {'source': "ctx.handle = '@' + ctx.user"}}],
+    'date': [{'date': {'field': 'post_date',
+                       'formats': ['yyyy-MM-dd HH:mm:ss', 'ISO8601']}}],
+    'rename': [{'rename': {'field': 'user', 'target_field': 'author'}}],
+}
+PIPELINES['all'] = [
+    processor for kind in ('set', 'script', 'date', 'rename')
+    for processor in PIPELINES[kind]
+]
+
+
+def sized(doc, size):
+    '''Copy of a document padded with filler words in a `filler` field
+    until its JSON is at least `size` bytes long'''
+    doc = dict(doc)
+    missing = size - len(json.dumps(doc))
+    if missing > len(', "filler": ""'):
+        words = []
+        length = len(', "filler": ""')
+        while length < missing:
+            word = FILLER_WORDS[len(words) % len(FILLER_WORDS)]
+            words.append(word)
+            length += len(word) + 1
+        doc['filler'] = ' '.join(words)
+    return doc
+
+
+# Bump when generated documents change, so stale cache files are not used.
+GENERATOR_VERSION = 1
+USERS = ('kimchy', 'japchae', 'elastic', 'bonsai', 'mochi', 'tteok')
+NAMES = ('Rick', 'Morty', 'Summer', 'Beth', 'Jerry', 'Birdperson')
+FIRST_NAMES = ('John', 'Jane', 'Alex', 'Sam', 'Kim', 'Robin')
+LAST_NAMES = ('Doe', 'Roe', 'Smith', 'Park', 'Sanchez', 'Lee')
+
+
+def tweet(rng):
+    return {"user": rng.choice(USERS), "twits": str(rng.randint(1, 1000))}
+
+
+def character(rng):
+    return {'name': rng.choice(NAMES)}
+
+
+def client(rng):
+    return {
+        "fullname": '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+        "text": ' '.join(
+            rng.choice(FILLER_WORDS) for _ in range(rng.randint(2, 8)))
+    }
+
+
+SHAPES = {
+    'tweet': tweet,
+    'character': character,
+    'client': client,
+}
+# Bytes of JSON of a document, given the size asked for: exactly that,
+# uniform between half and one and a half times it, or log-normal with it
+# as the mean (mostly small documents and a long tail of large ones).
+DISTRIBUTIONS = {
+    'fixed': lambda rng, size: size,
+    'uniform': lambda rng, size: rng.randint(size // 2, size * 3 // 2),
+    'lognormal': lambda rng, size: int(
+        rng.lognormvariate(math.log(max(size, 1)) - 0.5, 1.0)),
+}
+
+
+def generate(shape, count, size=None, distribution='fixed', seed=0, start=0):
+    '''Yield the documents of a shape at positions `start` to
+    `start + count`, padded to `size` bytes as drawn from `distribution`
+    unless `size` is None'''
+    make = SHAPES[shape]
+    draw = DISTRIBUTIONS[distribution]
+    for i in range(start, start + count):
+        rng = random.Random('%s:%s:%d' % (seed, shape, i))
+        doc = make(rng)
+        if size is not None:
+            doc = sized(doc, draw(rng, size))
+        yield doc
+
+
+def fixture_cache():
+    return os.environ.get(
+        'ES_FIXTURE_CACHE', os.path.join(tempfile.gettempdir(), 'es-fixtures'))
+
+
+def ndjson_fixture(shape, count, size=None, distribution='fixed', seed=0):
+    '''Path of a cached NDJSON file of `generate` documents with bulk
+    index actions, ids being their positions, writing it if missing'''
+    directory = fixture_cache()
+    path = os.path.join(directory, '%s-%d-%s-%s-%d-v%d.ndjson' % (
+        shape, count, size, distribution, seed, GENERATOR_VERSION))
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    # Written aside and renamed, so a concurrent run never reads half a file.
+    fd, partial = tempfile.mkstemp(dir=directory, suffix='.partial')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            docs = generate(shape, count, size, distribution, seed)
+            for i, doc in enumerate(docs):
+                f.write(b'{"index":{"_id":"%d"}}\n' % i)
+                f.write(json.dumps(doc).encode('utf-8') + b'\n')
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return path
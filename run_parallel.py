@@ -0,0 +1,104 @@
+"""
+Run the test suite on several worker processes at once.
+
+Test methods are sharded round-robin across a process pool. Every worker
+gets its own index prefix (ES_INDEX_PREFIX), which SuiteTransport applies
+to all index names, so workers never touch each other's indices.
+
+    python run_parallel.py -j 4
+    python run_parallel.py -j 2 tests_es_py.ElDocumentAPITest.test_mget
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+
+from suite_cache import CACHE_STATS
+from suite_connection import POOL_STATS
+from suite_memory import MEMORY_LOG
+from suite_timing import REQUEST_LOG
+
+
+def iter_test_ids(suite):
+    '''Flatten a test suite into test ids'''
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_test_ids(test)
+        else:
+            yield test.id()
+
+
+def run_shard(shard):
+    '''Run a list of test ids with a worker-specific index prefix'''
+    worker, test_ids = shard
+    os.environ['ES_INDEX_PREFIX'] = 'w%d_' % worker
+    suite = unittest.defaultTestLoader.loadTestsFromNames(test_ids)
+    stream = io.StringIO()
+    result = unittest.TextTestRunner(stream=stream, verbosity=0).run(suite)
+    return {
+        'worker': worker,
+        'run': result.testsRun,
+        'failures': [(test.id(), tb) for test, tb in result.failures],
+        'errors': [(test.id(), tb) for test, tb in result.errors],
+        'skipped': len(result.skipped),
+        'pool_stats': POOL_STATS.snapshot(),
+        'cache_stats': CACHE_STATS.snapshot(),
+        'requests': REQUEST_LOG.records,
+        'memory': MEMORY_LOG.snapshot(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        'names', nargs='*', default=['tests_es_py'],
+        help='test modules, classes or methods (default: tests_es_py)')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count(),
+        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    test_ids = list(iter_test_ids(
+        unittest.defaultTestLoader.loadTestsFromNames(args.names)))
+    jobs = max(1, min(args.jobs, len(test_ids)))
+    shards = [(worker, test_ids[worker::jobs]) for worker in range(jobs)]
+
+    start = time.perf_counter()
+    # One shard per process: the counters and logs a worker returns are
+    # those of its whole process, so a process running a second shard
+    # would report the first one again.
+    with multiprocessing.Pool(jobs, maxtasksperchild=1) as pool:
+        results = pool.map(run_shard, shards, chunksize=1)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        # Reported at exit by suite_config, as configured.
+        POOL_STATS.add(result['pool_stats'])
+        CACHE_STATS.add(result['cache_stats'])
+        REQUEST_LOG.extend(result['requests'])
+        MEMORY_LOG.add(result['memory'])
+
+    failures = [f for r in results for f in r['failures']]
+    errors = [e for r in results for e in r['errors']]
+    for kind, problems in (('ERROR', errors), ('FAIL', failures)):
+        for test_id, traceback in problems:
+            print('=' * 70)
+            print('%s: %s' % (kind, test_id))
+            print('-' * 70)
+            print(traceback)
+
+    print('-' * 70)
+    print('Ran %d tests in %.3fs on %d workers' % (
+        sum(r['run'] for r in results), elapsed, jobs))
+    print()
+    if failures or errors:
+        print('FAILED (failures=%d, errors=%d)' % (len(failures), len(errors)))
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
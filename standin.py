@@ -0,0 +1,2745 @@
+"""
+Local stand-in for an Elasticsearch 7.7 node.
+
+Implements the Document API surface the suite exercises (index, create,
+get, exists, get_source, delete, update, delete_by_query, update_by_query,
+mget, bulk, reindex, termvectors, mtermvectors) plus the index, refresh,
+stats, count, search, scroll and tasks endpoints they rely on, with 7.7
+compatible response shapes and `_version`/`_seq_no`/`_primary_term`
+semantics. Every index is a single shard with primary term 1.
+
+`number_of_shards` only determines the number of slices of `slices=auto`.
+The by-query APIs and reindex run as tasks of the tasks API, in batches of
+`scroll_size` (reindex: `source.size`) documents, on parallel slices and
+throttled to `requests_per_second` like on a real node;
+`wait_for_completion=false` returns the task id to poll
+`GET _tasks/<task_id>` with.
+
+Search is near real-time like on a real node: writes become visible to
+searches (and to the by-query APIs and reindex) on refresh, which happens
+on `refresh=true|wait_for`, `_refresh`, or lazily once `refresh_interval`
+(1s by default) has elapsed. Realtime reads (get, mget, termvectors) always
+see the latest write. Searches page with `from`, `search_after` or
+`scroll`, and scrolls can be split into slices with `slice`.
+
+Scripts are a small subset of Painless: statements assigning to, or
+incrementing, `ctx._source` fields from literals, `params` and other
+`ctx._source` fields, `ctx._source.remove('field')` and `ctx.op = '...'`.
+They can be stored with `PUT _scripts/<id>`. Compiled scripts are cached by
+source, and compilations are limited by `script.max_compilations_rate`
+(75/5m unless changed with `PUT _cluster/settings`) like on a node, with
+the counters reported by `GET _nodes/stats/script`.
+
+Ingest pipelines (`PUT _ingest/pipeline/<id>`) of set, rename, script and
+date processors, with `ignore_failure` and `on_failure` handling, run on
+documents indexed with a `pipeline` (index, create and bulk) and on those
+of `_simulate`; their counters are reported by `GET _nodes/stats/ingest`.
+Their scripts address source fields as `ctx.<field>`.
+
+The stand-in starts in milliseconds, either in-process:
+
+    with StandinServer() as server:
+        es = Elasticsearch([{'host': server.host, 'port': server.port}])
+
+or as a separate process:
+
+    python standin.py --port 9200
+"""
+import argparse
+import base64
+import copy
+import datetime
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+import zoneinfo
+from collections import OrderedDict
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+VERSION = {
+    'number': '7.7.0',
+    'build_flavor': 'default',
+    'build_type': 'tar',
+    'build_hash': 'standin',
+    'build_date': '2020-05-12T02:01:37.602180Z',
+    'build_snapshot': False,
+    'lucene_version': '8.5.1',
+    'minimum_wire_compatibility_version': '6.8.0',
+    'minimum_index_compatibility_version': '6.0.0-beta1'
+}
+PRIMARY_TERM = 1
+NODE_ID = 'standin'
+NODE = {
+    'name': 'standin',
+    'transport_address': '127.0.0.1:9300',
+    'host': '127.0.0.1',
+    'ip': '127.0.0.1:9300',
+    'roles': ['data', 'ingest', 'master'],
+}
+# One primary and one (unassigned) replica, as on a single node cluster.
+WRITE_SHARDS = {'total': 2, 'successful': 1, 'failed': 0}
+NOOP_SHARDS = {'total': 0, 'successful': 0, 'failed': 0}
+SEARCH_SHARDS = {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}
+INVALID_INDEX_CHARS = set('\\/*?"<>| ,#:')
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+class ApiError(Exception):
+    """
+    Error answered with the Elasticsearch error body format.
+    """
+
+    def __init__(self, status, type, reason, **extra):
+        super().__init__(reason)
+        self.status = status
+        self.type = type
+        self.reason = reason
+        self.extra = extra
+
+    def body(self):
+        cause = dict({'type': self.type, 'reason': self.reason}, **self.extra)
+        return {'error': dict(cause, root_cause=[cause]), 'status': self.status}
+
+
+def index_not_found(name):
+    return ApiError(
+        404, 'index_not_found_exception', 'no such index [%s]' % name,
+        **{'resource.type': 'index_or_alias', 'resource.id': name,
+           'index_uuid': '_na_', 'index': name})
+
+
+def as_bool(value, default=False):
+    '''Interpret a query string or body flag'''
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('', 'true', '1')
+
+
+def as_list(value):
+    '''Interpret a comma separated query string value or a JSON list'''
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v for v in value.split(',') if v]
+    return list(value)
+
+
+def analyze(text):
+    '''Standard analyzer approximation: lowercased word tokens with their
+    position and offsets'''
+    return [
+        (m.group().lower(), position, m.start(), m.end())
+        for position, m in enumerate(TOKEN.finditer(text))
+    ]
+
+
+def field_values(source, field):
+    '''Values of a dotted field; `.keyword` sub-fields of dynamically mapped
+    strings resolve to the raw value'''
+    keyword = field.endswith('.keyword')
+    if keyword:
+        field = field[:-len('.keyword')]
+    values = [source]
+    for part in field.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                child = value[part]
+                found.extend(child if isinstance(child, list) else [child])
+        values = found
+    return [v for v in values if v is not None], keyword
+
+
+def filter_source(source, includes=(), excludes=(), path=''):
+    '''Apply `_source` includes/excludes patterns'''
+    filtered = {}
+    for key, value in source.items():
+        full = path + key
+        if any(fnmatch(full, p) for p in excludes):
+            continue
+        included = not includes or any(fnmatch(full, p) for p in includes)
+        if isinstance(value, dict):
+            value = filter_source(
+                value, () if included else includes, excludes, full + '.')
+            if not value and not included:
+                continue
+        elif not included:
+            continue
+        filtered[key] = value
+    return filtered
+
+
+def source_filter(spec, includes=None, excludes=None):
+    '''Normalize the many ways of passing `_source` into
+    False or a (includes, excludes) pair'''
+    includes = as_list(includes)
+    excludes = as_list(excludes)
+    if isinstance(spec, dict):
+        includes += as_list(spec.get('includes', spec.get('include')))
+        excludes += as_list(spec.get('excludes', spec.get('exclude')))
+    elif isinstance(spec, bool) or spec in ('true', 'false'):
+        if not as_bool(spec):
+            return False
+    elif spec not in (None, ''):
+        includes += as_list(spec)
+    return includes, excludes
+
+
+def apply_source_filter(source, spec):
+    if spec is False:
+        return None
+    includes, excludes = spec
+    if includes or excludes:
+        return filter_source(source, includes, excludes)
+    return source
+
+
+def deep_merge(target, partial):
+    '''Merge a partial document into a copy of `target`'''
+    merged = dict(target)
+    for key, value in partial.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def new_id():
+    '''20 characters URL safe id, like auto generated ids of Elasticsearch'''
+    return base64.urlsafe_b64encode(os.urandom(15)).decode('ascii')
+
+
+def compare_key(value):
+    '''Sort key putting missing values last and keeping types comparable'''
+    if value is None:
+        return (2, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value)
+    return (1, str(value))
+
+
+# Queries
+
+QUERY_KINDS = (
+    'match_all', 'match_none', 'ids', 'bool', 'exists',
+    'match', 'term', 'terms', 'range', 'prefix')
+BOOL_CLAUSES = ('must', 'filter', 'should', 'must_not')
+
+
+def bool_clauses(spec):
+    '''The queries of every clause of a bool query, by clause'''
+    return {
+        key: value if isinstance(value, list) else [value]
+        for key, value in spec.items()
+        if key in BOOL_CLAUSES
+    }
+
+
+def check_query(query):
+    '''Fail like Elasticsearch parsing a query outside the query DSL
+    subset the stand-in supports, whether or not it matches any document'''
+    if not query:
+        return
+    if len(query) != 1:
+        raise ApiError(
+            400, 'parsing_exception',
+            '[%s] malformed query, expected [END_OBJECT] but found '
+            '[FIELD_NAME]' % next(iter(query)))
+    kind, spec = next(iter(query.items()))
+    if kind not in QUERY_KINDS:
+        raise ApiError(
+            400, 'parsing_exception', 'unknown query [%s]' % kind,
+            line=1, col=len(kind) + 12)
+    if kind == 'bool':
+        for clauses in bool_clauses(spec).values():
+            for clause in clauses:
+                check_query(clause)
+
+
+def matches(query, doc_id, source):
+    '''Evaluate a query checked by check_query'''
+    if not query:
+        return True
+    kind, spec = next(iter(query.items()))
+    if kind == 'match_all':
+        return True
+    if kind == 'match_none':
+        return False
+    if kind == 'ids':
+        return doc_id in [str(v) for v in spec.get('values', [])]
+    if kind == 'bool':
+        clauses = bool_clauses(spec)
+        if not all(matches(q, doc_id, source)
+                   for q in clauses.get('must', []) + clauses.get('filter', [])):
+            return False
+        if any(matches(q, doc_id, source) for q in clauses.get('must_not', [])):
+            return False
+        should = clauses.get('should', [])
+        required = spec.get(
+            'minimum_should_match',
+            0 if 'must' in clauses or 'filter' in clauses else 1)
+        return not should or sum(
+            matches(q, doc_id, source) for q in should) >= int(required)
+    if kind == 'exists':
+        return bool(field_values(source, spec['field'])[0])
+    (field, condition), = spec.items()
+    values, keyword = field_values(source, field)
+    if kind == 'range':
+        def in_range(value):
+            return all(
+                op not in condition or check(value, condition[op])
+                for op, check in (
+                    ('gt', lambda a, b: a > b), ('gte', lambda a, b: a >= b),
+                    ('lt', lambda a, b: a < b), ('lte', lambda a, b: a <= b)))
+        return any(in_range(v) for v in values
+                   if not isinstance(v, (dict, list)))
+    if isinstance(condition, dict):
+        operator = condition.get('operator', 'or').lower()
+        condition = condition.get('query', condition.get('value'))
+    else:
+        operator = 'or'
+    if kind == 'match':
+        wanted = [t[0] for t in analyze(str(condition))]
+        found = {
+            t[0] for v in values if isinstance(v, str) for t in analyze(v)
+        } | {str(v).lower() for v in values if not isinstance(v, str)}
+        hits = [term in found for term in wanted]
+        return bool(hits) and (all(hits) if operator == 'and' else any(hits))
+    if kind == 'prefix':
+        return any(
+            isinstance(v, str) and (
+                v.startswith(condition) if keyword
+                else any(t[0].startswith(condition) for t in analyze(v)))
+            for v in values)
+    wanted = condition if kind == 'terms' else [condition]
+    for value in values:
+        if isinstance(value, str) and not keyword:
+            candidates = {t[0] for t in analyze(value)}
+        elif isinstance(value, bool):
+            candidates = {str(value).lower()}
+        else:
+            candidates = {str(value)}
+        if any((str(w).lower() if isinstance(w, bool) else str(w))
+               in candidates for w in wanted):
+            return True
+    return False
+
+
+# Scripts
+
+SCRIPT_ASSIGN = re.compile(
+    r'^ctx\._source((?:\.\w+)+)\s*(=|\+=|-=)\s*(.+)$', re.S)
+SCRIPT_STEP = re.compile(r'^ctx\._source((?:\.\w+)+)\s*(\+\+|--)$')
+SCRIPT_REMOVE = re.compile(
+    r'''^ctx\._source((?:\.\w+)*)\.remove\(\s*(['"])(\w+)\2\s*\)$''')
+SCRIPT_OP = re.compile(r'''^ctx\.op\s*=\s*(['"])(\w+)\1$''')
+SCRIPT_NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+SCRIPT_PATH = re.compile(r'^(params|ctx\._source|ctx)((?:\.\w+)+)$')
+
+
+def split_outside_quotes(text, separator):
+    '''Split on a separator character not enclosed in quotes'''
+    parts, current, quote = [], [], None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == separator:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def compile_error(source, reason):
+    return ApiError(
+        400, 'script_exception', 'compile error',
+        script_stack=[source], script=source, lang='painless',
+        caused_by={'type': 'illegal_argument_exception', 'reason': reason})
+
+
+def compile_expression(source, expression):
+    '''Compile `a + b + ...` over literals and variables'''
+    operands = []
+    for operand in split_outside_quotes(expression, '+'):
+        if operand[0] in '\'"' and operand[-1] == operand[0]:
+            operands.append(lambda ctx, params, v=operand[1:-1]: v)
+        elif SCRIPT_NUMBER.match(operand):
+            number = float(operand) if '.' in operand else int(operand)
+            operands.append(lambda ctx, params, v=number: v)
+        elif operand in ('true', 'false', 'null'):
+            literal = {'true': True, 'false': False, 'null': None}[operand]
+            operands.append(lambda ctx, params, v=literal: v)
+        elif SCRIPT_PATH.match(operand):
+            root, path = SCRIPT_PATH.match(operand).groups()
+            keys = path.strip('.').split('.')
+
+            def variable(ctx, params, root=root, keys=keys):
+                value = {'params': params, 'ctx': ctx,
+                         'ctx._source': ctx['_source']}[root]
+                for key in keys:
+                    value = value.get(key) if isinstance(value, dict) else None
+                return value
+            operands.append(variable)
+        else:
+            raise compile_error(
+                source, 'cannot resolve symbol [%s]' % operand)
+    if not operands:
+        raise compile_error(source, 'invalid sequence of tokens')
+
+    def evaluate(ctx, params):
+        values = [operand(ctx, params) for operand in operands]
+        if len(values) == 1:
+            return values[0]
+        if any(isinstance(v, str) for v in values):
+            return ''.join('null' if v is None else str(v) for v in values)
+        return sum(values)
+    return evaluate
+
+
+def container(source, path):
+    '''Return the object holding the last key of a dotted path'''
+    keys = path.strip('.').split('.')
+    for key in keys[:-1]:
+        source = source.setdefault(key, {})
+    return source, keys[-1]
+
+
+def compile_script(source):
+    '''Compile the supported Painless subset into a callable(ctx, params)'''
+    statements = []
+    for statement in split_outside_quotes(source, ';'):
+        assign = SCRIPT_ASSIGN.match(statement)
+        step = SCRIPT_STEP.match(statement)
+        remove = SCRIPT_REMOVE.match(statement)
+        op = SCRIPT_OP.match(statement)
+        if assign:
+            path, operator, expression = assign.groups()
+            evaluate = compile_expression(source, expression)
+
+            def run(ctx, params, path=path, operator=operator,
+                    evaluate=evaluate):
+                target, key = container(ctx['_source'], path)
+                value = evaluate(ctx, params)
+                if operator == '+=':
+                    value = target.get(key) + value
+                elif operator == '-=':
+                    value = target.get(key) - value
+                target[key] = value
+        elif step:
+            path, operator = step.groups()
+
+            def run(ctx, params, path=path, delta=1 if operator == '++' else -1):
+                target, key = container(ctx['_source'], path)
+                target[key] = target.get(key) + delta
+        elif remove:
+            path, _, key = remove.groups()
+
+            def run(ctx, params, path=path, key=key):
+                target = ctx['_source']
+                for part in path.strip('.').split('.') if path else []:
+                    target = target.get(part, {})
+                target.pop(key, None)
+        elif op:
+            def run(ctx, params, value=op.group(2)):
+                ctx['op'] = value
+        else:
+            raise compile_error(
+                source, 'unexpected token in [%s]' % statement)
+        statements.append(run)
+
+    def execute(ctx, params):
+        for run in statements:
+            try:
+                run(ctx, params)
+            except (TypeError, AttributeError) as e:
+                raise ApiError(
+                    400, 'script_exception', 'runtime error',
+                    script_stack=[source], script=source, lang='painless',
+                    caused_by={'type': 'null_pointer_exception'
+                               if 'None' in str(e) else 'class_cast_exception',
+                               'reason': str(e)})
+    return execute
+
+
+# Compilations allowed per time window unless set otherwise, and how many
+# compiled scripts are cached, as on a node.
+MAX_COMPILATIONS_RATE = '75/5m'
+SCRIPT_CACHE_SIZE = 100
+
+
+def parse_rate(value):
+    '''(count, seconds) of a compilation rate like `75/5m`, None when
+    unlimited'''
+    if value == 'unlimited':
+        return None
+    count, _, window = str(value).partition('/')
+    try:
+        rate = int(count), parse_interval(window)
+    except ValueError:
+        rate = None, None
+    if not rate[0] or not rate[1] or rate[0] < 0:
+        raise ApiError(
+            400, 'illegal_argument_exception',
+            'failed to parse [script.max_compilations_rate] with value [%s]'
+            % value)
+    return rate
+
+
+class ScriptService(object):
+    """
+    Stored scripts, the cache of compiled scripts and the limit on how
+    often scripts are compiled.
+    """
+
+    def __init__(self):
+        self.stored = {}
+        self.cache = OrderedDict()
+        self.stats = {
+            'compilations': 0,
+            'cache_evictions': 0,
+            'compilation_limit_triggered': 0
+        }
+        self.set_rate(MAX_COMPILATIONS_RATE)
+
+    def set_rate(self, value):
+        self.rate_setting = value
+        self.rate = parse_rate(value)
+        self.tokens = self.rate[0] if self.rate else None
+        self.last_compilation = time.monotonic()
+
+    def check_limit(self):
+        '''Take a compilation from the bucket refilled at the allowed rate'''
+        if self.rate is None:
+            return
+        count, window = self.rate
+        now = time.monotonic()
+        self.tokens = min(
+            count,
+            self.tokens + (now - self.last_compilation) * count / window)
+        self.last_compilation = now
+        if self.tokens < 1:
+            self.stats['compilation_limit_triggered'] += 1
+            raise ApiError(
+                429, 'circuit_breaking_exception',
+                '[script] Too many dynamic script compilations within, max: '
+                '[%s]; please use indexed, or scripts with parameters '
+                'instead; this limit can be changed by the '
+                '[script.max_compilations_rate] setting' % self.rate_setting,
+                bytes_wanted=0, bytes_limit=0, durability='TRANSIENT')
+        self.tokens -= 1
+
+    def compile(self, source):
+        '''The compiled script of a source, compiling it on a cache miss'''
+        if source in self.cache:
+            self.cache.move_to_end(source)
+            return self.cache[source]
+        self.check_limit()
+        compiled = self.cache[source] = compile_script(source)
+        self.stats['compilations'] += 1
+        if len(self.cache) > SCRIPT_CACHE_SIZE:
+            self.cache.popitem(last=False)
+            self.stats['cache_evictions'] += 1
+        return compiled
+
+
+# Ingest
+
+# Field references of the mustache templates of processor options.
+INGEST_TEMPLATE = re.compile(r'\{\{\{?\s*([\w.@]+)\s*\}?\}\}')
+# Metadata fields of an ingest document, outside of its source.
+INGEST_METADATA = ('_index', '_id', '_routing')
+# Options every processor accepts.
+PROCESSOR_OPTIONS = {'tag', 'ignore_failure', 'on_failure'}
+JAVA_DATE_TOKEN = re.compile(r"'[^']*'|([a-zA-Z])\1*|.")
+DEFAULT_OUTPUT_FORMAT = "yyyy-MM-dd'T'HH:mm:ss.SSSXXX"
+MISSING = object()
+
+
+def processor_error(processor_type, type, reason, **extra):
+    return ApiError(400, type, reason, header=dict(
+        extra.pop('header', {}), processor_type=processor_type), **extra)
+
+
+def processor_option(processor_type, config, name, default=MISSING):
+    '''An option of a processor definition, which is required unless it
+    has a default'''
+    if name in config:
+        return config[name]
+    if default is MISSING:
+        raise processor_error(
+            processor_type, 'parse_exception',
+            '[%s] required property is missing' % name,
+            header={'property_name': name})
+    return default
+
+
+def ingest_timestamp():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(
+        timespec='microseconds').replace('+00:00', 'Z')
+
+
+def ingest_document(index, doc_id, source):
+    return {'_index': index, '_id': doc_id, '_source': source,
+            '_ingest': {'timestamp': ingest_timestamp()}}
+
+
+def ingest_container(doc, path, create=False):
+    '''The object of an ingest document holding the last key of a field
+    path and that key, None when a parent is missing'''
+    keys = path.split('.')
+    if len(keys) == 1 and keys[0] in INGEST_METADATA:
+        return doc, keys[0]
+    target = doc['_source']
+    if keys[0] in ('_ingest', '_source') and len(keys) > 1:
+        target = doc[keys[0]]
+        keys = keys[1:]
+    for key in keys[:-1]:
+        if isinstance(target, dict) and create:
+            target = target.setdefault(key, {})
+        else:
+            target = target.get(key) if isinstance(target, dict) else None
+    return (target if isinstance(target, dict) else None), keys[-1]
+
+
+def get_field(doc, path):
+    target, key = ingest_container(doc, path)
+    return MISSING if target is None else target.get(key, MISSING)
+
+
+def set_field(doc, path, value):
+    target, key = ingest_container(doc, path, create=True)
+    if target is None:
+        raise ApiError(
+            400, 'illegal_argument_exception',
+            'cannot set [%s] as part of path [%s]' % (key, path))
+    target[key] = value
+
+
+def render(template, doc):
+    '''Fill the `{{field}}` references of an option value in'''
+    if isinstance(template, dict):
+        return {key: render(value, doc) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render(value, doc) for value in template]
+    if not isinstance(template, str):
+        return template
+
+    def value(match):
+        found = get_field(doc, match.group(1))
+        if found is MISSING or found is None:
+            return ''
+        if isinstance(found, bool):
+            return 'true' if found else 'false'
+        if isinstance(found, (dict, list)):
+            return json.dumps(found)
+        return str(found)
+    return INGEST_TEMPLATE.sub(value, template)
+
+
+def time_zone(name):
+    if name in ('UTC', 'Z'):
+        return datetime.timezone.utc
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ApiError(
+            400, 'illegal_argument_exception', 'Unknown time-zone ID: %s' % name)
+
+
+def java_date_tokens(pattern):
+    '''Letters, repeated letters and literals of a java date pattern'''
+    for match in JAVA_DATE_TOKEN.finditer(pattern):
+        token = match.group()
+        if token.startswith("'"):
+            yield 'literal', token[1:-1] or "'"
+        elif match.group(1):
+            yield 'field', token
+        else:
+            yield 'literal', token
+
+
+STRPTIME_FIELDS = {
+    'yyyy': '%Y', 'uuuu': '%Y', 'yy': '%y', 'MM': '%m', 'MMM': '%b',
+    'dd': '%d', 'HH': '%H', 'mm': '%M', 'ss': '%S', 'SSS': '%f',
+    'SSSSSS': '%f', 'SSSSSSSSS': '%f', 'X': '%z', 'XX': '%z', 'XXX': '%z',
+    'Z': '%z', 'ZZ': '%z',
+}
+
+
+def date_parser(pattern):
+    '''Parse a date of a date processor format into an aware datetime,
+    given the time zone of dates without an offset'''
+    if pattern == 'ISO8601':
+        def parse(value, zone):
+            moment = datetime.datetime.fromisoformat(value)
+            return moment if moment.tzinfo else moment.replace(tzinfo=zone)
+        return parse
+    if pattern in ('UNIX', 'UNIX_MS'):
+        scale = 1 if pattern == 'UNIX' else 1000
+
+        def parse(value, zone):
+            return datetime.datetime.fromtimestamp(float(value) / scale, zone)
+        return parse
+    parts = []
+    for kind, token in java_date_tokens(pattern):
+        if kind == 'literal':
+            parts.append(token.replace('%', '%%'))
+        elif token in STRPTIME_FIELDS:
+            parts.append(STRPTIME_FIELDS[token])
+        else:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'Invalid format: [%s]: Unknown pattern letter: %s' % (
+                    pattern, token[0]))
+    strptime = ''.join(parts)
+
+    def parse(value, zone):
+        moment = datetime.datetime.strptime(value, strptime)
+        return moment if moment.tzinfo else moment.replace(tzinfo=zone)
+    return parse
+
+
+def format_offset(moment):
+    offset = moment.utcoffset()
+    if not offset:
+        return 'Z'
+    minutes = int(offset.total_seconds()) // 60
+    return '%s%02d:%02d' % (
+        '-' if minutes < 0 else '+', abs(minutes) // 60, abs(minutes) % 60)
+
+
+DATE_FIELDS = {
+    'yyyy': lambda m: '%04d' % m.year,
+    'uuuu': lambda m: '%04d' % m.year,
+    'yy': lambda m: '%02d' % (m.year % 100),
+    'MM': lambda m: '%02d' % m.month,
+    'MMM': lambda m: m.strftime('%b'),
+    'dd': lambda m: '%02d' % m.day,
+    'HH': lambda m: '%02d' % m.hour,
+    'mm': lambda m: '%02d' % m.minute,
+    'ss': lambda m: '%02d' % m.second,
+    'SSS': lambda m: '%03d' % (m.microsecond // 1000),
+    'SSSSSS': lambda m: '%06d' % m.microsecond,
+    'XXX': format_offset,
+    'X': lambda m: format_offset(m).replace(':', '')[:3]
+    if format_offset(m) != 'Z' else 'Z',
+}
+
+
+def date_formatter(pattern):
+    '''Format an aware datetime with a java date pattern'''
+    parts = []
+    for kind, token in java_date_tokens(pattern):
+        if kind == 'literal':
+            parts.append(lambda m, token=token: token)
+        elif token in DATE_FIELDS:
+            parts.append(DATE_FIELDS[token])
+        else:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'Invalid format: [%s]: Unknown pattern letter: %s' % (
+                    pattern, token[0]))
+    return lambda moment: ''.join(part(moment) for part in parts)
+
+
+def set_processor(config, scripts):
+    field = processor_option('set', config, 'field')
+    value = processor_option('set', config, 'value')
+    override = as_bool(config.get('override'), True)
+
+    def run(doc):
+        path = render(field, doc)
+        if override or get_field(doc, path) in (MISSING, None):
+            set_field(doc, path, copy.deepcopy(render(value, doc)))
+    return run
+
+
+def rename_processor(config, scripts):
+    field = processor_option('rename', config, 'field')
+    target_field = processor_option('rename', config, 'target_field')
+    ignore_missing = as_bool(config.get('ignore_missing'))
+
+    def run(doc):
+        value = get_field(doc, field)
+        if value is MISSING:
+            if ignore_missing:
+                return
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                "field [%s] doesn't exist" % field)
+        if get_field(doc, target_field) is not MISSING:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'field [%s] already exists' % target_field)
+        target, key = ingest_container(doc, field)
+        del target[key]
+        set_field(doc, target_field, value)
+    return run
+
+
+def script_processor(config, scripts):
+    lang = config.get('lang', 'painless')
+    if lang != 'painless':
+        raise processor_error(
+            'script', 'illegal_argument_exception',
+            'script_lang not supported [%s]' % lang)
+    if 'id' in config:
+        if config['id'] not in scripts.stored:
+            raise processor_error(
+                'script', 'resource_not_found_exception',
+                'unable to find script [%s] in cluster state' % config['id'])
+        source = scripts.stored[config['id']]['source']
+    else:
+        source = processor_option('script', config, 'source')
+    # Ingest scripts address the source fields as `ctx.<field>`.
+    execute = scripts.compile(re.sub(
+        r'\bctx\.(?!_source\b|_index\b|_id\b|op\b)', 'ctx._source.', source))
+    params = config.get('params', {})
+
+    def run(doc):
+        ctx = {key: doc[key] for key in INGEST_METADATA if key in doc}
+        ctx['_source'] = doc['_source']
+        execute(ctx, params)
+        doc['_source'] = ctx['_source']
+    return run
+
+
+def date_processor(config, scripts):
+    field = processor_option('date', config, 'field')
+    target_field = config.get('target_field', '@timestamp')
+    formats = processor_option('date', config, 'formats')
+    if not isinstance(formats, list) or not formats:
+        raise processor_error(
+            'date', 'parse_exception',
+            "[formats] property isn't a list, but of type [%s]"
+            % type(formats).__name__, header={'property_name': 'formats'})
+    parsers = [date_parser(pattern) for pattern in formats]
+    zone = time_zone(config.get('timezone', 'UTC'))
+    output = date_formatter(config.get('output_format', DEFAULT_OUTPUT_FORMAT))
+
+    def run(doc):
+        value = get_field(doc, field)
+        if value in (MISSING, None):
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'field [%s] not present as part of path [%s]' % (field, field))
+        for parse in parsers:
+            try:
+                moment = parse(str(value), zone)
+                break
+            except (ValueError, OverflowError, OSError):
+                continue
+        else:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'unable to parse date [%s]' % value)
+        set_field(doc, target_field, output(moment))
+    return run
+
+
+PROCESSORS = {
+    'set': (set_processor, {'field', 'value', 'override'}),
+    'rename': (rename_processor, {'field', 'target_field', 'ignore_missing'}),
+    'script': (script_processor, {'source', 'id', 'lang', 'params'}),
+    'date': (date_processor, {
+        'field', 'target_field', 'formats', 'timezone', 'locale',
+        'output_format'}),
+}
+
+
+class Processor(object):
+    """
+    A compiled processor of a pipeline and how its failures are handled.
+    """
+
+    def __init__(self, definition, scripts):
+        if not isinstance(definition, dict) or len(definition) != 1:
+            raise ApiError(
+                400, 'parse_exception',
+                'processor definition must be an object with a single key')
+        (self.type, config), = definition.items()
+        if not isinstance(config, dict):
+            raise processor_error(
+                self.type, 'parse_exception',
+                'processor [%s] must be an object' % self.type)
+        if self.type not in PROCESSORS:
+            raise processor_error(
+                self.type, 'parse_exception',
+                'No processor type exists with name [%s]' % self.type)
+        factory, options = PROCESSORS[self.type]
+        unknown = set(config) - options - PROCESSOR_OPTIONS
+        if unknown:
+            raise processor_error(
+                self.type, 'parse_exception',
+                'processor [%s] doesn\'t support one or more provided '
+                'configuration parameters %s' % (self.type, sorted(unknown)))
+        self.tag = config.get('tag')
+        self.ignore_failure = as_bool(config.get('ignore_failure'))
+        self.on_failure = compile_processors(
+            config.get('on_failure', []), scripts)
+        self.run = factory(config, scripts)
+
+
+def compile_processors(definitions, scripts):
+    if not isinstance(definitions, list):
+        raise ApiError(
+            400, 'parse_exception',
+            "[processors] property isn't a list, but of type [%s]"
+            % type(definitions).__name__)
+    return [Processor(definition, scripts) for definition in definitions]
+
+
+def run_processors(processors, on_failure, doc, results=None):
+    '''Run processors over an ingest document in order. A failing processor
+    hands the document to its own on_failure processors, then carries on,
+    or to those of the pipeline, which end it; without either the failure
+    is raised. `results` collects the document, or the error, after every
+    processor as the verbose simulate API reports them'''
+    for processor in processors:
+        try:
+            processor.run(doc)
+        except ApiError as e:
+            e.extra.setdefault('header', {'processor_type': processor.type})
+            if results is not None:
+                results.append(processor_result(processor, error=e))
+            if processor.ignore_failure:
+                continue
+            handlers = processor.on_failure or on_failure
+            if not handlers:
+                raise
+            doc['_ingest'].update(
+                on_failure_message=e.reason,
+                on_failure_processor_type=processor.type,
+                on_failure_processor_tag=processor.tag)
+            run_processors(handlers, [], doc, results)
+            if processor.on_failure:
+                continue
+            return
+        if results is not None:
+            results.append(processor_result(processor, doc=doc))
+
+
+def processor_result(processor, doc=None, error=None):
+    result = {} if processor.tag is None else {'tag': processor.tag}
+    if error is not None:
+        result['error'] = error.body()['error']
+    else:
+        result['doc'] = simulated_document(doc)
+    return result
+
+
+def simulated_document(doc):
+    return {
+        '_index': doc['_index'],
+        '_type': '_doc',
+        '_id': doc['_id'],
+        '_source': copy.deepcopy(doc['_source']),
+        '_ingest': {'timestamp': doc['_ingest']['timestamp']}
+    }
+
+
+class IngestService(object):
+    """
+    Ingest pipelines, compiled when they are put, and their counters.
+    """
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.pipelines = {}
+        self.stats = {}
+
+    def compile(self, definition):
+        '''(processors, on_failure processors) of a pipeline definition'''
+        if not isinstance(definition, dict) or 'processors' not in definition:
+            raise ApiError(
+                400, 'parse_exception',
+                '[processors] required property is missing')
+        return (compile_processors(definition['processors'], self.scripts),
+                compile_processors(
+                    definition.get('on_failure', []), self.scripts))
+
+    def put(self, id, definition):
+        self.pipelines[id] = (definition, self.compile(definition))
+        self.stats.setdefault(id, {
+            'count': 0, 'time_in_nanos': 0, 'current': 0, 'failed': 0})
+
+    def pipeline(self, id):
+        if id not in self.pipelines:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'pipeline with id [%s] does not exist' % id)
+        return self.pipelines[id][1]
+
+    def process(self, id, index, doc_id, source):
+        '''Run a document through a pipeline, returning its possibly
+        changed (index, id, source)'''
+        processors, on_failure = self.pipeline(id)
+        stats = self.stats[id]
+        start = time.perf_counter_ns()
+        doc = ingest_document(index, doc_id, source)
+        try:
+            run_processors(processors, on_failure, doc)
+        except ApiError:
+            stats['failed'] += 1
+            raise
+        finally:
+            stats['count'] += 1
+            stats['time_in_nanos'] += time.perf_counter_ns() - start
+        return doc['_index'], doc['_id'], doc['_source']
+
+    def node_stats(self):
+        pipelines = {
+            id: {'count': stats['count'],
+                 'time_in_millis': stats['time_in_nanos'] // 1000000,
+                 'current': 0, 'failed': stats['failed']}
+            for id, stats in self.stats.items()
+        }
+        return {
+            'total': {
+                key: sum(stats[key] for stats in pipelines.values())
+                for key in ('count', 'time_in_millis', 'current', 'failed')
+            },
+            'pipelines': pipelines
+        }
+
+
+class Doc(object):
+    """
+    A version of a document.
+    """
+    __slots__ = ('source', 'version', 'seq_no')
+
+    def __init__(self, source, version, seq_no):
+        self.source = source
+        self.version = version
+        self.seq_no = seq_no
+
+
+class Index(object):
+    """
+    Single shard index with a realtime and a searchable view of its docs.
+    """
+
+    def __init__(self, name, settings=None, mappings=None):
+        self.name = name
+        self.uuid = base64.urlsafe_b64encode(
+            uuid.uuid4().bytes).decode('ascii').rstrip('=')
+        self.settings = settings or {}
+        self.mappings = mappings or {}
+        self.docs = {}
+        self.visible = {}
+        self.pending = set()
+        self.tombstones = {}
+        self.seq_no = -1
+        self.last_refresh = time.monotonic()
+        self._field_stats = {}
+        self.refresh_interval = parse_interval(
+            self.setting('refresh_interval', '1s'))
+
+    def setting(self, key, default=None):
+        '''Look up an index setting given in any of its accepted forms'''
+        nested = self.settings.get('index', {})
+        return nested.get(key, self.settings.get(
+            'index.' + key, self.settings.get(key, default)))
+
+    def conflict(self, doc_id, reason):
+        return ApiError(
+            409, 'version_conflict_engine_exception',
+            '[%s]: version conflict, %s' % (doc_id, reason),
+            index_uuid=self.uuid, shard='0', index=self.name)
+
+    def check(self, doc_id, current, op_type='index',
+              if_seq_no=None, if_primary_term=None):
+        '''Raise the conflicts of optimistic concurrency control'''
+        if op_type == 'create' and current is not None:
+            raise self.conflict(
+                doc_id, 'document already exists (current version [%d])'
+                % current.version)
+        if if_seq_no is None and if_primary_term is None:
+            return
+        required = 'required seqNo [%s], primary term [%s]' % (
+            if_seq_no, if_primary_term)
+        if current is None:
+            raise self.conflict(
+                doc_id, required + '. but no document was found')
+        if (int(if_seq_no) != current.seq_no
+                or int(if_primary_term) != PRIMARY_TERM):
+            raise self.conflict(
+                doc_id, required + '. current document has seqNo [%d] and '
+                'primary term [%d]' % (current.seq_no, PRIMARY_TERM))
+
+    def put(self, doc_id, source, **conditions):
+        current = self.docs.get(doc_id)
+        self.check(doc_id, current, **conditions)
+        version = (current.version if current
+                   else self.tombstones.get(doc_id, 0)) + 1
+        self.seq_no += 1
+        doc = self.docs[doc_id] = Doc(source, version, self.seq_no)
+        self.tombstones.pop(doc_id, None)
+        self.pending.add(doc_id)
+        return doc, 'updated' if current else 'created'
+
+    def remove(self, doc_id, **conditions):
+        current = self.docs.get(doc_id)
+        self.check(doc_id, current, **conditions)
+        version = (current.version if current
+                   else self.tombstones.get(doc_id, 0)) + 1
+        self.seq_no += 1
+        self.docs.pop(doc_id, None)
+        self.tombstones[doc_id] = version
+        self.pending.add(doc_id)
+        return Doc(None, version, self.seq_no), (
+            'deleted' if current else 'not_found')
+
+    def refresh(self):
+        for doc_id in self.pending:
+            if doc_id in self.docs:
+                self.visible[doc_id] = self.docs[doc_id]
+            else:
+                self.visible.pop(doc_id, None)
+        self.pending = set()
+        self.last_refresh = time.monotonic()
+
+    def searchable(self):
+        '''Docs visible to search, refreshing once the interval elapsed'''
+        if (self.pending and self.refresh_interval is not None
+                and time.monotonic() - self.last_refresh
+                >= self.refresh_interval):
+            self.refresh()
+        return self.visible
+
+    def stats(self):
+        '''Document counts and an approximate store size: the JSON of the
+        sources and the ids'''
+        return {
+            'docs': {'count': len(self.docs), 'deleted': 0},
+            'store': {'size_in_bytes': sum(
+                len(doc_id) + len(json.dumps(
+                    doc.source, separators=(',', ':')))
+                for doc_id, doc in self.docs.items())},
+        }
+
+    def field_stats(self, field):
+        '''Field and term statistics over the realtime docs'''
+        cached = self._field_stats.get(field)
+        if cached and cached[0] == self.seq_no:
+            return cached[1]
+        stats = {'doc_count': 0, 'sum_doc_freq': 0, 'sum_ttf': 0, 'terms': {}}
+        for doc in self.docs.values():
+            terms = term_freqs(doc.source, field)
+            if not terms:
+                continue
+            stats['doc_count'] += 1
+            stats['sum_doc_freq'] += len(terms)
+            for term, tokens in terms.items():
+                doc_freq, ttf = stats['terms'].get(term, (0, 0))
+                stats['terms'][term] = (doc_freq + 1, ttf + len(tokens))
+                stats['sum_ttf'] += len(tokens)
+        self._field_stats[field] = (self.seq_no, stats)
+        return stats
+
+
+class Task(object):
+    """
+    Task of the tasks API running a request, or a slice of one, on a
+    background thread. `status` holds its live counters and `result` the
+    (status, payload) answer once `done` is set.
+    """
+
+    def __init__(self, number, action, description, parent=None):
+        self.id = '%s:%d' % (NODE_ID, number)
+        self.number = number
+        self.action = action
+        self.description = description
+        self.parent = parent
+        self.children = []
+        self.start_millis = int(time.time() * 1000)
+        self.start = time.monotonic()
+        self.end = None
+        self.status = {}
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+
+    def finish(self, result=None):
+        self.end = time.monotonic()
+        self.result = result
+        self.done.set()
+
+    def current_status(self):
+        '''Own counters, or those of all slices added up'''
+        if not self.children:
+            return dict(self.status)
+        slices = [child.current_status() for child in self.children]
+        status = {}
+        for slice_status in slices:
+            for key, value in slice_status.items():
+                if key == 'slice_id':
+                    continue
+                if isinstance(value, dict):
+                    value = dict((k, status.get(key, {}).get(k, 0) + v)
+                                 for k, v in value.items())
+                elif key == 'throttled_until_millis':
+                    value = min(status.get(key, value), value)
+                elif key == 'requests_per_second' and value < 0:
+                    pass
+                else:
+                    value = status.get(key, 0) + value
+                status[key] = value
+        status['slices'] = slices
+        return status
+
+    def info(self, detailed=True):
+        info = {
+            'node': NODE_ID,
+            'id': self.number,
+            'type': 'transport',
+            'action': self.action,
+        }
+        if detailed:
+            info['status'] = self.current_status()
+            info['description'] = self.description
+        info.update({
+            'start_time_in_millis': self.start_millis,
+            'running_time_in_nanos': int(
+                ((self.end or time.monotonic()) - self.start) * 1e9),
+            'cancellable': True,
+        })
+        if self.parent:
+            info['parent_task_id'] = self.parent.id
+        info['headers'] = {}
+        return info
+
+
+def parse_interval(value):
+    '''Seconds of a time value like `1s` or `500ms`, None for `-1`'''
+    value = str(value)
+    if value == '-1':
+        return None
+    for suffix, factor in (('ms', 0.001), ('s', 1), ('m', 60), ('h', 3600)):
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * factor
+    return float(value) / 1000
+
+
+def flatten_settings(settings, prefix=''):
+    '''Settings given as nested objects as a flat dict of dotted keys'''
+    flat = {}
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            flat.update(flatten_settings(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def nest_settings(flat):
+    '''Flat settings as nested objects'''
+    nested = {}
+    for key, value in flat.items():
+        target = nested
+        *parents, last = key.split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[last] = value
+    return nested
+
+
+def term_freqs(source, field):
+    '''Tokens of every term of a text field, keyed by term'''
+    values, _ = field_values(source, field)
+    terms = {}
+    position_base = offset_base = 0
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        tokens = analyze(value)
+        for term, position, start, end in tokens:
+            terms.setdefault(term, []).append(
+                (position_base + position, offset_base + start,
+                 offset_base + end))
+        # position_increment_gap of text fields
+        position_base += (tokens[-1][1] + 1 if tokens else 0) + 100
+        offset_base += len(value) + 1
+    return dict(sorted(terms.items()))
+
+
+def text_fields(source, path=''):
+    '''Dotted names of all string fields of a document'''
+    for key, value in source.items():
+        if isinstance(value, dict):
+            yield from text_fields(value, path + key + '.')
+        elif isinstance(value, str) or (
+                isinstance(value, list) and value
+                and all(isinstance(v, str) for v in value)):
+            yield path + key
+
+
+ROUTES = []
+
+
+def route(methods, *patterns):
+    '''Register a DocumentStore method as the handler of URL patterns'''
+    def register(handler):
+        for pattern in patterns:
+            ROUTES.append((
+                methods.split(), pattern.strip('/').split('/')
+                if pattern != '/' else [], handler.__name__))
+        return handler
+    return register
+
+
+def match_route(method, segments):
+    allowed = False
+    for methods, pattern, handler in ROUTES:
+        if len(pattern) != len(segments):
+            continue
+        args = {}
+        for expected, actual in zip(pattern, segments):
+            if expected in ('{index}', '{id}', '{name}'):
+                if expected == '{index}' and actual.startswith('_') \
+                        and actual != '_all':
+                    break
+                args[expected.strip('{}')] = actual
+            elif expected != actual:
+                break
+        else:
+            if method in methods:
+                return handler, args
+            allowed = True
+    if allowed:
+        raise ApiError(
+            405, 'method_not_allowed',
+            'Incorrect HTTP method for uri [/%s] and method [%s]'
+            % ('/'.join(segments), method))
+    raise ApiError(
+        400, 'illegal_argument_exception',
+        'no handler found for uri [/%s] and method [%s]'
+        % ('/'.join(segments), method))
+
+
+class DocumentStore(object):
+    """
+    In-memory cluster state and the REST handlers operating on it.
+    """
+
+    def __init__(self):
+        self.indices = {}
+        self.tasks = {}
+        self.task_count = 0
+        self.scrolls = {}
+        self.scroll_count = 0
+        self.scripts = ScriptService()
+        self.ingest = IngestService(self.scripts)
+        self.settings = {'persistent': {}, 'transient': {}}
+        self.lock = threading.RLock()
+
+    def handle(self, method, path, params, body):
+        '''Answer a REST request with a (status, payload) pair. Handlers
+        starting a task the request waits for return the task'''
+        segments = [unquote(s) for s in path.strip('/').split('/') if s]
+        try:
+            handler, args = match_route(method, segments)
+            with self.lock:
+                response = getattr(self, handler)(
+                    params=params, body=body, **args)
+            if isinstance(response, Task):
+                # Wait without holding the lock the task works under.
+                response.done.wait()
+                self.forget(response)
+                response = response.result
+            return response
+        except ApiError as e:
+            return e.status, e.body()
+        except Exception as e:
+            return 500, ApiError(500, 'exception', repr(e)).body()
+
+    # helpers
+
+    def resolve(self, expression, ignore_unavailable=False):
+        '''Indices matching a comma separated list of names and wildcards'''
+        names = as_list(expression) or ['_all']
+        found = []
+        for name in names:
+            if name == '_all' or '*' in name:
+                pattern = '*' if name == '_all' else name
+                found += [i for n, i in self.indices.items()
+                          if fnmatch(n, pattern) and i not in found]
+            elif name in self.indices:
+                if self.indices[name] not in found:
+                    found.append(self.indices[name])
+            elif not ignore_unavailable:
+                raise index_not_found(name)
+        return found
+
+    def existing(self, name):
+        if name not in self.indices:
+            raise index_not_found(name)
+        return self.indices[name]
+
+    def auto_create(self, name):
+        if name not in self.indices:
+            self.create(name)
+        return self.indices[name]
+
+    def create(self, name, settings=None, mappings=None):
+        if name in self.indices:
+            index = self.indices[name]
+            raise ApiError(
+                400, 'resource_already_exists_exception',
+                'index [%s/%s] already exists' % (name, index.uuid),
+                index_uuid=index.uuid, index=name)
+        if (name != name.lower() or name[0] in '_-+'
+                or INVALID_INDEX_CHARS & set(name) or name in ('.', '..')):
+            raise ApiError(
+                400, 'invalid_index_name_exception',
+                'Invalid index name [%s], must be lowercase and must not '
+                'contain the following characters [ , ", *, \\, <, |, ,, '
+                '>, /, ?]' % name, index_uuid='_na_', index=name)
+        self.indices[name] = Index(name, settings, mappings)
+        return self.indices[name]
+
+    def after_write(self, indices, params):
+        '''Honour the `refresh` parameter of write requests'''
+        if params.get('refresh') in ('', 'true', 'wait_for'):
+            for index in indices:
+                index.refresh()
+            return params['refresh'] != 'wait_for'
+        return False
+
+    def json(self, body, required=False):
+        if not body:
+            if required:
+                raise ApiError(
+                    400, 'parse_exception', 'request body is required')
+            return {}
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise ApiError(
+                400, 'x_content_parse_exception', 'failed to parse: %s' % e)
+
+    def doc_id(self, value):
+        return str(value)
+
+    def write_result(self, index, doc_id, doc, result, forced=False):
+        response = {
+            '_index': index.name,
+            '_type': '_doc',
+            '_id': doc_id,
+            '_version': doc.version,
+            'result': result,
+        }
+        if forced:
+            response['forced_refresh'] = True
+        response.update({
+            '_shards': NOOP_SHARDS if result == 'noop' else WRITE_SHARDS,
+            '_seq_no': doc.seq_no,
+            '_primary_term': PRIMARY_TERM
+        })
+        return response
+
+    def get_result(self, index, doc_id, doc, spec):
+        if doc is None:
+            return {'_index': index.name, '_type': '_doc', '_id': doc_id,
+                    'found': False}
+        response = {
+            '_index': index.name,
+            '_type': '_doc',
+            '_id': doc_id,
+            '_version': doc.version,
+            '_seq_no': doc.seq_no,
+            '_primary_term': PRIMARY_TERM,
+            'found': True
+        }
+        source = apply_source_filter(doc.source, spec)
+        if source is not None:
+            response['_source'] = source
+        return response
+
+    def read_spec(self, params, body_spec=None, stored_fields=None):
+        '''Source filter of a read from query string and body options'''
+        spec = params.get('_source', body_spec)
+        stored_fields = params.get('stored_fields', stored_fields)
+        if stored_fields is not None and spec is None:
+            return False
+        return source_filter(
+            spec, params.get('_source_includes'),
+            params.get('_source_excludes'))
+
+    def conditions(self, params):
+        return {
+            'if_seq_no': params.get('if_seq_no'),
+            'if_primary_term': params.get('if_primary_term')
+        }
+
+    def script(self, spec):
+        '''Parse a script given as string or object into (callable, params)'''
+        if isinstance(spec, str):
+            spec = {'source': spec}
+        if not isinstance(spec, dict):
+            raise ApiError(
+                400, 'x_content_parse_exception',
+                '[script] failed to parse object')
+        unknown = set(spec) - {'source', 'id', 'lang', 'params', 'options'}
+        if unknown:
+            raise ApiError(
+                400, 'x_content_parse_exception',
+                '[1:12] [UpdateRequest] failed to parse field [script]',
+                caused_by={
+                    'type': 'illegal_argument_exception',
+                    'reason': '[script] unknown field [%s]'
+                    % sorted(unknown)[0]})
+        if spec.get('lang', 'painless') != 'painless':
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'script_lang not supported [%s]' % spec['lang'])
+        if 'id' in spec:
+            if spec['id'] not in self.scripts.stored:
+                raise ApiError(
+                    404, 'resource_not_found_exception',
+                    'unable to find script [%s] in cluster state' % spec['id'])
+            source = self.scripts.stored[spec['id']]['source']
+        elif 'source' in spec:
+            source = spec['source']
+        else:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'must specify either [source] for an inline script or [id] '
+                'for a stored script')
+        return self.scripts.compile(source), spec.get('params', {})
+
+    def run_script(self, index, doc_id, doc, script):
+        '''Run an update script, returning (op, new source)'''
+        execute, script_params = script
+        ctx = {
+            '_index': index.name,
+            '_type': '_doc',
+            '_id': doc_id,
+            '_version': doc.version,
+            '_routing': None,
+            '_now': int(time.time() * 1000),
+            'op': 'index',
+            '_source': copy.deepcopy(doc.source)
+        }
+        execute(ctx, script_params)
+        return ctx['op'], ctx['_source']
+
+    # cluster
+
+    @route('GET', '/')
+    def info(self, params, body):
+        return 200, {
+            'name': 'standin',
+            'cluster_name': 'standin',
+            'cluster_uuid': 'standin',
+            'version': VERSION,
+            'tagline': 'You Know, for Search'
+        }
+
+    @route('HEAD', '/')
+    def ping(self, params, body):
+        return 200, None
+
+    @route('GET', '_cluster/settings')
+    def get_cluster_settings(self, params, body):
+        return 200, {
+            scope: settings if as_bool(params.get('flat_settings'))
+            else nest_settings(settings)
+            for scope, settings in self.settings.items()
+        }
+
+    @route('PUT', '_cluster/settings')
+    def put_cluster_settings(self, params, body):
+        request = self.json(body, required=True)
+        updated = {}
+        for scope in ('persistent', 'transient'):
+            updated[scope] = flatten_settings(request.get(scope, {}))
+            for key in updated[scope]:
+                if key != 'script.max_compilations_rate':
+                    raise ApiError(
+                        400, 'illegal_argument_exception',
+                        '%s setting [%s], not dynamically updateable' % (
+                            scope, key))
+        for scope, settings in updated.items():
+            for key, value in settings.items():
+                if value is None:
+                    self.settings[scope].pop(key, None)
+                else:
+                    parse_rate(value)
+                    self.settings[scope][key] = str(value)
+        self.scripts.set_rate(
+            self.settings['transient'].get(
+                'script.max_compilations_rate',
+                self.settings['persistent'].get(
+                    'script.max_compilations_rate', MAX_COMPILATIONS_RATE)))
+        return 200, dict(
+            {scope: nest_settings({k: v for k, v in settings.items()
+                                   if v is not None})
+             for scope, settings in updated.items()},
+            acknowledged=True)
+
+    @route('GET', '_nodes/stats', '_nodes/stats/{name}')
+    def node_stats(self, params, body, name=None):
+        stats = {'name': NODE['name'], 'script': dict(self.scripts.stats),
+                 'ingest': self.ingest.node_stats()}
+        return 200, {
+            '_nodes': {'total': 1, 'successful': 1, 'failed': 0},
+            'cluster_name': 'standin',
+            'nodes': {NODE_ID: stats}
+        }
+
+    # stored scripts
+
+    @route('PUT POST', '_scripts/{id}')
+    def put_script(self, params, body, id):
+        script = self.json(body, required=True).get('script')
+        if not isinstance(script, dict) or 'source' not in script:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'must specify source for stored script')
+        if 'lang' not in script:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'must specify lang for stored script')
+        if script['lang'] != 'painless':
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'script_lang not supported [%s]' % script['lang'])
+        compile_script(script['source'])
+        self.scripts.stored[id] = {
+            'lang': script['lang'], 'source': script['source']}
+        return 200, {'acknowledged': True}
+
+    @route('GET', '_scripts/{id}')
+    def get_script(self, params, body, id):
+        if id not in self.scripts.stored:
+            return 404, {'_id': id, 'found': False}
+        return 200, {
+            '_id': id, 'found': True, 'script': self.scripts.stored[id]}
+
+    @route('DELETE', '_scripts/{id}')
+    def delete_script(self, params, body, id):
+        if self.scripts.stored.pop(id, None) is None:
+            raise ApiError(
+                404, 'resource_not_found_exception',
+                'stored script [%s] does not exist' % id)
+        return 200, {'acknowledged': True}
+
+    # ingest pipelines
+
+    @route('GET POST', '_ingest/pipeline/_simulate',
+           '_ingest/pipeline/{id}/_simulate')
+    def simulate_pipeline(self, params, body, id=None):
+        request = self.json(body, required=True)
+        if id is not None:
+            processors, on_failure = self.ingest.pipeline(id)
+        elif 'pipeline' in request:
+            processors, on_failure = self.ingest.compile(request['pipeline'])
+        else:
+            raise ApiError(
+                400, 'parse_exception',
+                '[pipeline] required property is missing')
+        docs = request.get('docs')
+        if not isinstance(docs, list) or not docs:
+            raise ApiError(
+                400, 'parse_exception',
+                'must specify at least one document in [docs]')
+        verbose = as_bool(params.get('verbose'))
+        results = []
+        for entry in docs:
+            if not isinstance(entry, dict) or '_source' not in entry:
+                raise ApiError(
+                    400, 'parse_exception',
+                    '[_source] required property is missing')
+            doc = ingest_document(
+                entry.get('_index', '_index'), entry.get('_id', '_id'),
+                copy.deepcopy(entry['_source']))
+            trace = [] if verbose else None
+            try:
+                run_processors(processors, on_failure, doc, trace)
+            except ApiError as e:
+                if not verbose:
+                    results.append({'error': e.body()['error']})
+                    continue
+            results.append({'processor_results': trace} if verbose
+                           else {'doc': simulated_document(doc)})
+        return 200, {'docs': results}
+
+    @route('PUT', '_ingest/pipeline/{id}')
+    def put_pipeline(self, params, body, id):
+        self.ingest.put(id, self.json(body, required=True))
+        return 200, {'acknowledged': True}
+
+    @route('GET', '_ingest/pipeline', '_ingest/pipeline/{id}')
+    def get_pipeline(self, params, body, id=None):
+        patterns = as_list(id) or ['*']
+        found = {
+            name: definition
+            for name, (definition, _) in self.ingest.pipelines.items()
+            if any(fnmatch(name, pattern) for pattern in patterns)
+        }
+        return (200 if found or id is None else 404), found
+
+    @route('DELETE', '_ingest/pipeline/{id}')
+    def delete_pipeline(self, params, body, id):
+        names = [name for name in self.ingest.pipelines
+                 if any(fnmatch(name, p) for p in as_list(id))]
+        if not names:
+            raise ApiError(
+                404, 'resource_not_found_exception',
+                'pipeline [%s] is missing' % id)
+        for name in names:
+            del self.ingest.pipelines[name]
+            del self.ingest.stats[name]
+        return 200, {'acknowledged': True}
+
+    # indices
+
+    @route('PUT', '{index}')
+    def create_index(self, params, body, index):
+        body = self.json(body)
+        self.create(index, body.get('settings'), body.get('mappings'))
+        return 200, {'acknowledged': True, 'shards_acknowledged': True,
+                     'index': index}
+
+    @route('HEAD', '{index}')
+    def index_exists(self, params, body, index):
+        try:
+            self.resolve(index)
+        except ApiError:
+            return 404, None
+        return 200, None
+
+    @route('GET', '{index}')
+    def get_index(self, params, body, index):
+        return 200, {
+            i.name: {'aliases': {}, 'mappings': i.mappings,
+                     'settings': {'index': dict(
+                         i.settings.get('index', i.settings),
+                         uuid=i.uuid, provided_name=i.name)}}
+            for i in self.resolve(
+                index, as_bool(params.get('ignore_unavailable')))
+        }
+
+    @route('DELETE', '{index}')
+    def delete_index(self, params, body, index):
+        for i in self.resolve(index, as_bool(params.get('ignore_unavailable'))):
+            del self.indices[i.name]
+        return 200, {'acknowledged': True}
+
+    @route('GET', '_stats', '_stats/{name}', '{index}/_stats',
+           '{index}/_stats/{name}')
+    def index_stats(self, params, body, index=None, name=None):
+        metrics = as_list(name) or ['_all']
+        per_index = {}
+        for i in self.resolve(index, as_bool(params.get('ignore_unavailable'))):
+            stats = {
+                metric: values for metric, values in i.stats().items()
+                if '_all' in metrics or metric in metrics
+            }
+            per_index[i.name] = {
+                'uuid': i.uuid, 'primaries': stats, 'total': stats}
+        totals = {}
+        for stats in per_index.values():
+            for metric, values in stats['primaries'].items():
+                for key, value in values.items():
+                    totals.setdefault(metric, {}).setdefault(key, 0)
+                    totals[metric][key] += value
+        return 200, {
+            '_shards': {'total': 2 * len(per_index),
+                        'successful': len(per_index), 'failed': 0},
+            '_all': {'primaries': totals, 'total': totals},
+            'indices': per_index
+        }
+
+    @route('GET POST', '_refresh', '{index}/_refresh')
+    def refresh(self, params, body, index=None):
+        indices = self.resolve(index, as_bool(params.get('ignore_unavailable')))
+        for i in indices:
+            i.refresh()
+        return 200, {'_shards': {'total': 2 * len(indices),
+                                 'successful': len(indices), 'failed': 0}}
+
+    # single document APIs
+
+    @route('PUT POST', '{index}/_doc/{id}', '{index}/_doc')
+    def index_doc(self, params, body, index, id=None, op_type=None):
+        source = self.json(body, required=True)
+        pipeline = params.get('pipeline')
+        if pipeline and pipeline != '_none':
+            index, id, source = self.ingest.process(
+                pipeline, index, id, source)
+        target = self.auto_create(index)
+        op_type = op_type or params.get('op_type', 'index')
+        doc_id = id if id is not None else new_id()
+        doc, result = target.put(
+            doc_id, source, op_type=op_type, **self.conditions(params))
+        forced = self.after_write([target], params)
+        return (201 if result == 'created' else 200), self.write_result(
+            target, doc_id, doc, result, forced)
+
+    @route('PUT POST', '{index}/_create/{id}')
+    def create_doc(self, params, body, index, id):
+        return self.index_doc(params, body, index, id, op_type='create')
+
+    @route('GET HEAD', '{index}/_doc/{id}')
+    def get_doc(self, params, body, index, id):
+        target = self.existing(index)
+        doc = target.docs.get(id) if as_bool(params.get('realtime'), True) \
+            else target.searchable().get(id)
+        return (200 if doc else 404), self.get_result(
+            target, id, doc, self.read_spec(params))
+
+    @route('GET HEAD', '{index}/_source/{id}')
+    def get_source(self, params, body, index, id):
+        target = self.existing(index)
+        doc = target.docs.get(id)
+        if doc is None:
+            raise ApiError(
+                404, 'resource_not_found_exception',
+                'Document not found [%s]/[_doc]/[%s]' % (index, id))
+        spec = source_filter(
+            params.get('_source'), params.get('_source_includes'),
+            params.get('_source_excludes'))
+        return 200, apply_source_filter(doc.source, spec or ([], []))
+
+    @route('DELETE', '{index}/_doc/{id}')
+    def delete_doc(self, params, body, index, id):
+        target = self.auto_create(index)
+        doc, result = target.remove(id, **self.conditions(params))
+        forced = self.after_write([target], params)
+        return (200 if result == 'deleted' else 404), self.write_result(
+            target, id, doc, result, forced)
+
+    @route('POST', '{index}/_update/{id}')
+    def update_doc(self, params, body, index, id):
+        request = self.json(body, required=True)
+        target = self.auto_create(index)
+        doc, result = self.update(target, id, request, self.conditions(params))
+        forced = self.after_write([target], params)
+        return (201 if result == 'created' else 200), self.write_result(
+            target, id, doc, result, forced)
+
+    def update(self, target, doc_id, request, conditions):
+        '''Apply a partial doc or script update, returning (doc, result)'''
+        if 'doc' not in request and 'script' not in request:
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: script or doc is missing;')
+        script = self.script(request['script']) \
+            if 'script' in request else None
+        current = target.docs.get(doc_id)
+        if current is None:
+            if 'upsert' in request or request.get('doc_as_upsert'):
+                source = request.get('upsert', request.get('doc'))
+                if script and request.get('scripted_upsert'):
+                    op, source = self.run_script(
+                        target, doc_id, Doc(source, 0, -1), script)
+                return target.put(doc_id, source, **conditions)
+            raise ApiError(
+                404, 'document_missing_exception',
+                '[_doc][%s]: document missing' % doc_id,
+                index_uuid=target.uuid, shard='0', index=target.name)
+        target.check(doc_id, current, **conditions)
+        if script:
+            op, source = self.run_script(target, doc_id, current, script)
+            if op == 'delete':
+                return target.remove(doc_id)
+            if op == 'none' or op == 'noop':
+                return current, 'noop'
+        else:
+            source = deep_merge(current.source, request['doc'])
+            if request.get('detect_noop', True) and source == current.source:
+                return current, 'noop'
+        return target.put(doc_id, source)
+
+    # multi document APIs
+
+    @route('GET POST', '_mget', '{index}/_mget')
+    def mget(self, params, body, index=None):
+        request = self.json(body, required=True)
+        if 'docs' in request:
+            docs = request['docs']
+        elif 'ids' in request:
+            docs = [{'_id': i} for i in request['ids']]
+        else:
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: no documents to get;')
+        responses = []
+        for position, item in enumerate(docs):
+            name = item.get('_index', index)
+            doc_id = self.doc_id(item.get('_id'))
+            if name is None:
+                raise ApiError(
+                    400, 'action_request_validation_exception',
+                    'Validation Failed: 1: index is missing for doc %d;'
+                    % position)
+            if name not in self.indices:
+                responses.append({
+                    '_index': name, '_type': '_doc', '_id': doc_id,
+                    'error': index_not_found(name).body()['error']})
+                continue
+            target = self.indices[name]
+            spec = self.read_spec(
+                params, item.get('_source'), item.get('stored_fields'))
+            responses.append(self.get_result(
+                target, doc_id, target.docs.get(doc_id), spec))
+        return 200, {'docs': responses}
+
+    @route('PUT POST', '_bulk', '{index}/_bulk')
+    def bulk(self, params, body, index=None):
+        start = time.perf_counter()
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if not text.endswith('\n'):
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'The bulk request must be terminated by a newline [\\n]')
+        lines = text.splitlines()
+        items, touched, position = [], set(), 0
+        ingest_took = None
+        while position < len(lines):
+            if not lines[position].strip():
+                position += 1
+                continue
+            action = self.json(lines[position])
+            position += 1
+            if len(action) != 1 or next(iter(action)) not in (
+                    'index', 'create', 'update', 'delete'):
+                raise ApiError(
+                    400, 'illegal_argument_exception',
+                    'Malformed action/metadata line [%d], expected one of '
+                    '[create, delete, index, update] but found [%s]'
+                    % (position, next(iter(action), '')))
+            op, meta = next(iter(action.items()))
+            source = None
+            if op != 'delete':
+                if position >= len(lines):
+                    raise ApiError(
+                        400, 'action_request_validation_exception',
+                        'Validation Failed: 1: no requests added;')
+                source = self.json(lines[position])
+                position += 1
+            name = meta.get('_index', index)
+            pipeline = meta.get('pipeline', params.get('pipeline'))
+            if op in ('index', 'create') and pipeline and pipeline != '_none':
+                ingest_start = time.perf_counter()
+                try:
+                    name, doc_id, source = self.ingest.process(
+                        pipeline, name, meta.get('_id'), source)
+                except ApiError as e:
+                    items.append({op: {
+                        '_index': name, '_type': '_doc',
+                        '_id': meta.get('_id'), 'status': e.status,
+                        'error': e.body()['error']}})
+                    continue
+                finally:
+                    ingest_took = (ingest_took or 0) + (
+                        time.perf_counter() - ingest_start)
+                meta = dict(meta, _index=name, _id=doc_id)
+            target = self.auto_create(name)
+            touched.add(target)
+            items.append({op: self.bulk_item(target, op, meta, source)})
+        self.after_write(touched, params)
+        response = {
+            'took': int((time.perf_counter() - start) * 1000),
+            'errors': any('error' in next(iter(i.values())) for i in items),
+            'items': items
+        }
+        if ingest_took is not None:
+            response['ingest_took'] = int(ingest_took * 1000)
+        return 200, response
+
+    def bulk_item(self, target, op, meta, source):
+        doc_id = self.doc_id(meta['_id']) if meta.get('_id') is not None \
+            else new_id()
+        conditions = {
+            'if_seq_no': meta.get('if_seq_no'),
+            'if_primary_term': meta.get('if_primary_term')
+        }
+        try:
+            if op == 'delete':
+                doc, result = target.remove(doc_id, **conditions)
+            elif op == 'update':
+                doc, result = self.update(target, doc_id, source, conditions)
+            else:
+                doc, result = target.put(
+                    doc_id, source, op_type=op, **conditions)
+        except ApiError as e:
+            return {'_index': target.name, '_type': '_doc', '_id': doc_id,
+                    'status': e.status, 'error': e.body()['error']}
+        item = self.write_result(target, doc_id, doc, result)
+        item['status'] = {'created': 201, 'not_found': 404}.get(result, 200)
+        return item
+
+    def matching(self, indices, request):
+        '''(index, id, doc) of searchable docs matching a request's query,
+        checked by check_query when the request was parsed'''
+        query = request.get('query')
+        return [
+            (index, doc_id, doc)
+            for index in indices
+            for doc_id, doc in list(index.searchable().items())
+            if matches(query, doc_id, doc.source)
+        ]
+
+    def bulk_by_scroll(self, params, request, action, description, indices,
+                       hits, apply, keys, batch_size, written=None):
+        '''Run `apply(target, doc_id, seen)` over the hits of `indices` as a
+        task, in batches, on `slices` parallel slices throttled together to
+        `requests_per_second`, then refresh the `written` indices (default:
+        those read) as requested. Returns the task when the request waits
+        for its completion, the task id otherwise'''
+        rps = float(params.get('requests_per_second', -1))
+        if rps <= 0 and rps != -1:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                '[requests_per_second] must be a float greater than 0. '
+                'Use -1 to disable throttling.')
+        slices = params.get('slices', '1')
+        if slices == 'auto':
+            slices = min([
+                int(i.setting('number_of_shards', 1)) for i in indices] or [1])
+        slices = int(slices)
+        if slices < 1:
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: [slices] must be at least 1, was [%d];'
+                % slices)
+        task = self.new_task(action, description)
+        parts = [hits]
+        if slices > 1:
+            parts = [[] for _ in range(slices)]
+            for hit in hits:
+                parts[zlib.crc32(hit[1].encode('utf-8')) % slices].append(hit)
+            task.children = [
+                self.new_task(action, description, task) for _ in parts]
+            rps = rps / slices if rps > 0 else rps
+        for position, (worker, part) in enumerate(
+                zip(task.children or [task], parts)):
+            worker.status = self.scroll_status(
+                len(part), rps, position if task.children else None)
+        threading.Thread(
+            target=self.run_bulk_by_scroll, name=task.id, daemon=True,
+            args=(task, parts, apply, keys, batch_size, rps,
+                  request.get('conflicts', params.get('conflicts')) == 'proceed',
+                  written or indices, params)).start()
+        if as_bool(params.get('wait_for_completion'), True):
+            return task
+        return 200, {'task': task.id}
+
+    def scroll_status(self, total, rps, slice_id=None):
+        status = {} if slice_id is None else {'slice_id': slice_id}
+        status.update({
+            'total': total,
+            'updated': 0,
+            'created': 0,
+            'deleted': 0,
+            'batches': 0,
+            'version_conflicts': 0,
+            'noops': 0,
+            'retries': {'bulk': 0, 'search': 0},
+            'throttled_millis': 0,
+            'requests_per_second': rps,
+            'throttled_until_millis': 0
+        })
+        return status
+
+    def run_bulk_by_scroll(self, task, parts, apply, keys, batch_size, rps,
+                           proceed, indices, params):
+        workers = task.children or [task]
+        outcomes = [None] * len(workers)
+
+        def run(position):
+            try:
+                outcomes[position] = self.run_slice(
+                    workers[position], parts[position], apply, batch_size,
+                    rps, proceed)
+            except Exception as e:
+                outcomes[position] = e
+            if task.children:
+                workers[position].finish()
+        threads = [
+            threading.Thread(target=run, args=(position,), daemon=True)
+            for position in range(len(workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        errors = [e for e in outcomes if isinstance(e, Exception)]
+        if errors:
+            error = errors[0] if isinstance(errors[0], ApiError) \
+                else ApiError(500, 'exception', repr(errors[0]))
+            task.finish((error.status, error.body()))
+            return
+        failures = [failure for outcome in outcomes for failure in outcome]
+        with self.lock:
+            self.after_write(indices, params)
+        task.finish(((409 if failures else 200),
+                     self.bulk_by_scroll_response(task, keys, failures)))
+
+    def run_slice(self, task, hits, apply, batch_size, rps, proceed):
+        '''Work through the hits of one slice, returning its failures'''
+        status = task.status
+        failures = []
+        for offset in range(0, len(hits), batch_size):
+            if offset and rps > 0:
+                delay = batch_size / rps - (time.monotonic() - started)
+                if delay > 0:
+                    status['throttled_until_millis'] = int(delay * 1000)
+                    task.cancelled.wait(delay)
+                    status['throttled_millis'] += int(delay * 1000)
+                    status['throttled_until_millis'] = 0
+            if task.cancelled.is_set():
+                break
+            started = time.monotonic()
+            with self.lock:
+                for target, doc_id, seen in hits[offset:offset + batch_size]:
+                    try:
+                        result = apply(target, doc_id, seen)
+                    except ApiError as e:
+                        if e.status != 409:
+                            raise
+                        status['version_conflicts'] += 1
+                        if not proceed:
+                            failures.append({
+                                'index': e.extra.get('index', target.name),
+                                'type': '_doc',
+                                'id': doc_id, 'cause': e.body()['error'],
+                                'status': 409})
+                            break
+                        continue
+                    status[result] += 1
+            status['batches'] += 1
+            if failures:
+                break
+        return failures
+
+    def bulk_by_scroll_response(self, task, keys, failures):
+        status = task.current_status()
+        response = {
+            'took': int((time.monotonic() - task.start) * 1000),
+            'timed_out': False,
+            'total': status['total'],
+        }
+        response.update((key, status[key]) for key in keys)
+        response.update((key, status[key]) for key in (
+            'batches', 'version_conflicts', 'noops', 'retries',
+            'throttled_millis', 'requests_per_second',
+            'throttled_until_millis'))
+        if task.cancelled.is_set():
+            response['canceled'] = 'by user request'
+        if task.children:
+            response['slices'] = status['slices']
+        response['failures'] = failures
+        return response
+
+    def by_query(self, params, body, index, action, name, apply, keys):
+        '''Shared implementation of delete_by_query and update_by_query'''
+        request = self.json(body)
+        check_query(request.get('query'))
+        indices = self.resolve(index, as_bool(params.get('ignore_unavailable')))
+        hits = self.matching(indices, request)
+        max_docs = request.get('max_docs', params.get('max_docs'))
+        if max_docs is not None:
+            hits = hits[:int(max_docs)]
+        return self.bulk_by_scroll(
+            params, request, action,
+            '%s [%s]' % (name, ', '.join(i.name for i in indices)),
+            indices, hits, apply, keys, int(params.get('scroll_size', 1000)))
+
+    @route('POST', '{index}/_delete_by_query')
+    def delete_by_query(self, params, body, index):
+        def apply(target, doc_id, seen):
+            target.remove(doc_id, if_seq_no=seen.seq_no,
+                          if_primary_term=PRIMARY_TERM)
+            return 'deleted'
+        return self.by_query(
+            params, body, index, 'indices:data/write/delete/byquery',
+            'delete-by-query', apply, ('deleted',))
+
+    @route('POST', '{index}/_update_by_query')
+    def update_by_query(self, params, body, index):
+        request = self.json(body)
+        script = self.script(request['script']) \
+            if 'script' in request else None
+
+        def apply(target, doc_id, seen):
+            current = target.docs.get(doc_id)
+            target.check(doc_id, current, if_seq_no=seen.seq_no,
+                         if_primary_term=PRIMARY_TERM)
+            source = current.source
+            if script:
+                op, source = self.run_script(target, doc_id, current, script)
+                if op in ('noop', 'none'):
+                    return 'noops'
+                if op == 'delete':
+                    target.remove(doc_id)
+                    return 'deleted'
+            target.put(doc_id, source)
+            return 'updated'
+        return self.by_query(
+            params, body, index, 'indices:data/write/update/byquery',
+            'update-by-query', apply, ('updated', 'deleted'))
+
+    @route('POST', '_reindex')
+    def reindex(self, params, body):
+        request = self.json(body, required=True)
+        source = request.get('source', {})
+        dest = request.get('dest', {})
+        names = as_list(source.get('index'))
+        if 'remote' in source:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                '[remote] reindex is not supported by the stand-in')
+        if not names or not dest.get('index'):
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: use _all if you really want to copy '
+                'from all existing indexes;')
+        if dest['index'] in names:
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: reindex cannot write into an index '
+                'its reading from [%s];' % dest['index'])
+        check_query(source.get('query'))
+        indices = [i for name in names for i in self.resolve(name)]
+        hits = self.matching(indices, source)
+        max_docs = request.get('max_docs', request.get('size'))
+        if max_docs is not None:
+            hits = hits[:int(max_docs)]
+        script = self.script(request['script']) \
+            if 'script' in request else None
+        spec = source_filter(source.get('_source'))
+        target = self.auto_create(dest['index'])
+        op_type = dest.get('op_type', 'index')
+
+        def apply(origin, doc_id, doc):
+            copied = apply_source_filter(doc.source, spec or ([], []))
+            if script:
+                op, copied = self.run_script(
+                    origin, doc_id, Doc(copied, doc.version, doc.seq_no),
+                    script)
+                if op in ('noop', 'none'):
+                    return 'noops'
+            _, result = target.put(doc_id, copied, op_type=op_type)
+            return result
+        return self.bulk_by_scroll(
+            params, request, 'indices:data/write/reindex',
+            'reindex from [%s] to [%s][_doc]' % (
+                ', '.join(names), dest['index']),
+            indices, hits, apply, ('updated', 'created', 'deleted'),
+            int(source.get('size', 1000)), written=[target])
+
+    # tasks
+
+    def new_task(self, action, description, parent=None):
+        self.task_count += 1
+        task = Task(self.task_count, action, description, parent)
+        self.tasks[task.id] = task
+        return task
+
+    def forget(self, task):
+        '''Drop a task whose result was answered to the waiting request'''
+        with self.lock:
+            for done in [task] + task.children:
+                self.tasks.pop(done.id, None)
+
+    def task(self, task_id):
+        if task_id not in self.tasks:
+            raise ApiError(
+                404, 'resource_not_found_exception',
+                "task [%s] isn't running and hasn't stored its results"
+                % task_id)
+        return self.tasks[task_id]
+
+    def task_list(self, tasks, detailed=False):
+        return {'nodes': {NODE_ID: dict(NODE, tasks={
+            task.id: task.info(detailed) for task in tasks})}}
+
+    @route('GET', '_tasks')
+    def list_tasks(self, params, body):
+        actions = as_list(params.get('actions')) or ['*']
+        parent = params.get('parent_task_id')
+        return 200, self.task_list([
+            task for task in self.tasks.values()
+            if not task.done.is_set()
+            and any(fnmatch(task.action, action) for action in actions)
+            and (not parent or task.parent and task.parent.id == parent)
+        ], as_bool(params.get('detailed')))
+
+    @route('GET', '_tasks/{id}')
+    def get_task(self, params, body, id):
+        task = self.task(id)
+        response = {'completed': task.done.is_set(), 'task': task.info()}
+        if task.done.is_set():
+            status, payload = task.result
+            if 'error' in payload:
+                response['error'] = payload['error']
+            else:
+                response['response'] = payload
+        return 200, response
+
+    @route('POST', '_tasks/{id}/_cancel')
+    def cancel_task(self, params, body, id):
+        task = self.task(id)
+        if task.done.is_set():
+            return 200, self.task_list([])
+        for cancelled in [task] + task.children:
+            cancelled.cancelled.set()
+        return 200, self.task_list([task])
+
+    # term vectors
+
+    def term_vectors(self, target, doc_id, options, artificial=None):
+        start = time.perf_counter()
+        if artificial is not None:
+            doc = Doc(artificial, 0, -1)
+        elif as_bool(options.get('realtime'), True):
+            doc = target.docs.get(doc_id)
+        else:
+            doc = target.searchable().get(doc_id)
+        response = {'_index': target.name, '_type': '_doc'}
+        if doc_id is not None:
+            response['_id'] = doc_id
+        response.update({
+            '_version': doc.version if doc else 0,
+            'found': doc is not None,
+            'took': 0})
+        if doc is None:
+            return response
+        fields = as_list(options.get('fields')) or ['*']
+        positions = as_bool(options.get('positions'), True)
+        offsets = as_bool(options.get('offsets'), True)
+        term_statistics = as_bool(options.get('term_statistics'), False)
+        field_statistics = as_bool(options.get('field_statistics'), True)
+        vectors = {}
+        for field in sorted(text_fields(doc.source)):
+            if not any(fnmatch(field, pattern) for pattern in fields):
+                continue
+            terms = term_freqs(doc.source, field)
+            if not terms:
+                continue
+            stats = target.field_stats(field) \
+                if term_statistics or field_statistics else None
+            entry = {}
+            if field_statistics:
+                entry['field_statistics'] = {
+                    'sum_doc_freq': stats['sum_doc_freq'],
+                    'doc_count': stats['doc_count'],
+                    'sum_ttf': stats['sum_ttf']
+                }
+            entry['terms'] = {}
+            for term, tokens in terms.items():
+                info = {}
+                if term_statistics:
+                    doc_freq, ttf = stats['terms'].get(term, (0, 0))
+                    info.update({'doc_freq': doc_freq, 'ttf': ttf})
+                info['term_freq'] = len(tokens)
+                if positions or offsets:
+                    info['tokens'] = [
+                        dict(
+                            {'position': p} if positions else {},
+                            **({'start_offset': s, 'end_offset': e}
+                               if offsets else {}))
+                        for p, s, e in tokens
+                    ]
+                entry['terms'][term] = info
+            vectors[field] = entry
+        response['term_vectors'] = vectors
+        response['took'] = int((time.perf_counter() - start) * 1000)
+        return response
+
+    def term_vector_options(self, params, request):
+        options = {k: v for k, v in params.items()}
+        options.update(request)
+        return options
+
+    @route('GET POST', '{index}/_termvectors/{id}', '{index}/_termvectors')
+    def termvectors(self, params, body, index, id=None):
+        request = self.json(body)
+        target = self.existing(index)
+        if id is None and 'doc' not in request:
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: id or doc is missing;')
+        return 200, self.term_vectors(
+            target, id, self.term_vector_options(params, request),
+            request.get('doc'))
+
+    @route('GET POST', '_mtermvectors', '{index}/_mtermvectors')
+    def mtermvectors(self, params, body, index=None):
+        request = self.json(body, required=True)
+        defaults = self.term_vector_options(
+            params, request.get('parameters', {}))
+        if 'docs' in request:
+            docs = request['docs']
+        else:
+            docs = [{'_id': i} for i in request.get('ids', [])]
+        responses = []
+        for item in docs:
+            name = item.get('_index', index)
+            doc_id = self.doc_id(item['_id']) if '_id' in item else None
+            if name not in self.indices:
+                responses.append({
+                    '_index': name, '_type': '_doc', '_id': doc_id,
+                    'error': index_not_found(name).body()['error']})
+                continue
+            options = dict(defaults, **{
+                k: v for k, v in item.items()
+                if k not in ('_index', '_id', 'doc')})
+            responses.append(self.term_vectors(
+                self.indices[name], doc_id, options, item.get('doc')))
+        return 200, {'docs': responses}
+
+    # search
+
+    @route('GET POST', '_count', '{index}/_count')
+    def count(self, params, body, index=None):
+        request = self.json(body)
+        check_query(request.get('query'))
+        indices = self.resolve(index, as_bool(params.get('ignore_unavailable')))
+        if 'q' in params:
+            request = {'query': query_string(params['q'])}
+        return 200, {
+            'count': len(self.matching(indices, request)),
+            '_shards': dict(SEARCH_SHARDS, total=len(indices),
+                            successful=len(indices))
+        }
+
+    @route('GET POST', '_search', '{index}/_search')
+    def search(self, params, body, index=None):
+        start = time.perf_counter()
+        request = self.json(body)
+        check_query(request.get('query'))
+        indices = self.resolve(index, as_bool(params.get('ignore_unavailable')))
+        if 'q' in params:
+            request['query'] = query_string(params['q'])
+        hits = self.matching(indices, request)
+        if 'slice' in request:
+            hits = self.slice_hits(hits, request['slice'], params)
+        sort = self.sort_spec(request.get('sort', params.get('sort')))
+        if sort:
+            hits = self.sorted_hits(hits, sort)
+        if 'search_after' in request:
+            after = [compare_key(v) for v in request['search_after']]
+            hits = [
+                hit for hit in hits
+                if self.after(self.sort_values(hit, sort), after, sort)
+            ]
+        offset = int(request.get('from', params.get('from', 0)))
+        size = int(request.get('size', params.get('size', 10)))
+        context = {
+            'hits': hits,
+            'offset': offset,
+            'size': size,
+            'request': request,
+            'sort': sort,
+            'spec': self.read_spec(
+                params, request.get('_source'), request.get('stored_fields')),
+            'shards': len(indices)
+        }
+        response = self.search_page(context, start)
+        if 'scroll' in params:
+            self.scroll_count += 1
+            scroll_id = base64.urlsafe_b64encode(
+                ('scroll:%d' % self.scroll_count).encode('ascii')).decode()
+            context['keep_alive'] = parse_interval(params['scroll'])
+            context['expires'] = time.monotonic() + context['keep_alive']
+            self.scrolls[scroll_id] = context
+            response = dict({'_scroll_id': scroll_id}, **response)
+        return 200, response
+
+    def slice_hits(self, hits, spec, params):
+        '''The hits of one slice of a sliced scroll, split by `_id` like the
+        slices of the by-query APIs'''
+        if 'scroll' not in params:
+            raise ApiError(
+                400, 'action_request_validation_exception',
+                'Validation Failed: 1: using [slice] is only allowed in a '
+                'scroll context;')
+        slice_id, slices = int(spec.get('id', -1)), int(spec.get('max', 0))
+        if slices <= 1:
+            raise ApiError(
+                400, 'illegal_argument_exception', 'max must be greater than 1')
+        if slice_id < 0:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'id must be greater than or equal to 0')
+        if slice_id >= slices:
+            raise ApiError(
+                400, 'illegal_argument_exception',
+                'max must be greater than id')
+        return [
+            hit for hit in hits
+            if zlib.crc32(hit[1].encode('utf-8')) % slices == slice_id]
+
+    def search_page(self, context, start):
+        '''Next page of the hits of a search, advancing its offset'''
+        hits, sort, request = context['hits'], context['sort'], context['request']
+        page = []
+        for hit in hits[context['offset']:context['offset'] + context['size']]:
+            target, doc_id, doc = hit
+            entry = {'_index': target.name, '_type': '_doc', '_id': doc_id,
+                     '_score': None if sort else 1.0}
+            if request.get('seq_no_primary_term'):
+                entry.update({'_seq_no': doc.seq_no,
+                              '_primary_term': PRIMARY_TERM})
+            if request.get('version'):
+                entry['_version'] = doc.version
+            source = apply_source_filter(doc.source, context['spec'])
+            if source is not None:
+                entry['_source'] = source
+            if sort:
+                entry['sort'] = self.sort_values(hit, sort)
+            page.append(entry)
+        context['offset'] += context['size']
+        return {
+            'took': int((time.perf_counter() - start) * 1000),
+            'timed_out': False,
+            '_shards': dict(SEARCH_SHARDS, total=context['shards'],
+                            successful=context['shards']),
+            'hits': {
+                'total': {'value': len(hits), 'relation': 'eq'},
+                'max_score': None if sort or not hits else 1.0,
+                'hits': page
+            }
+        }
+
+    def scroll_context(self, scroll_id):
+        context = self.scrolls.get(scroll_id)
+        if context is None or context['expires'] < time.monotonic():
+            self.scrolls.pop(scroll_id, None)
+            raise ApiError(
+                404, 'search_context_missing_exception',
+                'No search context found for id [%s]' % scroll_id)
+        return context
+
+    @route('GET POST', '_search/scroll', '_search/scroll/{id}')
+    def scroll(self, params, body, id=None):
+        start = time.perf_counter()
+        request = self.json(body)
+        scroll_id = request.get('scroll_id', params.get('scroll_id', id))
+        context = self.scroll_context(scroll_id)
+        keep_alive = request.get('scroll', params.get('scroll'))
+        if keep_alive:
+            context['keep_alive'] = parse_interval(keep_alive)
+        context['expires'] = time.monotonic() + context['keep_alive']
+        return 200, dict(
+            {'_scroll_id': scroll_id}, **self.search_page(context, start))
+
+    @route('DELETE', '_search/scroll', '_search/scroll/{id}')
+    def clear_scroll(self, params, body, id=None):
+        if id == '_all':
+            freed, self.scrolls = len(self.scrolls), {}
+            return 200, {'succeeded': True, 'num_freed': freed}
+        ids = as_list(self.json(body).get('scroll_id', params.get(
+            'scroll_id', id)))
+        freed = [
+            scroll_id for scroll_id in ids
+            if self.scrolls.pop(scroll_id, None) is not None]
+        return (200 if len(freed) == len(ids) else 404), {
+            'succeeded': True, 'num_freed': len(freed)}
+
+    def sort_spec(self, sort):
+        '''Normalize a sort definition into (field, descending) pairs'''
+        if not sort:
+            return []
+        if isinstance(sort, str):
+            sort = [
+                {s.split(':')[0]: s.split(':')[1]} if ':' in s else s
+                for s in sort.split(',')]
+        if isinstance(sort, dict):
+            sort = [sort]
+        spec = []
+        for item in sort:
+            if isinstance(item, str):
+                field, order = item, 'desc' if item == '_score' else 'asc'
+            else:
+                (field, order), = item.items()
+                if isinstance(order, dict):
+                    order = order.get('order', 'asc')
+            spec.append((field, order == 'desc'))
+        return spec
+
+    def sort_values(self, hit, sort):
+        target, doc_id, doc = hit
+        values = []
+        for field, _ in sort:
+            if field == '_id':
+                values.append(doc_id)
+            elif field == '_doc':
+                values.append(doc.seq_no)
+            elif field == '_score':
+                values.append(1.0)
+            else:
+                found, keyword = field_values(doc.source, field)
+                if any(isinstance(v, str) for v in found) and not keyword:
+                    raise ApiError(
+                        400, 'illegal_argument_exception',
+                        'Text fields are not optimised for operations that '
+                        'require per-document field data like aggregations '
+                        'and sorting, so these operations are disabled by '
+                        'default. Please use a keyword field instead. '
+                        'Alternatively, set fielddata=true on [%s] in order '
+                        'to load field data by uninverting the inverted '
+                        'index. Note that this can use significant memory.'
+                        % field)
+                values.append(min(found, key=compare_key) if found else None)
+        return values
+
+    def sorted_hits(self, hits, sort):
+        keyed = [(self.sort_values(hit, sort), hit) for hit in hits]
+        for position in reversed(range(len(sort))):
+            keyed.sort(key=lambda pair: compare_key(pair[0][position]),
+                       reverse=sort[position][1])
+        return [hit for _, hit in keyed]
+
+    def after(self, values, after, sort):
+        for value, bound, (_, descending) in zip(values, after, sort):
+            key = compare_key(value)
+            if key != bound:
+                return key < bound if descending else key > bound
+        return False
+
+
+def query_string(q):
+    '''Translate the `field:value` form of the `q` parameter'''
+    if ':' in q:
+        field, value = q.split(':', 1)
+        return {'match': {field: value}}
+    return {'match_all': {}}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/1.1 front end of a DocumentStore, keeping connections alive.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'standin/' + VERSION['number']
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b''.join(chunks)
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def dispatch(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        status, payload = self.server.store.handle(
+            self.command, url.path, params, self.read_body())
+        data = b'' if payload is None else json.dumps(
+            payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('content-type', 'application/json; charset=UTF-8')
+        self.send_header('content-length', str(len(data)))
+        if self.close_connection:
+            # Like Elasticsearch, confirm a `connection: close` request.
+            self.send_header('connection', 'close')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = dispatch
+
+
+class StandinServer(object):
+    """
+    Stand-in node serving a DocumentStore from a background thread.
+    Port 0 picks a free port.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, store=None):
+        self.store = store or DocumentStore()
+        self.httpd = ThreadingHTTPServer((host, port), RequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = self.store
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name='standin', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+_shared = None
+
+
+def shared_standin():
+    '''Stand-in server shared by everything running in this process'''
+    global _shared
+    if _shared is None:
+        _shared = StandinServer().start()
+    return _shared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    args = parser.parse_args(argv)
+    server = StandinServer(args.host, args.port)
+    print('Stand-in Elasticsearch %s listening on http://%s:%d' % (
+        VERSION['number'], server.host, server.port))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Read-through cache of repeated document reads.
+
+Tests often read the same document more than once. With a ReadCache
+SuiteTransport answers a request identical to an earlier one (same method,
+path, parameters and body) from memory instead of the cluster, as long as
+none of the indices it addresses was written to since:
+
+    ES_READ_CACHE=1 python -m unittest tests_es_py.py
+
+Only real-time reads are cached (get, exists, get_source, mget and term
+vectors), as the result of a search depends on when the index was last
+refreshed. Any other request that isn't a GET or HEAD counts as a write
+and invalidates every entry of the indices it addresses, or all entries
+when they aren't known. Writes are invalidated both when they are sent and
+when they complete, and a response is only stored if nothing was
+invalidated while it was in flight, so concurrent requests never leave a
+stale entry behind. Indices written to by a task running in the background
+(`wait_for_completion=false`) aren't cached until they are deleted.
+
+Hits and misses are counted per endpoint in CACHE_STATS and reported at
+the end of the run.
+"""
+import copy
+import hashlib
+import json
+import sys
+import threading
+
+from suite_timing import endpoint_of_request
+from suite_transport import api_of
+
+# Methods of the real-time read APIs that are cached.
+CACHED_APIS = {
+    '_doc': ('GET', 'HEAD'),
+    '_source': ('GET', 'HEAD'),
+    '_termvectors': ('GET', 'POST'),
+    '_mget': ('GET', 'POST'),
+    '_mtermvectors': ('GET', 'POST'),
+}
+# APIs that read or inspect the cluster with methods other than GET and
+# HEAD. A refresh invalidates, term statistics depend on it.
+READ_APIS = (
+    '_search', '_msearch', '_count', '_tasks', '_field_caps', '_validate',
+    '_explain', '_analyze')
+# Writes that return before they are done when asked to.
+BACKGROUND_APIS = ('_delete_by_query', '_update_by_query', '_reindex')
+
+
+def body_digest(body):
+    '''Hash of a request body, whatever form the client passed it in'''
+    if body is None:
+        return None
+    if isinstance(body, (dict, list)):
+        data = json.dumps(body, sort_keys=True, default=str).encode('utf-8')
+    elif isinstance(body, str):
+        data = body.encode('utf-8')
+    else:
+        data = bytes(body)
+    return hashlib.sha1(data).hexdigest()
+
+
+def request_key(method, url, params, body):
+    '''Cache key of a request'''
+    return (
+        method,
+        url,
+        tuple(sorted(
+            (key, str(value)) for key, value in (params or {}).items())),
+        body_digest(body))
+
+
+def is_cached(method, url, params):
+    api = api_of(url)
+    if method not in CACHED_APIS.get(api, ()):
+        return False
+    return str((params or {}).get('realtime', 'true')).lower() != 'false'
+
+
+def is_write(method, url):
+    api = api_of(url)
+    return method not in ('GET', 'HEAD') and api not in READ_APIS and (
+        method not in CACHED_APIS.get(api, ()))
+
+
+def runs_in_background(url, params):
+    return api_of(url) in BACKGROUND_APIS and str(
+        (params or {}).get('wait_for_completion', 'true')).lower() == 'false'
+
+
+class CacheStats(object):
+    """
+    Hits, misses and invalidated entries of read caches, in total and per
+    endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {'hits': 0, 'misses': 0, 'invalidated': 0}
+            self.endpoints = {}
+
+    def looked_up(self, endpoint, hit):
+        with self.lock:
+            key = 'hits' if hit else 'misses'
+            self.counters[key] += 1
+            self.endpoints.setdefault(
+                endpoint, {'hits': 0, 'misses': 0})[key] += 1
+
+    def invalidated(self, entries):
+        with self.lock:
+            self.counters['invalidated'] += entries
+
+    def add(self, snapshot):
+        '''Add up the counters of another process'''
+        with self.lock:
+            for key in self.counters:
+                self.counters[key] += snapshot[key]
+            for endpoint, counters in snapshot['endpoints'].items():
+                own = self.endpoints.setdefault(
+                    endpoint, {'hits': 0, 'misses': 0})
+                own['hits'] += counters['hits']
+                own['misses'] += counters['misses']
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters, endpoints={
+                endpoint: dict(counters)
+                for endpoint, counters in self.endpoints.items()})
+
+    def format(self):
+        stats = self.snapshot()
+        looked_up = stats['hits'] + stats['misses']
+        lines = ['Read cache: %d hits, %d misses (%.1f%% hit rate), '
+                 '%d entries invalidated' % (
+                     stats['hits'], stats['misses'],
+                     100.0 * stats['hits'] / looked_up if looked_up else 0,
+                     stats['invalidated'])]
+        for endpoint, counters in sorted(
+                stats['endpoints'].items(),
+                key=lambda item: item[1]['hits'], reverse=True):
+            lines.append('  %6d hits %6d misses  %s' % (
+                counters['hits'], counters['misses'], endpoint))
+        return '\n'.join(lines)
+
+
+CACHE_STATS = CacheStats()
+
+
+def report_cache_stats():
+    sys.stderr.write('\n%s\n' % CACHE_STATS.format())
+
+
+class ReadCache(object):
+    """
+    Responses of real-time reads, dropped as soon as one of the indices
+    they were read from is written to.
+    """
+
+    def __init__(self, stats=CACHE_STATS):
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.entries = {}
+        # Keys of the entries read from every index.
+        self.keys_by_index = {}
+        # Indices written to by background tasks.
+        self.volatile = set()
+        # Bumped by every invalidation.
+        self.generation = 0
+
+    def lookup(self, method, url, params, body, indices):
+        '''Look up a request addressed to `indices`. Returns whether it
+        was a hit, the cached response and a callback taking the response
+        of the request otherwise, which stores it or invalidates the
+        indices of a write'''
+        if is_write(method, url):
+            with self.lock:
+                if api_of(url) is None and method == 'DELETE':
+                    self.volatile -= indices
+                elif runs_in_background(url, params):
+                    self.volatile |= indices
+            self.invalidate(indices)
+            return False, None, lambda response: self.invalidate(indices)
+        if not is_cached(method, url, params) or not indices or (
+                indices & self.volatile):
+            return False, None, lambda response: None
+        key = request_key(method, url, params, body)
+        with self.lock:
+            entry = self.entries.get(key)
+            generation = self.generation
+        self.stats.looked_up(
+            endpoint_of_request(method, url), entry is not None)
+        if entry is not None:
+            return True, copy.deepcopy(entry[1]), None
+        return False, None, lambda response: self.store(
+            key, indices, generation, response)
+
+    def store(self, key, indices, generation, response):
+        '''Keep the response of a miss, unless anything was invalidated
+        since it was looked up'''
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (indices, copy.deepcopy(response))
+            for index in indices:
+                self.keys_by_index.setdefault(index, set()).add(key)
+
+    def invalidate(self, indices=None):
+        '''Drop the entries of `indices`, or all entries when no index is
+        given'''
+        with self.lock:
+            self.generation += 1
+            if not indices:
+                dropped = len(self.entries)
+                self.entries.clear()
+                self.keys_by_index.clear()
+                self.volatile.clear()
+            else:
+                dropped = 0
+                for index in indices:
+                    for key in self.keys_by_index.pop(index, ()):
+                        if self.entries.pop(key, None) is not None:
+                            dropped += 1
+        self.stats.invalidated(dropped)
+
+    def forget(self, indices):
+        '''Invalidate deleted indices, which are no longer volatile'''
+        with self.lock:
+            self.volatile -= set(indices)
+        self.invalidate(indices)
@@ -0,0 +1,70 @@
+"""
+Base class of the suite's test cases.
+
+Connects the class to the cluster through SuiteTransport and makes sure
+each test starts without the indices the previous one touched.
+
+Writes are made visible to search by a single refresh before the first
+search dependent call of a test (the `batched` mode of SuiteTransport).
+ES_VISIBILITY picks another mode for the whole run, the `visibility`
+attribute one for a test case class. Tests reading through search after
+writing refresh on their own, so they pass in the `explicit` mode too.
+"""
+import os
+import unittest
+
+from elasticsearch import Elasticsearch
+from elasticsearch.client import IndicesClient
+
+from suite_config import client_options, es_hosts, read_cache
+from suite_memory import MEMORY_LOG
+from suite_timing import REQUEST_LOG
+from suite_transport import SuiteTransport
+
+
+class SuiteTestCase(unittest.TestCase):
+
+    # Every index the tests of the class write to.
+    indices = ()
+    # How writes of the tests become visible to search.
+    visibility = os.environ.get('ES_VISIBILITY', 'batched')
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Drop leftovers of the class indices once, in a single request.
+        Indices owned by anyone else on the cluster are left alone.
+        ES_INDEX_PREFIX namespaces all indices, see run_parallel.py; the
+        connection and the read cache are set up as described in
+        suite_config.py.
+        """
+        REQUEST_LOG.test = '%s.%s' % (cls.__module__, cls.__qualname__)
+        cls.es = Elasticsearch(
+            es_hosts(),
+            transport_class=SuiteTransport,
+            index_prefix=os.environ.get('ES_INDEX_PREFIX', ''),
+            read_cache=read_cache(),
+            **client_options())
+        cls.indices_client = IndicesClient(client=cls.es)
+        if cls.indices:
+            cls.indices_client.delete(
+                index=','.join(cls.indices),
+                ignore_unavailable=True)
+
+    def setUp(self):
+        """
+        Start tracking the indices touched by the new test, attribute its
+        requests and memory to it and apply its visibility mode.
+        """
+        REQUEST_LOG.test = self.id()
+        MEMORY_LOG.start_test(self.id())
+        self.es.transport.visibility = self.visibility
+        self.es.transport.touched_indices.clear()
+
+    def tearDown(self):
+        """
+        Make sure every index the test touched is deleted before the next
+        test is run, and close the memory account of the test.
+        """
+        self.es.transport.drop_touched_indices()
+        MEMORY_LOG.stop_test()
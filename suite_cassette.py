@@ -0,0 +1,258 @@
+"""
+Recording of the requests of a run, and their replay without a cluster.
+
+With ES_RECORD set, every request the suite's connections send is written
+to a cassette at that path at the end of the run, together with the
+status and the body of its response. With ES_REPLAY set, no connection to
+a cluster is made at all: every request is answered from the cassette, so
+the whole suite runs in memory, through the same client code:
+
+    ES_RECORD=suite.cassette python -m unittest tests_es_py.py
+    ES_REPLAY=suite.cassette python -m unittest tests_es_py.py
+
+Requests are matched strictly, per test: a request is answered with the
+first recorded response of the same test whose request has the same
+method, path, parameters and body (compared as JSON, so only the encoding
+may differ). A request matching none fails the test with a diff against
+the next recorded request of the test. Recorded requests never replayed
+are reported at the end of the run.
+
+The cassette is gzipped JSON, one line per request. Replay with the same
+settings (ES_INDEX_PREFIX, ES_VISIBILITY, ES_READ_CACHE) as the recording,
+in a single process. Tests whose requests depend on timing, such as the
+conflicts of tests_contention.py, only replay as long as the timing is the
+same.
+"""
+import difflib
+import gzip
+import json
+import sys
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from elasticsearch import Connection, TransportError
+
+from suite_timing import REQUEST_LOG, TimedConnectionMixin
+
+
+class CassetteMismatch(AssertionError):
+    """
+    A request not found in the cassette.
+    """
+
+
+def parse_body(body):
+    '''A request body as JSON values, a list of them for NDJSON, or as
+    text when it is neither'''
+    if body is None:
+        return None
+    if isinstance(body, (bytes, memoryview)):
+        body = str(body, 'utf-8')
+    try:
+        return json.loads(body)
+    except ValueError:
+        pass
+    try:
+        return [json.loads(line) for line in body.splitlines() if line]
+    except ValueError:
+        return body
+
+
+def request_of(method, url, params, body):
+    '''A request as it is recorded and matched'''
+    return {
+        'method': method,
+        'path': url,
+        'params': {
+            key: value.decode('utf-8') if isinstance(value, bytes)
+            else str(value) for key, value in (params or {}).items()},
+        'body': parse_body(body)
+    }
+
+
+def error_body(error):
+    '''The body of the response a TransportError was raised for'''
+    if error.info is None:
+        return error.error
+    if isinstance(error.info, str):
+        return error.info
+    return json.dumps(error.info)
+
+
+def describe(request):
+    '''Lines describing a request, for diffs'''
+    query = urlencode(sorted(request['params'].items()))
+    lines = ['%s %s%s' % (
+        request['method'], request['path'], '?' + query if query else '')]
+    if request['body'] is not None:
+        lines.extend(
+            json.dumps(request['body'], indent=2, sort_keys=True).splitlines())
+    return lines
+
+
+class Cassette(object):
+    """
+    Requests and responses of a run, grouped by the test that made them.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.path = None
+        self.lock = threading.Lock()
+        self.tests = OrderedDict()
+
+    def record_to(self, path):
+        self.mode = 'record'
+        self.path = path
+
+    def replay_from(self, path):
+        self.mode = 'replay'
+        self.path = path
+        self.tests.clear()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                interaction = json.loads(line)
+                self.tests.setdefault(
+                    interaction.pop('test'), []).append(interaction)
+
+    def save(self):
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            for test, interactions in self.tests.items():
+                for interaction in interactions:
+                    f.write(json.dumps(
+                        dict(interaction, test=test),
+                        separators=(',', ':')) + '\n')
+
+    def record(self, request, status, response):
+        with self.lock:
+            self.tests.setdefault(REQUEST_LOG.current_test(), []).append(
+                dict(request, status=status, response=response))
+
+    def play(self, request):
+        '''The recorded interaction of a request, which isn't played again.
+        Raises CassetteMismatch if there is none'''
+        test = REQUEST_LOG.current_test()
+        with self.lock:
+            recorded = self.tests.get(test, [])
+            for position, interaction in enumerate(recorded):
+                if all(interaction[key] == value
+                       for key, value in request.items()):
+                    return recorded.pop(position)
+        if not recorded:
+            raise CassetteMismatch(
+                'No recorded request of %s left for:\n%s' % (
+                    test, '\n'.join(describe(request))))
+        raise CassetteMismatch(
+            'Request of %s not in the cassette:\n%s' % (test, '\n'.join(
+                difflib.unified_diff(
+                    describe(recorded[0]), describe(request),
+                    'recorded', 'sent', lineterm=''))))
+
+    def unplayed(self):
+        with self.lock:
+            return {
+                test: len(interactions)
+                for test, interactions in self.tests.items() if interactions
+            }
+
+    def format_unplayed(self):
+        unplayed = self.unplayed()
+        lines = ['Recorded requests not replayed: %d' % sum(unplayed.values())]
+        for test, count in unplayed.items():
+            lines.append('%6d  %s' % (count, test))
+        return '\n'.join(lines)
+
+
+CASSETTE = Cassette()
+
+
+def report_unplayed():
+    if CASSETTE.unplayed():
+        sys.stderr.write('\n%s\n' % CASSETTE.format_unplayed())
+
+
+class RecordingConnectionMixin(object):
+    """
+    Client connection class writing every response to CASSETTE while it
+    records.
+    """
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        if CASSETTE.mode != 'record':
+            return super().perform_request(
+                method, url, params, body, timeout=timeout, ignore=ignore,
+                headers=headers)
+        request = request_of(method, url, params, body)
+        try:
+            status, response_headers, response = super().perform_request(
+                method, url, params, body, timeout=timeout, ignore=ignore,
+                headers=headers)
+        except TransportError as e:
+            if isinstance(e.status_code, int):
+                CASSETTE.record(request, e.status_code, error_body(e))
+            raise
+        CASSETTE.record(request, status, response)
+        return status, response_headers, response
+
+
+class AsyncRecordingConnectionMixin(object):
+    """
+    RecordingConnectionMixin for the connection class of
+    AsyncElasticsearch.
+    """
+
+    async def perform_request(self, method, url, params=None, body=None,
+                              timeout=None, ignore=(), headers=None):
+        if CASSETTE.mode != 'record':
+            return await super().perform_request(
+                method, url, params, body, timeout=timeout, ignore=ignore,
+                headers=headers)
+        request = request_of(method, url, params, body)
+        try:
+            status, response_headers, response = \
+                await super().perform_request(
+                    method, url, params, body, timeout=timeout,
+                    ignore=ignore, headers=headers)
+        except TransportError as e:
+            if isinstance(e.status_code, int):
+                CASSETTE.record(request, e.status_code, error_body(e))
+            raise
+        CASSETTE.record(request, status, response)
+        return status, response_headers, response
+
+
+class ReplayConnection(TimedConnectionMixin, Connection):
+    """
+    Connection answering every request from CASSETTE, without a network.
+    """
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        interaction = CASSETTE.play(request_of(method, url, params, body))
+        status, response = interaction['status'], interaction['response']
+        path = url + ('?' + urlencode(params) if params else '')
+        if not (200 <= status < 300) and status not in ignore:
+            self.log_request_fail(
+                method, self.host + path, path, body, 0.0,
+                status_code=status, response=response)
+            self._raise_error(status, response)
+        self.log_request_success(
+            method, self.host + path, path, body, status, response, 0.0)
+        # Only the cat APIs answer with text.
+        content_type = 'text/plain' if response and response.lstrip()[:1] \
+            not in ('{', '[') else 'application/json'
+        return status, {'content-type': content_type}, response
+
+
+class AsyncReplayConnection(ReplayConnection):
+    """
+    ReplayConnection for AsyncElasticsearch.
+    """
+
+    async def perform_request(self, *args, **kwargs):
+        return super().perform_request(*args, **kwargs)
+
+    async def close(self):
+        pass
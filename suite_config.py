@@ -0,0 +1,108 @@
+"""
+Where the suite finds its cluster and how it connects to it.
+
+By default the suite talks to a node on localhost:9200; ES_HOST and ES_PORT
+point it somewhere else. ES_STANDIN=1 starts the in-process stand-in node
+from standin.py instead, so no real cluster is needed.
+
+The connection is tuned with:
+
+    ES_CONNECTION_CLASS  urllib3 (default) or requests
+    ES_POOL_MAXSIZE      connections kept open per node (default 10)
+    ES_KEEP_ALIVE        0 closes the connection after every request
+    ES_HTTP_COMPRESS     1 gzips request bodies
+    ES_SERIALIZER        json (default) or orjson, see suite_serializer.py
+    ES_POOL_STATS        1 reports connection reuse at the end of the run
+
+and every request is timed, see suite_timing.py:
+
+    ES_REQUEST_TIMINGS       1 reports the slowest tests and endpoints
+    ES_REQUEST_TIMINGS_JSON  writes all requests and the summaries as JSON
+    ES_REQUEST_TRACE         writes all requests as a trace-event file
+
+ES_READ_CACHE=1 answers repeated document reads from a cache, reporting
+its hits and misses at the end of the run, see suite_cache.py.
+
+ES_MEMORY=1 traces the client-side memory of every test and request with
+tracemalloc, flagging tests over ES_MEMORY_BUDGET_MB, see suite_memory.py.
+
+ES_RECORD=<path> records all requests and responses of the run to a
+cassette, ES_REPLAY=<path> answers the requests from one instead of a
+cluster, see suite_cassette.py.
+"""
+import atexit
+import os
+
+from standin import shared_standin
+from suite_cache import ReadCache, report_cache_stats
+from suite_cassette import (
+    CASSETTE,
+    AsyncReplayConnection,
+    ReplayConnection,
+    report_unplayed,
+)
+from suite_connection import CONNECTION_CLASSES, report_stats
+from suite_memory import MEMORY_LOG, report_memory
+from suite_serializer import SERIALIZERS
+from suite_timing import REQUEST_LOG, report_timings
+
+
+def es_hosts():
+    '''Hosts to pass to the Elasticsearch client'''
+    if os.environ.get('ES_STANDIN') and CASSETTE.mode != 'replay':
+        server = shared_standin()
+        return [{'host': server.host, 'port': server.port}]
+    return [{
+        'host': os.environ.get('ES_HOST', 'localhost'),
+        'port': int(os.environ.get('ES_PORT', 9200))
+    }]
+
+
+def client_options(asynchronous=False):
+    '''Connection options to pass to the Elasticsearch client. The async
+    client always uses its aiohttp connection class'''
+    options = {
+        'maxsize': int(os.environ.get('ES_POOL_MAXSIZE', 10)),
+        'serializer': SERIALIZERS[os.environ.get('ES_SERIALIZER', 'json')]()
+    }
+    if os.environ.get('ES_HTTP_COMPRESS', '0') != '0':
+        options['http_compress'] = True
+    if os.environ.get('ES_KEEP_ALIVE', '1') == '0':
+        options['headers'] = {'connection': 'close'}
+    if CASSETTE.mode == 'replay':
+        options['connection_class'] = (
+            AsyncReplayConnection if asynchronous else ReplayConnection)
+    elif asynchronous:
+        from suite_connection import InstrumentedAIOHttpConnection
+        options['connection_class'] = InstrumentedAIOHttpConnection
+    else:
+        options['connection_class'] = CONNECTION_CLASSES[
+            os.environ.get('ES_CONNECTION_CLASS', 'urllib3')]
+    return options
+
+
+def read_cache():
+    '''Read cache to pass to the suite's transport, if enabled'''
+    if os.environ.get('ES_READ_CACHE', '0') != '0':
+        return ReadCache()
+    return None
+
+
+if os.environ.get('ES_POOL_STATS', '0') != '0':
+    atexit.register(report_stats)
+if (os.environ.get('ES_REQUEST_TIMINGS', '0') != '0'
+        or os.environ.get('ES_REQUEST_TIMINGS_JSON')
+        or os.environ.get('ES_REQUEST_TRACE')):
+    REQUEST_LOG.enabled = True
+    atexit.register(report_timings)
+if os.environ.get('ES_READ_CACHE', '0') != '0':
+    atexit.register(report_cache_stats)
+if os.environ.get('ES_MEMORY', '0') != '0':
+    MEMORY_LOG.start(float(os.environ.get('ES_MEMORY_BUDGET_MB', 64)))
+    atexit.register(report_memory)
+if os.environ.get('ES_RECORD'):
+    CASSETTE.record_to(os.environ['ES_RECORD'])
+    atexit.register(CASSETTE.save)
+elif os.environ.get('ES_REPLAY'):
+    CASSETTE.replay_from(os.environ['ES_REPLAY'])
+    atexit.register(report_unplayed)
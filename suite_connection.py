@@ -0,0 +1,232 @@
+"""
+Connection classes of the suite, counting how sockets are used.
+
+The urllib3 and requests based connection classes of the client, and the
+aiohttp one of AsyncElasticsearch, are wrapped so that every socket opened
+and every request sent over it is recorded in POOL_STATS, and every
+request is timed in REQUEST_LOG of suite_timing and, while recording,
+written to the cassette of suite_cassette. Requests sent over a socket
+that already served one are reused connections; a client that reconnects
+for every call shows as many connections opened as requests.
+"""
+import asyncio
+import sys
+import threading
+import weakref
+
+import urllib3
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from elasticsearch import RequestsHttpConnection, Urllib3HttpConnection
+
+from suite_cassette import (
+    AsyncRecordingConnectionMixin,
+    RecordingConnectionMixin,
+)
+from suite_timing import TimedConnectionMixin
+
+try:
+    from requests.adapters import HTTPAdapter
+except ImportError:  # requests is not installed
+    HTTPAdapter = None
+
+try:
+    import aiohttp
+    from elasticsearch import AIOHttpConnection
+    from elasticsearch._async.http_aiohttp import ESClientResponse
+except ImportError:  # aiohttp is not installed
+    AIOHttpConnection = None
+
+
+class PoolStats(object):
+    """
+    Counters of sockets opened and requests sent over them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {
+                'connections_opened': 0,
+                'requests': 0,
+                'reused_requests': 0,
+                'max_requests_per_connection': 0
+            }
+
+    def opened(self):
+        with self.lock:
+            self.counters['connections_opened'] += 1
+
+    def requested(self, served_before):
+        '''Record a request sent over a socket that already served
+        `served_before` requests'''
+        with self.lock:
+            self.counters['requests'] += 1
+            if served_before:
+                self.counters['reused_requests'] += 1
+            self.counters['max_requests_per_connection'] = max(
+                self.counters['max_requests_per_connection'],
+                served_before + 1)
+
+    def add(self, snapshot):
+        '''Add up the counters of another process'''
+        with self.lock:
+            for key, value in snapshot.items():
+                if key.startswith('max_'):
+                    self.counters[key] = max(self.counters[key], value)
+                else:
+                    self.counters[key] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def format(self):
+        stats = self.snapshot()
+        opened = stats['connections_opened']
+        return (
+            'Connections opened: %d, requests: %d, requests on reused '
+            'connections: %d, requests per connection: %.1f (max %d)' % (
+                opened, stats['requests'], stats['reused_requests'],
+                stats['requests'] / opened if opened else 0,
+                stats['max_requests_per_connection']))
+
+
+POOL_STATS = PoolStats()
+
+
+def report_stats():
+    sys.stderr.write('\n%s\n' % POOL_STATS.format())
+
+
+class CountingConnectionMixin(object):
+    """
+    urllib3 connection recording its sockets and requests in POOL_STATS.
+    """
+    served = 0
+
+    def connect(self):
+        super().connect()
+        self.served = 0
+        POOL_STATS.opened()
+
+    def request(self, *args, **kwargs):
+        response = super().request(*args, **kwargs)
+        POOL_STATS.requested(self.served)
+        self.served += 1
+        return response
+
+
+class CountingHTTPConnection(CountingConnectionMixin, HTTPConnection):
+    pass
+
+
+class CountingHTTPSConnection(CountingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+
+class InstrumentedUrllib3HttpConnection(RecordingConnectionMixin,
+                                       TimedConnectionMixin,
+                                       Urllib3HttpConnection):
+    """
+    Default connection class of the client with counted sockets.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool.ConnectionCls = (
+            CountingHTTPSConnection if self.use_ssl else CountingHTTPConnection)
+
+
+if HTTPAdapter is not None:
+    class CountingAdapter(HTTPAdapter):
+        """
+        requests adapter whose pools count their sockets.
+        """
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': CountingHTTPConnectionPool,
+                'https': CountingHTTPSConnectionPool
+            }
+
+
+class InstrumentedRequestsHttpConnection(RecordingConnectionMixin,
+                                         TimedConnectionMixin,
+                                         RequestsHttpConnection):
+    """
+    requests based connection class of the client with counted sockets,
+    keeping up to `maxsize` connections like the urllib3 one.
+    """
+
+    def __init__(self, *args, maxsize=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        adapter = CountingAdapter(pool_connections=1, pool_maxsize=maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+
+if AIOHttpConnection is not None:
+    class CountingTCPConnector(aiohttp.TCPConnector):
+        """
+        aiohttp connector recording its sockets and the requests each one
+        is handed out for in POOL_STATS.
+        """
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.served = weakref.WeakKeyDictionary()
+
+        async def _create_connection(self, *args, **kwargs):
+            protocol = await super()._create_connection(*args, **kwargs)
+            self.served[protocol] = 0
+            POOL_STATS.opened()
+            return protocol
+
+        async def connect(self, *args, **kwargs):
+            connection = await super().connect(*args, **kwargs)
+            protocol = connection.protocol
+            served = self.served.get(protocol, 0)
+            POOL_STATS.requested(served)
+            self.served[protocol] = served + 1
+            return connection
+
+    class InstrumentedAIOHttpConnection(AsyncRecordingConnectionMixin,
+                                        TimedConnectionMixin,
+                                        AIOHttpConnection):
+        """
+        aiohttp connection class of AsyncElasticsearch with counted
+        sockets.
+        """
+
+        async def _create_aiohttp_session(self):
+            '''The session of AIOHttpConnection, with a counting
+            connector'''
+            if self.loop is None:
+                self.loop = asyncio.get_running_loop()
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                auto_decompress=True,
+                loop=self.loop,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                response_class=ESClientResponse,
+                connector=CountingTCPConnector(
+                    limit=self._limit, use_dns_cache=True,
+                    ssl=self._ssl_context))
+
+
+CONNECTION_CLASSES = {
+    'urllib3': InstrumentedUrllib3HttpConnection,
+    'requests': InstrumentedRequestsHttpConnection,
+}
@@ -0,0 +1,80 @@
+"""
+Export of every document of an index, one hit at a time.
+
+All strategies are generators: a page of hits is requested only once the
+previous one has been consumed, so memory stays bounded however large the
+index is:
+
+    scroll_export        helpers.scan, scrolling in `_doc` order
+    sliced scroll        scroll_export of one slice (`slice_id` out of
+                         `slices`), for as many workers as slices
+    search_after_export  pages sorted by a field unique to every document,
+                         each page following the sort values of the last hit
+
+The nodes of 7.7 have no point in time, so unlike a scroll search_after
+doesn't read a snapshot: documents written during the export may be
+missed or returned twice. IdTally checks that an export of documents with
+ids 0 to count - 1 returned each of them exactly once.
+"""
+from elasticsearch.helpers import scan
+
+
+def scroll_export(es, index, size=1000, scroll='5m', slice_id=None,
+                  slices=None, **kwargs):
+    '''Yield every hit of an index, or of one slice of it, from a scroll
+    of `size` hits per page'''
+    query = {'query': {'match_all': {}}}
+    if slices is not None and slices > 1:
+        query['slice'] = {'id': slice_id, 'max': slices}
+    yield from scan(
+        es, query=query, index=index, size=size, scroll=scroll, **kwargs)
+
+
+def search_after_export(es, index, sort_field, size=1000, **kwargs):
+    '''Yield every hit of an index from searches of `size` hits sorted by
+    `sort_field`, which must be unique to every document'''
+    body = {
+        'query': {'match_all': {}},
+        'sort': [{sort_field: 'asc'}],
+        'size': size,
+        'track_total_hits': False
+    }
+    while True:
+        hits = es.search(index=index, body=body, **kwargs)['hits']['hits']
+        yield from hits
+        if len(hits) < size:
+            return
+        body['search_after'] = hits[-1]['sort']
+
+
+class IdTally(object):
+    """
+    How often every id from 0 to `count` - 1 was seen, a byte per id.
+    """
+
+    def __init__(self, count):
+        self.seen = bytearray(count)
+        self.unexpected = 0
+
+    def add(self, doc_id):
+        try:
+            position = int(doc_id)
+        except ValueError:
+            position = -1
+        if not 0 <= position < len(self.seen):
+            self.unexpected += 1
+        elif self.seen[position] < 255:
+            self.seen[position] += 1
+
+    def merge(self, other):
+        '''Add up the tally of another slice'''
+        self.seen = bytearray(
+            min(255, a + b) for a, b in zip(self.seen, other.seen))
+        self.unexpected += other.unexpected
+
+    def missing(self):
+        return self.seen.count(0)
+
+    def duplicates(self):
+        '''Ids seen more than once'''
+        return len(self.seen) - self.missing() - self.seen.count(1)
@@ -0,0 +1,200 @@
+"""
+Client-side memory of every test and request, traced with tracemalloc.
+
+ES_MEMORY=1 traces all allocations of the run and reports, once it is
+done, per test and per endpoint:
+
+    peak      the most memory allocated at once on top of what was
+              allocated when the test or request started
+    retained  what was still allocated when it ended: for a request the
+              decoded response handed to the test, for a test whatever
+              it left behind
+
+Tests whose peak exceeds ES_MEMORY_BUDGET_MB (default 64) are flagged:
+
+    ES_MEMORY=1 ES_MEMORY_BUDGET_MB=16 python -m unittest tests_memory.py
+
+A large peak next to a small response points at the client building
+results in memory, e.g. the error list of `helpers.bulk` with
+`stats_only=False`, where stats_only or streaming_bulk would do.
+
+Tracing is process-wide: requests sent at the same time by several
+threads or asyncio tasks count towards each other's peaks, and so does
+the stand-in node of ES_STANDIN=1, which serves from the same process.
+For the client alone, run the stand-in in a process of its own:
+
+    python standin.py --port 9200 &
+    ES_MEMORY=1 python -m unittest tests_memory.py
+"""
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from suite_timing import endpoint_of_request
+
+MB = 1024 * 1024
+
+
+class MemoryLog(object):
+    """
+    Peak and retained allocations of the tests and requests of a process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.budget = 64 * MB
+        self.tests = {}
+        self.endpoints = {}
+        # The running test, what was allocated when it started and its
+        # peak up to the last reset of the tracemalloc peak.
+        self.test = None
+        self.test_start = 0
+        self.test_peak = 0
+
+    def start(self, budget_mb=64):
+        '''Start tracing allocations'''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.budget = int(budget_mb * MB)
+        self.enabled = True
+
+    def fold_peak(self):
+        '''Fold the peak since the last reset into the peak of the running
+        test, returning what is allocated now'''
+        current, peak = tracemalloc.get_traced_memory()
+        if self.test is not None:
+            self.test_peak = max(self.test_peak, peak - self.test_start)
+        return current
+
+    def start_test(self, test):
+        if not self.enabled:
+            return
+        with self.lock:
+            tracemalloc.reset_peak()
+            self.test = test
+            self.test_start = tracemalloc.get_traced_memory()[0]
+            self.test_peak = 0
+
+    def stop_test(self):
+        if not self.enabled or self.test is None:
+            return
+        with self.lock:
+            current = self.fold_peak()
+            self.tests[self.test] = {
+                'peak_bytes': self.test_peak,
+                'retained_bytes': max(0, current - self.test_start),
+            }
+            self.test = None
+
+    @contextmanager
+    def request(self, method, url):
+        '''Trace the allocations of a request, from sending it to the
+        decoded response'''
+        if not self.enabled:
+            yield
+            return
+        with self.lock:
+            before = self.fold_peak()
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            with self.lock:
+                current, peak = tracemalloc.get_traced_memory()
+                # Less is allocated after than before when the request
+                # let garbage of earlier ones be collected.
+                self.add_request(
+                    endpoint_of_request(method, url), self.test,
+                    peak - before, max(0, current - before))
+
+    def add_request(self, endpoint, test, peak, retained):
+        group = self.endpoints.setdefault(endpoint, {
+            'requests': 0, 'peak_bytes': 0, 'max_peak_bytes': 0,
+            'retained_bytes': 0, 'max_retained_bytes': 0, 'max_test': None})
+        group['requests'] += 1
+        group['peak_bytes'] += peak
+        group['retained_bytes'] += retained
+        if peak > group['max_peak_bytes']:
+            group['max_peak_bytes'] = peak
+            group['max_test'] = test
+        group['max_retained_bytes'] = max(
+            group['max_retained_bytes'], retained)
+
+    def over_budget(self):
+        '''Tests whose peak exceeded the budget, largest first'''
+        return [
+            test for test, usage in self.largest_tests()
+            if usage['peak_bytes'] > self.budget
+        ]
+
+    def largest_tests(self):
+        return sorted(self.tests.items(),
+                      key=lambda item: item[1]['peak_bytes'], reverse=True)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'tests': dict(self.tests),
+                'endpoints': {
+                    endpoint: dict(group)
+                    for endpoint, group in self.endpoints.items()
+                }
+            }
+
+    def add(self, snapshot):
+        '''Add the tests and requests of another process'''
+        with self.lock:
+            self.tests.update(snapshot['tests'])
+            for endpoint, other in snapshot['endpoints'].items():
+                group = self.endpoints.get(endpoint)
+                if group is None:
+                    self.endpoints[endpoint] = dict(other)
+                    continue
+                for key in ('requests', 'peak_bytes', 'retained_bytes'):
+                    group[key] += other[key]
+                if other['max_peak_bytes'] > group['max_peak_bytes']:
+                    group['max_peak_bytes'] = other['max_peak_bytes']
+                    group['max_test'] = other['max_test']
+                group['max_retained_bytes'] = max(
+                    group['max_retained_bytes'], other['max_retained_bytes'])
+
+    def format(self, largest=10):
+        '''Largest tests, those over budget and all endpoints by peak'''
+        lines = ['Client memory by test (budget %.1fMB):' % (
+            self.budget / MB)]
+        lines.append('  %9s %11s  %s' % ('peak_mb', 'retained_mb', 'test'))
+        over = set(self.over_budget())
+        for position, (test, usage) in enumerate(self.largest_tests()):
+            if position >= largest and test not in over:
+                break
+            lines.append('  %9.2f %11.2f  %s%s' % (
+                usage['peak_bytes'] / MB, usage['retained_bytes'] / MB, test,
+                '  OVER BUDGET' if test in over else ''))
+        lines.append('Client memory by endpoint:')
+        lines.append('  %8s %12s %11s %16s %15s  %s' % (
+            'requests', 'mean_peak_kb', 'max_peak_kb', 'mean_retained_kb',
+            'max_retained_kb', 'endpoint'))
+        for endpoint, group in sorted(
+                self.endpoints.items(),
+                key=lambda item: item[1]['max_peak_bytes'], reverse=True):
+            lines.append('  %8d %12.1f %11.1f %16.1f %15.1f  %s%s' % (
+                group['requests'],
+                group['peak_bytes'] / group['requests'] / 1024,
+                group['max_peak_bytes'] / 1024,
+                group['retained_bytes'] / group['requests'] / 1024,
+                group['max_retained_bytes'] / 1024, endpoint,
+                '  (max in %s)' % group['max_test']
+                if group['max_test'] else ''))
+        if over:
+            lines.append('%d test(s) over the budget of %.1fMB' % (
+                len(over), self.budget / MB))
+        return '\n'.join(lines)
+
+
+MEMORY_LOG = MemoryLog()
+
+
+def report_memory():
+    sys.stderr.write('\n%s\n' % MEMORY_LOG.format())
@@ -0,0 +1,144 @@
+"""
+Bulk indexing of pre-encoded NDJSON.
+
+helpers.bulk takes actions as dicts and serializes them on every call.
+Data that is already NDJSON (replayed from disk, say) can be sent as it is:
+the functions here find the action boundaries in a bytes-like buffer (bytes
+or an mmap of a file) by scanning for newlines, without decoding or parsing
+the documents, and post every chunk of actions to `_bulk` as a memoryview
+of the buffer, which the transport sends as it is, without copying it.
+Failed items are reported like helpers.streaming_bulk and BulkIndexError
+report them, with the line number and byte offset of the failed action
+added:
+
+    with open_ndjson('replay.ndjson') as data:
+        success, errors = ndjson_bulk(es, data, chunk_size=1000)
+
+Only the first bytes of each action line are looked at, to tell `delete`
+actions (which have no source line) from the others, and blank lines are
+skipped.
+
+es.bulk only takes str or bytes bodies, so chunks are posted through
+es.transport, with the keyword arguments of es.bulk as query parameters.
+This needs a client with one of the serializers of suite_serializer.py,
+which pass memoryviews through (suite_config.client_options sets them up).
+With ES_INDEX_PREFIX the `_index` of every action is rewritten, which
+copies the chunk.
+"""
+import mmap
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+from elasticsearch.helpers import BulkIndexError
+
+from suite_transport import make_index_path
+
+# Actions of a line of NDJSON without a source line following it.
+DELETE_ACTION = re.compile(rb'\s*\{\s*"delete"\s*:')
+# Byte offsets of a chunk in the buffer and the (line number, byte offset)
+# of each of its actions.
+NdjsonChunk = namedtuple('NdjsonChunk', ['start', 'end', 'actions'])
+
+
+@contextmanager
+def open_ndjson(path):
+    '''Map an NDJSON file into memory, read only'''
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def ndjson_actions(data):
+    '''Yield (line number, start, end) of every action of an NDJSON buffer,
+    line numbers counting from 1, `end` just past its last newline'''
+    size = len(data)
+    position = 0
+    line = 0
+    while position < size:
+        end = data.find(b'\n', position)
+        end = size if end == -1 else end + 1
+        line += 1
+        if not data[position:end].strip():
+            position = end
+            continue
+        start, first_line = position, line
+        if not DELETE_ACTION.match(data[position:min(end, position + 32)]):
+            source_end = data.find(b'\n', end)
+            end = size if source_end == -1 else source_end + 1
+            line += 1
+        yield first_line, start, end
+        position = end
+
+
+def ndjson_chunks(data, chunk_size=500, max_chunk_bytes=100 * 1024 * 1024):
+    '''Split an NDJSON buffer into chunks of at most `chunk_size` actions
+    and `max_chunk_bytes` bytes, as helpers.bulk chunks actions'''
+    start = None
+    actions = []
+    for line, action_start, action_end in ndjson_actions(data):
+        if actions and (len(actions) == chunk_size
+                        or action_end - start > max_chunk_bytes):
+            yield NdjsonChunk(start, previous_end, actions)
+            actions = []
+        if not actions:
+            start = action_start
+        actions.append((line, action_start))
+        previous_end = action_end
+    if actions:
+        yield NdjsonChunk(start, previous_end, actions)
+
+
+def send_chunk(es, data, chunk, index=None, **kwargs):
+    '''Post a chunk to `_bulk`, returning (ok, {op_type: item}) of every
+    action, items carrying the `line` and `offset` of their action. Only
+    a last line without its newline is copied, to append one'''
+    params = {
+        key: str(value).lower() if isinstance(value, bool) else value
+        for key, value in kwargs.items()
+    }
+    path = (make_index_path([index]) if index else '') + '/_bulk'
+    with memoryview(data)[chunk.start:chunk.end] as body:
+        if body[-1:] != b'\n':
+            body = bytes(body) + b'\n'
+        response = es.transport.perform_request(
+            'POST', path, params=params, body=body)
+    results = []
+    for (line, offset), item in zip(chunk.actions, response['items']):
+        op_type, info = item.popitem()
+        info = dict(info, line=line, offset=offset)
+        results.append((200 <= info.get('status', 500) < 300, {op_type: info}))
+    return results
+
+
+def streaming_ndjson_bulk(es, data, chunk_size=500,
+                          max_chunk_bytes=100 * 1024 * 1024,
+                          raise_on_error=True, **kwargs):
+    '''helpers.streaming_bulk for an NDJSON buffer: yields (ok, item) of
+    every action and raises BulkIndexError after the first chunk with
+    failed items, unless `raise_on_error` is false. `index` and the other
+    keyword arguments of es.bulk are passed on'''
+    for chunk in ndjson_chunks(data, chunk_size, max_chunk_bytes):
+        results = send_chunk(es, data, chunk, **kwargs)
+        errors = [item for ok, item in results if not ok]
+        if errors and raise_on_error:
+            raise BulkIndexError(
+                '%i document(s) failed to index.' % len(errors), errors)
+        for result in results:
+            yield result
+
+
+def ndjson_bulk(es, data, stats_only=False, **kwargs):
+    '''helpers.bulk for an NDJSON buffer: returns the number of actions
+    that succeeded and the failed items, or their number with
+    `stats_only`'''
+    success, failed = 0, 0
+    errors = []
+    for ok, item in streaming_ndjson_bulk(es, data, **kwargs):
+        if ok:
+            success += 1
+        else:
+            failed += 1
+            if not stats_only:
+                errors.append(item)
+    return success, failed if stats_only else errors
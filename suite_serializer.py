@@ -0,0 +1,114 @@
+"""
+Serializers of the suite, timing every body they encode and decode.
+
+ES_SERIALIZER picks the one the client uses for request and response
+bodies:
+
+    json    the client's own JSONSerializer (default)
+    orjson  OrjsonSerializer, needs `pip install orjson`
+
+Both record the time spent in `dumps` and `loads` against the request the
+body belongs to in REQUEST_LOG of suite_timing, so the request timings
+report serialization next to network time:
+
+    ES_SERIALIZER=orjson ES_REQUEST_TIMINGS=1 python -m unittest tests_es_py.py
+
+OrjsonSerializer takes the same types as JSONSerializer (dates, UUIDs,
+decimals, numpy and pandas values) and writes the same compact UTF-8 JSON,
+byte for byte, with one exception: floats in exponent notation are written
+as `1e16` instead of `1e+16`, which parses to the same value. Whatever
+orjson can't encode (integers beyond 64 bits, for one) is left to
+JSONSerializer; such integers are decoded as floats, though, as they don't
+fit a long field anyway.
+
+Both pass memoryviews through untouched, so pre-encoded NDJSON can be sent
+without copying it (see suite_ndjson.py). OrjsonSerializer also has
+`encode`, returning orjson's bytes as they are, which the transports of
+suite_transport.py send request bodies with; `dumps` decodes them to a
+string only for the client's bulk helpers, which join actions as text.
+"""
+import time
+
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JSONSerializer
+
+from suite_timing import REQUEST_LOG
+
+try:
+    import orjson
+except ImportError:  # orjson is not installed
+    orjson = None
+
+
+if orjson is not None:
+    class OrjsonSerializer(JSONSerializer):
+        """
+        JSONSerializer encoding and decoding with orjson.
+        """
+
+        def loads(self, s):
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError as e:
+                raise SerializationError(s, e)
+
+        def encode(self, data):
+            '''Encode a body to the bytes sent'''
+            try:
+                return orjson.dumps(
+                    data, default=self.default,
+                    option=orjson.OPT_NON_STR_KEYS)
+            except orjson.JSONEncodeError:
+                return JSONSerializer.dumps(self, data).encode('utf-8')
+
+        def dumps(self, data):
+            # don't serialize strings
+            if isinstance(data, (str, bytes)):
+                return data
+            # Not self.encode, which a timed subclass times on its own.
+            return OrjsonSerializer.encode(self, data).decode('utf-8')
+
+
+class TimedSerializerMixin(object):
+    """
+    Serializer recording the time spent in dumps and loads in REQUEST_LOG.
+    """
+
+    def dumps(self, data):
+        # Pre-encoded bodies, like the chunks of suite_ndjson.py and those
+        # of encode, are sent as they are.
+        if isinstance(data, (bytes, memoryview)):
+            return data
+        start = time.perf_counter()
+        try:
+            return super().dumps(data)
+        finally:
+            REQUEST_LOG.encoded(time.perf_counter() - start)
+
+    def loads(self, s):
+        start = time.perf_counter()
+        try:
+            return super().loads(s)
+        finally:
+            REQUEST_LOG.decoded(time.perf_counter() - start)
+
+
+class TimedJSONSerializer(TimedSerializerMixin, JSONSerializer):
+    pass
+
+
+SERIALIZERS = {
+    'json': TimedJSONSerializer,
+}
+
+if orjson is not None:
+    class TimedOrjsonSerializer(TimedSerializerMixin, OrjsonSerializer):
+
+        def encode(self, data):
+            start = time.perf_counter()
+            try:
+                return super().encode(data)
+            finally:
+                REQUEST_LOG.encoded(time.perf_counter() - start)
+
+    SERIALIZERS['orjson'] = TimedOrjsonSerializer
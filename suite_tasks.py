@@ -0,0 +1,104 @@
+"""
+Following requests started with `wait_for_completion=False` through the
+Tasks API.
+
+follow_task polls the task until it completes, keeping the progress it
+reported at every poll and how long each slice of a sliced request ran.
+Times are the running time the task reports. Slices run as child tasks;
+a slice is timed up to the first poll that no longer lists it after it
+was seen running, or that reports its final status, so slice times are
+accurate to the poll interval. Slices that haven't started yet are not
+timed.
+
+Slice times count from the start of the whole task, not of the slice, as
+the Tasks API doesn't report when a slice started: the docs/sec of a slice
+that started late is understated.
+
+For example:
+
+    task = es.delete_by_query(index='twitter', body=query, slices='auto',
+                              wait_for_completion=False)['task']
+    finished = follow_task(es, task, poll_interval=0.1)
+    for rate in slice_rates(finished):
+        print(rate)
+"""
+import time
+from collections import namedtuple
+
+# The task's response, (running seconds, status) of every poll, the
+# seconds every slice took and the running seconds of the whole task.
+FinishedTask = namedtuple(
+    'FinishedTask', ['response', 'progress', 'slice_seconds', 'elapsed'])
+# Counters of the status of by-query and reindex tasks that are documents
+# worked on.
+PROCESSED = ('created', 'updated', 'deleted', 'noops', 'version_conflicts')
+
+
+class TaskError(Exception):
+    """
+    Task that completed with an error, or didn't complete in time.
+    """
+
+
+def processed(status):
+    '''Documents a by-query or reindex status reports as worked on'''
+    return sum(status.get(key, 0) for key in PROCESSED)
+
+
+def follow_task(es, task_id, poll_interval=0.1, timeout=None):
+    '''Poll a task until it completes and return a FinishedTask. A task
+    running longer than `timeout` seconds is cancelled'''
+    start = time.perf_counter()
+    progress = []
+    slice_seconds = {}
+    seen_running = set()
+    while True:
+        result = es.tasks.get(task_id=task_id)
+        elapsed = result['task']['running_time_in_nanos'] / 1e9
+        status = result['task'].get('status', {})
+        progress.append((elapsed, status))
+        if result['completed']:
+            break
+        running = {
+            child.get('status', {}).get('slice_id')
+            for node in es.tasks.list(
+                parent_task_id=task_id, detailed=True)['nodes'].values()
+            for child in node['tasks'].values()
+        }
+        seen_running |= running
+        # The parent lists the status of a slice once it has finished,
+        # and null until then.
+        for slice_id, final in enumerate(status.get('slices') or []):
+            if slice_id not in running and (
+                    slice_id in seen_running or final is not None):
+                slice_seconds.setdefault(slice_id, elapsed)
+        if timeout is not None and time.perf_counter() - start > timeout:
+            es.tasks.cancel(task_id=task_id)
+            raise TaskError('task %s still running after %.1fs' % (
+                task_id, timeout))
+        time.sleep(poll_interval)
+    if 'error' in result:
+        raise TaskError('task %s failed: %s' % (task_id, result['error']))
+    return FinishedTask(result['response'], progress, slice_seconds, elapsed)
+
+
+def slice_rates(finished):
+    '''Documents and docs/sec of every slice of a finished task, a task
+    without slices counting as a single one. `elapsed_s` counts from the
+    start of the task, not of the slice'''
+    slices = finished.response.get('slices') or [
+        dict(finished.response, slice_id=0)]
+    rates = []
+    for status in slices:
+        seconds = finished.slice_seconds.get(
+            status['slice_id'], finished.elapsed)
+        docs = processed(status)
+        rates.append({
+            'slice_id': status['slice_id'],
+            'docs': docs,
+            'batches': status['batches'],
+            'throttled_ms': status['throttled_millis'],
+            'elapsed_s': round(seconds, 3),
+            'docs_per_sec': round(docs / seconds, 1) if seconds else None
+        })
+    return rates
@@ -0,0 +1,222 @@
+"""
+Timing of every request the suite sends to the cluster.
+
+The connection classes of the suite record method, path, status, bytes
+sent and received and wall time of each request in REQUEST_LOG, together
+with the test that made it, and the time the serializer spent encoding
+its body and decoding its response (see suite_serializer.py). At the end
+of a run the log is summarized per test and per endpoint, and optionally
+written as JSON or as a trace-event file that chrome://tracing and
+Perfetto can open:
+
+    ES_REQUEST_TIMINGS=1 python -m unittest tests_es_py.py
+    ES_REQUEST_TRACE=trace.json python run_parallel.py -j 4
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Test of the running asyncio task, see tests_es_py_async.py. Sync tests
+# set RequestLog.test instead, so threads they start are attributed too.
+CURRENT_TEST = contextvars.ContextVar('current_test', default=None)
+# Seconds spent encoding bodies of the next request and the last request
+# of the running thread or asyncio task, which the response decoded next
+# belongs to.
+PENDING_ENCODE = contextvars.ContextVar('pending_encode', default=0.0)
+LAST_RECORD = contextvars.ContextVar('last_record', default=None)
+# Path segments following these are document or task ids.
+ID_SEGMENTS = (
+    '_doc', '_create', '_update', '_source', '_termvectors', '_tasks')
+
+
+def endpoint_of_request(method, path):
+    '''Group requests by API: `PUT /twitter/_doc/1?refresh=true` is
+    `PUT /{index}/_doc/{id}`'''
+    segments = path.split('?', 1)[0].strip('/').split('/')
+    endpoint = []
+    for position, segment in enumerate(segments):
+        if position == 0 and segment and not segment.startswith('_'):
+            segment = '{index}'
+        elif position and segments[position - 1] in ID_SEGMENTS:
+            segment = '{id}'
+        endpoint.append(segment)
+    return '%s /%s' % (method, '/'.join(endpoint))
+
+
+def length_of(data):
+    if data is None:
+        return 0
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    return len(data)
+
+
+def aggregate(records, key):
+    '''Count, total, mean and max time and bytes of records grouped by
+    `key`, slowest group first'''
+    groups = {}
+    for record in records:
+        group = groups.setdefault(record[key], {
+            'requests': 0, 'total_s': 0.0, 'max_s': 0.0,
+            'encode_s': 0.0, 'decode_s': 0.0, 'bytes_out': 0, 'bytes_in': 0})
+        group['requests'] += 1
+        group['total_s'] += record['duration_s']
+        group['encode_s'] += record['encode_s']
+        group['decode_s'] += record['decode_s']
+        group['max_s'] = max(group['max_s'], record['duration_s'])
+        group['bytes_out'] += record['bytes_out']
+        group['bytes_in'] += record['bytes_in']
+    for group in groups.values():
+        group['mean_s'] = group['total_s'] / group['requests']
+    return OrderedDict(sorted(
+        groups.items(), key=lambda item: item[1]['total_s'], reverse=True))
+
+
+class RequestLog(object):
+    """
+    Requests sent by the suite, in the order they completed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.test = None
+        self.records = []
+
+    def current_test(self):
+        return CURRENT_TEST.get() or self.test
+
+    def record(self, method, path, status, body, response, duration):
+        if not self.enabled:
+            return
+        end = time.time()
+        record = {
+            'test': self.current_test(),
+            'method': method,
+            'path': path,
+            'endpoint': endpoint_of_request(method, path),
+            'status': status,
+            'bytes_out': length_of(body),
+            'bytes_in': length_of(response),
+            'start': end - duration,
+            'duration_s': duration,
+            'encode_s': PENDING_ENCODE.get(),
+            'decode_s': 0.0,
+            'pid': os.getpid(),
+            'thread': threading.get_ident()
+        }
+        PENDING_ENCODE.set(0.0)
+        LAST_RECORD.set(record)
+        with self.lock:
+            self.records.append(record)
+
+    def encoded(self, seconds):
+        '''Add time spent encoding a body to the next request'''
+        if self.enabled:
+            PENDING_ENCODE.set(PENDING_ENCODE.get() + seconds)
+
+    def decoded(self, seconds):
+        '''Add time spent decoding a response to the last request'''
+        record = LAST_RECORD.get()
+        if self.enabled and record is not None:
+            record['decode_s'] += seconds
+
+    def extend(self, records):
+        '''Add the records of another process'''
+        with self.lock:
+            self.records.extend(records)
+
+    def format(self, slowest=10):
+        '''Slowest tests and all endpoints by total request time'''
+        lines = ['Slowest tests by request time:']
+        tests = aggregate(
+            [r for r in self.records if r['test']], 'test')
+        for test, group in list(tests.items())[:slowest]:
+            lines.append('  %8.3fs %5d requests  %s' % (
+                group['total_s'], group['requests'], test))
+        lines.append('Requests by endpoint:')
+        lines.append('  %8s %9s %9s %9s %9s %9s %10s %10s  %s' % (
+            'requests', 'total_ms', 'mean_ms', 'max_ms', 'encode_ms',
+            'decode_ms', 'bytes_out', 'bytes_in', 'endpoint'))
+        for endpoint, group in aggregate(self.records, 'endpoint').items():
+            lines.append(
+                '  %8d %9.1f %9.2f %9.2f %9.1f %9.1f %10d %10d  %s' % (
+                group['requests'], group['total_s'] * 1000,
+                group['mean_s'] * 1000, group['max_s'] * 1000,
+                group['encode_s'] * 1000, group['decode_s'] * 1000,
+                group['bytes_out'], group['bytes_in'], endpoint))
+        lines.append(
+            'Network %.1fms, encoding %.1fms, decoding %.1fms' % tuple(
+                sum(record[key] for record in self.records) * 1000
+                for key in ('duration_s', 'encode_s', 'decode_s')))
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'per_test': aggregate(
+                    [r for r in self.records if r['test']], 'test'),
+                'per_endpoint': aggregate(self.records, 'endpoint'),
+                'requests': self.records
+            }, f, indent=2)
+
+    def write_trace(self, path):
+        '''Write the requests as complete events of the trace-event format,
+        one row per process and thread'''
+        with open(path, 'w') as f:
+            json.dump({
+                'traceEvents': [{
+                    'name': record['endpoint'],
+                    'cat': record['test'] or 'suite',
+                    'ph': 'X',
+                    'ts': record['start'] * 1e6,
+                    'dur': record['duration_s'] * 1e6,
+                    'pid': record['pid'],
+                    'tid': record['thread'],
+                    'args': {
+                        'path': record['path'],
+                        'status': record['status'],
+                        'bytes_out': record['bytes_out'],
+                        'bytes_in': record['bytes_in'],
+                        'encode_ms': record['encode_s'] * 1000,
+                        'decode_ms': record['decode_s'] * 1000
+                    }
+                } for record in self.records],
+                'displayTimeUnit': 'ms'
+            }, f)
+
+
+REQUEST_LOG = RequestLog()
+
+
+def report_timings():
+    '''Report the log as configured by the environment, see suite_config'''
+    if os.environ.get('ES_REQUEST_TIMINGS', '0') != '0':
+        sys.stderr.write('\n%s\n' % REQUEST_LOG.format())
+    if os.environ.get('ES_REQUEST_TIMINGS_JSON'):
+        REQUEST_LOG.write_json(os.environ['ES_REQUEST_TIMINGS_JSON'])
+    if os.environ.get('ES_REQUEST_TRACE'):
+        REQUEST_LOG.write_trace(os.environ['ES_REQUEST_TRACE'])
+
+
+class TimedConnectionMixin(object):
+    """
+    Client connection class recording every request in REQUEST_LOG.
+    """
+
+    def log_request_success(self, method, full_url, path, body, status_code,
+                            response, duration):
+        REQUEST_LOG.record(method, path, status_code, body, response, duration)
+        super().log_request_success(
+            method, full_url, path, body, status_code, response, duration)
+
+    def log_request_fail(self, method, full_url, path, body, duration,
+                         status_code=None, response=None, exception=None):
+        REQUEST_LOG.record(method, path, status_code, body, response, duration)
+        super().log_request_fail(
+            method, full_url, path, body, duration, status_code=status_code,
+            response=response, exception=exception)
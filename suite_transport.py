@@ -0,0 +1,356 @@
+"""
+Transport used by the test suite.
+
+Wraps the default elasticsearch-py transport so the suite knows which
+indices every test touched and can drop only those afterwards, instead of
+wiping the whole cluster with `DELETE /_all`.
+
+When an index prefix is given, every index name sent to the cluster is
+namespaced with it and stripped again from `_index` in the responses, so
+parallel workers never see each other's documents while the tests keep
+using plain names like 'twitter'.
+
+Instead of forcing a refresh with every write, the transport can keep
+track of indices with writes not yet visible to search and refresh them
+all in a single request right before the next search dependent call, see
+VISIBILITY_MODES.
+
+Given a ReadCache (see suite_cache.py), repeated real-time reads are
+answered from memory until one of their indices is written to.
+
+With ES_MEMORY=1 the memory each request takes is traced, see
+suite_memory.py.
+"""
+import json
+import re
+from urllib.parse import quote, unquote
+
+from elasticsearch import Transport
+
+try:
+    from elasticsearch import AsyncTransport
+except ImportError:  # aiohttp is not installed
+    AsyncTransport = None
+
+from suite_memory import MEMORY_LOG
+
+# Matches the `_index` metadata of bulk action lines without parsing them,
+# in text and in pre-encoded bodies.
+BULK_INDEX = re.compile(r'"_index"\s*:\s*"((?:[^"\\]|\\.)*)"')
+BULK_INDEX_BYTES = re.compile(BULK_INDEX.pattern.encode('ascii'))
+# How writes become visible to search:
+#   explicit  requests are sent as they are (default)
+#   batched   indices written to are refreshed in one request before the
+#             next search, count, by-query or reindex call
+#   wait_for  document writes wait for a refresh (`refresh=wait_for`)
+#   refresh   every write forces a refresh (`refresh=true`)
+# All but `explicit` fall back to batching for writes that can't take the
+# mode as a parameter, and leave a `refresh` given by the caller alone.
+VISIBILITY_MODES = ('explicit', 'batched', 'wait_for', 'refresh')
+# APIs writing documents, those taking `refresh=wait_for` and those
+# reading through search.
+WRITE_APIS = (
+    '_doc', '_create', '_update', '_bulk',
+    '_delete_by_query', '_update_by_query', '_reindex')
+DOC_WRITE_APIS = ('_doc', '_create', '_update', '_bulk')
+SEARCH_APIS = (
+    '_search', '_msearch', '_count',
+    '_delete_by_query', '_update_by_query', '_reindex')
+
+
+def make_index_path(indices):
+    '''Build a URL path for a comma separated list of indices, escaped the
+    same way as the client does it'''
+    return '/' + quote(','.join(indices), safe=',*')
+
+
+def endpoint_of(url):
+    '''Return the last segment of a URL path, e.g. `_bulk`'''
+    return url.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+
+
+def api_of(url):
+    '''Return the first API segment of a URL path, e.g. `_doc` for
+    `/twitter/_doc/1`, or None for index level requests'''
+    for segment in url.split('?', 1)[0].strip('/').split('/'):
+        if segment.startswith('_'):
+            return segment
+    return None
+
+
+def bulk_text(body):
+    '''Return a bulk body as a NDJSON string'''
+    if isinstance(body, (bytes, memoryview)):
+        return str(body, 'utf-8')
+    if not isinstance(body, str):
+        return '\n'.join(json.dumps(line) for line in body) + '\n'
+    return body
+
+
+def indices_from_path(url):
+    '''Return index names addressed by the first segment of a URL path.
+    API endpoints (`/_bulk`, `/_mget`, ...) and wildcards are ignored'''
+    segment = url.lstrip('/').split('/', 1)[0]
+    if not segment or segment.startswith('_'):
+        return set()
+    return {
+        name for name in unquote(segment).split(',')
+        if name and '*' not in name and not name.startswith('_')
+    }
+
+
+def indices_from_body(url, body):
+    '''Return index names referenced from the body of multi-index APIs'''
+    if body is None:
+        return set()
+    endpoint = endpoint_of(url)
+    if endpoint == '_bulk':
+        if isinstance(body, (bytes, memoryview)):
+            return {
+                json.loads(b'"%s"' % name)
+                for name in BULK_INDEX_BYTES.findall(body)
+            }
+        return {
+            json.loads('"%s"' % name)
+            for name in BULK_INDEX.findall(bulk_text(body))
+        }
+    if not isinstance(body, dict):
+        return set()
+    if endpoint == '_reindex':
+        dest = body.get('dest', {}).get('index')
+        return {dest} if dest else set()
+    if endpoint in ('_mget', '_mtermvectors'):
+        return {
+            doc['_index'] for doc in body.get('docs', []) if '_index' in doc
+        }
+    return set()
+
+
+def prefix_path(url, prefix):
+    '''Prefix every index name in the first segment of a URL path'''
+    segment, slash, rest = url.lstrip('/').partition('/')
+    if not segment or segment.startswith('_'):
+        return url
+    names = [
+        name if name.startswith('_') else prefix + name
+        for name in unquote(segment).split(',')
+    ]
+    return make_index_path(names) + slash + rest
+
+
+def prefix_body(url, body, prefix):
+    '''Prefix index names referenced from the body of multi-index APIs'''
+    if body is None:
+        return body
+    endpoint = endpoint_of(url)
+    if endpoint == '_bulk':
+        if isinstance(body, (bytes, memoryview)):
+            return BULK_INDEX_BYTES.sub(
+                lambda m: b'"_index":"%s%s"' % (
+                    prefix.encode('utf-8'), m.group(1)),
+                body)
+        return BULK_INDEX.sub(
+            lambda m: '"_index":"%s%s"' % (prefix, m.group(1)),
+            bulk_text(body))
+    if not isinstance(body, dict):
+        return body
+    if endpoint == '_reindex':
+        body = dict(body)
+        for key in ('source', 'dest'):
+            if 'index' in body.get(key, {}):
+                names = body[key]['index']
+                if isinstance(names, str):
+                    names = prefix + names
+                else:
+                    names = [prefix + name for name in names]
+                body[key] = dict(body[key], index=names)
+    elif endpoint in ('_mget', '_mtermvectors') and 'docs' in body:
+        body = dict(body, docs=[
+            dict(doc, _index=prefix + doc['_index'])
+            if '_index' in doc else doc
+            for doc in body['docs']
+        ])
+    return body
+
+
+def strip_prefix(data, prefix):
+    '''Remove the prefix from every `_index` value of a response'''
+    if isinstance(data, dict):
+        return {
+            key: value[len(prefix):]
+            if key == '_index' and isinstance(value, str)
+            and value.startswith(prefix)
+            else strip_prefix(value, prefix)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [strip_prefix(value, prefix) for value in data]
+    return data
+
+
+class SuiteTransportMixin(object):
+    """
+    Request rewriting and index tracking shared by the sync and async
+    transports of the suite.
+    """
+
+    def __init__(self, *args, index_prefix='', visibility='explicit',
+                 read_cache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index_prefix = index_prefix
+        self.visibility = visibility
+        self.read_cache = read_cache
+        self.touched_indices = set()
+        # Indices with writes not yet visible to search.
+        self.dirty_indices = set()
+
+    @property
+    def visibility(self):
+        return self._visibility
+
+    @visibility.setter
+    def visibility(self, mode):
+        if mode not in VISIBILITY_MODES:
+            raise ValueError(
+                'Unknown visibility mode %r, expected one of %s' % (
+                    mode, ', '.join(VISIBILITY_MODES)))
+        self._visibility = mode
+
+    def prepare_request(self, method, url, params, body):
+        '''Namespace a request and record the indices it touches. Returns
+        the request and the path refreshing pending writes it has to wait
+        for, if any'''
+        if self.index_prefix:
+            url = prefix_path(url, self.index_prefix)
+            body = prefix_body(url, body, self.index_prefix)
+        indices = indices_from_path(url) | indices_from_body(url, body)
+        self.touched_indices |= indices
+        params, refresh = self.plan_visibility(method, url, params, indices)
+        return url, params, body, refresh
+
+    def plan_visibility(self, method, url, params, indices):
+        '''Apply the visibility mode to a request addressed to `indices`,
+        returning its params and the pending refresh'''
+        if self.visibility == 'explicit':
+            return params, None
+        api = api_of(url)
+        refresh = None
+        if api in SEARCH_APIS and self.dirty_indices:
+            refresh = make_index_path(sorted(self.dirty_indices)) + '/_refresh'
+            self.dirty_indices.clear()
+        elif api == '_refresh' or (api is None and method == 'DELETE'):
+            if indices:
+                self.dirty_indices -= indices
+            else:
+                self.dirty_indices.clear()
+        if api in WRITE_APIS and method not in ('GET', 'HEAD'):
+            value = (params or {}).get('refresh')
+            if value is None and (self.visibility == 'refresh' or (
+                    self.visibility == 'wait_for' and api in DOC_WRITE_APIS)):
+                value = 'true' if self.visibility == 'refresh' else 'wait_for'
+                params = dict(params or {}, refresh=value)
+            if value in (None, 'false'):
+                self.dirty_indices |= indices
+        return params, refresh
+
+    def lookup_cache(self, method, url, params, body, refresh):
+        '''Look a prepared request up in the read cache. Returns whether it
+        was a hit, the cached response and the callback to pass the
+        response of the request to otherwise'''
+        if self.read_cache is None:
+            return False, None, None
+        if refresh:
+            self.read_cache.invalidate(indices_from_path(refresh))
+        return self.read_cache.lookup(
+            method, url, params, body,
+            indices_from_path(url) | indices_from_body(url, body))
+
+    def encode_body(self, body):
+        '''Encode a body with the serializer's `encode`, if it has one, so
+        the bytes it returns are sent without a round trip through text'''
+        encode = getattr(self.serializer, 'encode', None)
+        if encode is None or body is None or isinstance(
+                body, (str, bytes, memoryview)):
+            return body
+        return encode(body)
+
+    def finish_response(self, response):
+        if self.index_prefix:
+            response = strip_prefix(response, self.index_prefix)
+        return response
+
+    def pop_touched_indices(self):
+        '''Forget the tracked indices, returning the URL path deleting
+        them, if any'''
+        touched, self.touched_indices = self.touched_indices, set()
+        self.dirty_indices.clear()
+        if self.read_cache is not None and touched:
+            self.read_cache.forget(touched)
+        return make_index_path(sorted(touched)) if touched else None
+
+
+class SuiteTransport(SuiteTransportMixin, Transport):
+    """
+    Transport that remembers every index a request was addressed to,
+    optionally namespaces all index names with `index_prefix` and makes
+    writes visible to search as set by `visibility`.
+    """
+
+    def perform_request(self, method, url, headers=None,
+                        params=None, body=None):
+        url, params, body, refresh = self.prepare_request(
+            method, url, params, body)
+        if refresh:
+            super().perform_request(
+                'POST', refresh, params={'ignore_unavailable': 'true'})
+        hit, response, done = self.lookup_cache(
+            method, url, params, body, refresh)
+        if hit:
+            return response
+        with MEMORY_LOG.request(method, url):
+            response = self.finish_response(super().perform_request(
+                method, url, headers=headers, params=params,
+                body=self.encode_body(body)))
+        if done is not None:
+            done(response)
+        return response
+
+    def drop_touched_indices(self):
+        '''Delete all tracked indices in one request and forget them'''
+        path = self.pop_touched_indices()
+        if path:
+            super().perform_request(
+                'DELETE', path, params={'ignore_unavailable': 'true'})
+
+
+if AsyncTransport is not None:
+    class AsyncSuiteTransport(SuiteTransportMixin, AsyncTransport):
+        """
+        SuiteTransport for AsyncElasticsearch.
+        """
+
+        async def perform_request(self, method, url, headers=None,
+                                  params=None, body=None):
+            url, params, body, refresh = self.prepare_request(
+                method, url, params, body)
+            if refresh:
+                await super().perform_request(
+                    'POST', refresh, params={'ignore_unavailable': 'true'})
+            hit, response, done = self.lookup_cache(
+                method, url, params, body, refresh)
+            if hit:
+                return response
+            with MEMORY_LOG.request(method, url):
+                response = self.finish_response(await super().perform_request(
+                    method, url, headers=headers, params=params,
+                    body=self.encode_body(body)))
+            if done is not None:
+                done(response)
+            return response
+
+        async def drop_touched_indices(self):
+            '''Delete all tracked indices in one request and forget them'''
+            path = self.pop_touched_indices()
+            if path:
+                await super().perform_request(
+                    'DELETE', path, params={'ignore_unavailable': 'true'})
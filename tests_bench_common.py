@@ -0,0 +1,37 @@
+import unittest
+
+from bench_common import measure, percentile, summarize
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        '''The p-th percentile is the sample at rank ceil(p% of n)'''
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 95), 5)
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 0), 1)
+        self.assertIsNone(percentile([], 50))
+
+
+class SummarizeTest(unittest.TestCase):
+
+    def test_failed_calls(self):
+        '''Failed calls are counted but left out of the throughput and
+        latencies'''
+        def operation(i):
+            if i % 2:
+                raise ValueError(i)
+
+        latencies, elapsed, errors = measure(operation, 10, 2)
+        self.assertEqual((len(latencies), len(errors)), (5, 5))
+        result = summarize([0.001] * 5, 1.0, errors, 10)
+        self.assertEqual(result['operations'], 10)
+        self.assertEqual(result['errors'], 5)
+        self.assertEqual(result['ops_per_sec'], 5)
+        self.assertEqual(result['docs_per_sec'], 50)
+        self.assertEqual(result['latency_ms']['max'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
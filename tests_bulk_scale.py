@@ -0,0 +1,302 @@
+"""
+Bulk ingestion at scale through `helpers.streaming_bulk` and
+`helpers.parallel_bulk`.
+
+Actions are generated lazily and never materialized as a list. The volume
+and chunking are tuned with environment variables:
+
+    ES_BULK_DOCS             number of actions (default 10000)
+    ES_BULK_CHUNK_SIZE       actions per bulk request (default 500)
+    ES_BULK_MAX_CHUNK_BYTES  bytes per bulk request (default 100MB)
+    ES_BULK_THREADS          parallel_bulk threads (default 4)
+    ES_BULK_QUEUE_SIZE       parallel_bulk queued chunks (default 4)
+
+The same actions are also written to an NDJSON file and indexed from a
+memory map of it with suite_ndjson.py. Achieved docs/sec are reported
+once the class is done.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from elasticsearch.helpers import (
+    BulkIndexError,
+    parallel_bulk,
+    streaming_bulk,
+)
+
+from fixtures import TWEETS, generate
+from suite_case import SuiteTestCase
+from suite_ndjson import (
+    ndjson_bulk,
+    ndjson_chunks,
+    open_ndjson,
+    streaming_ndjson_bulk,
+)
+
+DOCS = int(os.environ.get('ES_BULK_DOCS', 10000))
+CHUNK_SIZE = int(os.environ.get('ES_BULK_CHUNK_SIZE', 500))
+MAX_CHUNK_BYTES = int(os.environ.get(
+    'ES_BULK_MAX_CHUNK_BYTES', 100 * 1024 * 1024))
+THREADS = int(os.environ.get('ES_BULK_THREADS', 4))
+QUEUE_SIZE = int(os.environ.get('ES_BULK_QUEUE_SIZE', 4))
+# Chunks that may be generated but not yet seen by the consumer: the one
+# being assembled, the one waiting for room in the queue, those queued, in
+# flight on every thread or finished but not consumed. It depends on the
+# chunking only, never on the number of actions.
+MAX_CHUNKS_AHEAD = 2 * (THREADS + max(QUEUE_SIZE, THREADS)) + 2
+# Every n-th action of the failing streams is a create of an existing id.
+CONFLICT_EVERY = 100
+
+
+class ActionStream(object):
+    """
+    Lazily generated index actions of the tweets of fixtures.generate,
+    counting how many were produced so tests can check the helpers never
+    run far ahead.
+    """
+
+    def __init__(self, count, conflict_every=None):
+        self.count = count
+        self.conflict_every = conflict_every
+        self.produced = 0
+
+    def conflicts(self):
+        if not self.conflict_every:
+            return 0
+        return len(range(0, self.count, self.conflict_every))
+
+    def __iter__(self):
+        for i, tweet in enumerate(generate('tweet', self.count)):
+            self.produced += 1
+            if self.conflict_every and i % self.conflict_every == 0:
+                yield {
+                    '_op_type': 'create',
+                    '_index': 'twitter',
+                    '_id': 'existing',
+                    '_source': tweet
+                }
+            else:
+                yield {
+                    '_index': 'twitter',
+                    '_id': i,
+                    '_source': tweet
+                }
+
+    def write_ndjson(self, f):
+        '''Write the actions as bulk NDJSON lines'''
+        for action in self:
+            meta = {k: v for k, v in action.items() if k[0] == '_'}
+            op_type = meta.pop('_op_type', 'index')
+            source = meta.pop('_source')
+            f.write(json.dumps({op_type: meta}).encode('utf-8') + b'\n')
+            f.write(json.dumps(source).encode('utf-8') + b'\n')
+        f.flush()
+
+
+class NdjsonChunksTest(unittest.TestCase):
+
+    DATA = (
+        b'{"index":{"_index":"twitter","_id":1}}\n'
+        b'{"user":"kimchy"}\n'
+        b'\n'
+        b'{ "delete" : {"_index":"twitter","_id":2}}\n'
+        b'{"create":{"_index":"twitter","_id":3}}\n'
+        b'{"user":"japchae"}')
+
+    def test_actions(self):
+        '''Delete actions have no source line, blank lines are skipped'''
+        self.assertEqual(
+            [chunk.actions for chunk in ndjson_chunks(self.DATA, 2)],
+            [[(1, 0), (4, 58)], [(5, 101)]])
+
+    def test_whitespace_lines(self):
+        '''Lines of whitespace only are skipped like blank lines'''
+        data = self.DATA.replace(b'\n\n', b'\n  \t \r\n')
+        self.assertEqual(
+            [chunk.actions for chunk in ndjson_chunks(data, 2)],
+            [[(1, 0), (4, 63)], [(5, 106)]])
+
+    def test_chunks(self):
+        '''Chunks hold whole actions and are cut by size in bytes'''
+        chunks = list(ndjson_chunks(self.DATA, max_chunk_bytes=60))
+        self.assertEqual(
+            [self.DATA[c.start:c.end] for c in chunks],
+            [self.DATA[:57], self.DATA[58:101], self.DATA[101:]])
+
+
+class BulkScaleTest(SuiteTestCase):
+
+    indices = ('twitter',)
+    rates = []
+
+    @classmethod
+    def tearDownClass(cls):
+        for name, docs, elapsed in cls.rates:
+            sys.stderr.write('\n%s: %d actions in %.3fs (%.0f docs/s)' % (
+                name, docs, elapsed, docs / elapsed if elapsed else 0))
+        sys.stderr.write('\n')
+
+    def consume(self, name, results, stream):
+        '''Drain the helper's results, checking the stream is consumed
+        lazily, and return the failed items'''
+        failures = []
+        start = time.perf_counter()
+        for done, (ok, item) in enumerate(results, 1):
+            self.assertLessEqual(
+                stream.produced - done, CHUNK_SIZE * MAX_CHUNKS_AHEAD)
+            if not ok:
+                failures.append(item)
+        self.rates.append((name, stream.count, time.perf_counter() - start))
+        return failures
+
+    def seed_existing(self):
+        self.es.index(index='twitter', id='existing', body=TWEETS[0])
+
+    def test_streaming_bulk_count(self):
+        '''Every generated action is indexed by streaming_bulk'''
+        stream = ActionStream(DOCS)
+        failures = self.consume('streaming_bulk', streaming_bulk(
+            self.es, stream,
+            chunk_size=CHUNK_SIZE,
+            max_chunk_bytes=MAX_CHUNK_BYTES), stream)
+        self.es.indices.refresh(index='twitter')
+        self.assertEqual(failures, [])
+        self.assertEqual(
+            self.es.count(index='twitter')['count'],
+            DOCS)
+
+    def test_parallel_bulk_count(self):
+        '''Every generated action is indexed by parallel_bulk'''
+        stream = ActionStream(DOCS)
+        failures = self.consume('parallel_bulk', parallel_bulk(
+            self.es, stream,
+            thread_count=THREADS,
+            queue_size=QUEUE_SIZE,
+            chunk_size=CHUNK_SIZE,
+            max_chunk_bytes=MAX_CHUNK_BYTES), stream)
+        self.es.indices.refresh(index='twitter')
+        self.assertEqual(failures, [])
+        self.assertEqual(
+            self.es.count(index='twitter')['count'],
+            DOCS)
+
+    def test_streaming_bulk_errors(self):
+        '''Failed items are reported one by one, in the same shape as the
+         errors of BulkIndexError'''
+        self.seed_existing()
+        stream = ActionStream(DOCS, CONFLICT_EVERY)
+        failures = self.consume('streaming_bulk with errors', streaming_bulk(
+            self.es, stream,
+            chunk_size=CHUNK_SIZE,
+            max_chunk_bytes=MAX_CHUNK_BYTES,
+            raise_on_error=False), stream)
+        self.assertEqual(len(failures), stream.conflicts())
+        for failure in failures:
+            self.assertEqual(list(failure), ['create'])
+            self.assertEqual(failure['create']['_id'], 'existing')
+            self.assertEqual(failure['create']['status'], 409)
+            self.assertEqual(
+                failure['create']['error']['type'],
+                'version_conflict_engine_exception')
+        self.es.indices.refresh(index='twitter')
+        self.assertEqual(
+            self.es.count(index='twitter')['count'],
+            DOCS - stream.conflicts() + 1)
+
+    def test_parallel_bulk_errors(self):
+        '''Failed items of parallel_bulk are reported like those of
+         streaming_bulk'''
+        self.seed_existing()
+        stream = ActionStream(DOCS, CONFLICT_EVERY)
+        failures = self.consume('parallel_bulk with errors', parallel_bulk(
+            self.es, stream,
+            thread_count=THREADS,
+            queue_size=QUEUE_SIZE,
+            chunk_size=CHUNK_SIZE,
+            max_chunk_bytes=MAX_CHUNK_BYTES,
+            raise_on_error=False), stream)
+        self.assertEqual(len(failures), stream.conflicts())
+        self.assertEqual(
+            {failure['create']['status'] for failure in failures},
+            {409})
+
+    def test_streaming_bulk_raises(self):
+        '''With raise_on_error, streaming_bulk stops at the first failed
+         chunk with a BulkIndexError listing its failed items'''
+        self.seed_existing()
+        stream = ActionStream(DOCS, CONFLICT_EVERY)
+        with self.assertRaises(BulkIndexError) as raised:
+            for _ in streaming_bulk(
+                    self.es, stream,
+                    chunk_size=CHUNK_SIZE,
+                    max_chunk_bytes=MAX_CHUNK_BYTES):
+                pass
+        errors = raised.exception.errors
+        self.assertEqual(
+            len(errors),
+            len(range(0, min(CHUNK_SIZE, DOCS), CONFLICT_EVERY)))
+        self.assertEqual(errors[0]['create']['status'], 409)
+        self.assertLessEqual(stream.produced, CHUNK_SIZE + 1)
+
+    def ndjson_file(self, stream):
+        f = tempfile.NamedTemporaryFile(suffix='.ndjson')
+        self.addCleanup(f.close)
+        stream.write_ndjson(f)
+        return f.name
+
+    def test_ndjson_bulk_count(self):
+        '''Every action of a memory mapped NDJSON file is indexed'''
+        stream = ActionStream(DOCS)
+        with open_ndjson(self.ndjson_file(stream)) as data:
+            start = time.perf_counter()
+            success, errors = ndjson_bulk(
+                self.es, data,
+                chunk_size=CHUNK_SIZE,
+                max_chunk_bytes=MAX_CHUNK_BYTES)
+            self.rates.append(
+                ('ndjson_bulk', DOCS, time.perf_counter() - start))
+        self.assertEqual((success, errors), (DOCS, []))
+        self.es.indices.refresh(index='twitter')
+        self.assertEqual(
+            self.es.count(index='twitter')['count'],
+            DOCS)
+
+    def test_ndjson_bulk_errors(self):
+        '''Failed items point at the line and offset of their action'''
+        self.seed_existing()
+        stream = ActionStream(DOCS, CONFLICT_EVERY)
+        with open_ndjson(self.ndjson_file(stream)) as data:
+            failures = [item for ok, item in streaming_ndjson_bulk(
+                self.es, data,
+                chunk_size=CHUNK_SIZE,
+                max_chunk_bytes=MAX_CHUNK_BYTES,
+                raise_on_error=False) if not ok]
+            self.assertEqual(len(failures), stream.conflicts())
+            for i, failure in zip(range(0, DOCS, CONFLICT_EVERY), failures):
+                self.assertEqual(failure['create']['status'], 409)
+                self.assertEqual(failure['create']['line'], 2 * i + 1)
+                offset = failure['create']['offset']
+                self.assertEqual(
+                    json.loads(data[offset:data.find(b'\n', offset)]),
+                    {'create': {'_index': 'twitter', '_id': 'existing'}})
+
+    def test_ndjson_bulk_raises(self):
+        '''With raise_on_error, the failed items of the first failed chunk
+         are raised in a BulkIndexError'''
+        self.seed_existing()
+        stream = ActionStream(DOCS, CONFLICT_EVERY)
+        with open_ndjson(self.ndjson_file(stream)) as data:
+            with self.assertRaises(BulkIndexError) as raised:
+                ndjson_bulk(self.es, data, chunk_size=CHUNK_SIZE)
+        errors = raised.exception.errors
+        self.assertEqual(
+            len(errors),
+            len(range(0, min(CHUNK_SIZE, DOCS), CONFLICT_EVERY)))
+        self.assertEqual(errors[0]['create']['line'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,176 @@
+"""
+delete_by_query and update_by_query at scale, run as tasks.
+
+Every test seeds the tweets of fixtures.generate through
+`helpers.streaming_bulk` into an index of each configured number of
+shards, starts the by-query request with `wait_for_completion=False`,
+`slices` and `requests_per_second`, and polls the Tasks API until it
+completes (see suite_tasks.py). The volume, slicing and throttling are
+tuned with environment variables:
+
+    ES_BY_QUERY_DOCS         seeded tweets (default 10000)
+    ES_BY_QUERY_SHARDS       comma separated shard counts (default 1,2,4)
+    ES_BY_QUERY_SLICES       slices of every request (default auto)
+    ES_BY_QUERY_RPS          requests_per_second, -1 unthrottled (default -1)
+    ES_BY_QUERY_SCROLL_SIZE  documents per batch (default 1000)
+    ES_BY_QUERY_POLL         seconds between polls (default 0.05)
+    ES_BY_QUERY_TIMEOUT      seconds before a task is cancelled (default 600)
+
+Throughput of every slice is reported once the class is done.
+"""
+import os
+import sys
+import unittest
+from elasticsearch.helpers import streaming_bulk
+
+from fixtures import generate
+from suite_case import SuiteTestCase
+from suite_tasks import follow_task, processed, slice_rates
+
+DOCS = int(os.environ.get('ES_BY_QUERY_DOCS', 10000))
+SHARDS = [
+    int(s) for s in os.environ.get('ES_BY_QUERY_SHARDS', '1,2,4').split(',')
+]
+SLICES = os.environ.get('ES_BY_QUERY_SLICES', 'auto')
+RPS = float(os.environ.get('ES_BY_QUERY_RPS', -1))
+SCROLL_SIZE = int(os.environ.get('ES_BY_QUERY_SCROLL_SIZE', 1000))
+POLL_INTERVAL = float(os.environ.get('ES_BY_QUERY_POLL', 0.05))
+TIMEOUT = float(os.environ.get('ES_BY_QUERY_TIMEOUT', 600))
+KIMCHY = {"query": {"term": {"user": "kimchy"}}}
+
+
+class ByQueryScaleTest(SuiteTestCase):
+
+    indices = ('twitter',)
+    rates = []
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # kimchy's tweets, and those with twits '2' once kimchy's are.
+        cls.kimchy = cls.twits_2 = 0
+        for tweet in generate('tweet', DOCS):
+            cls.kimchy += tweet['user'] == 'kimchy'
+            cls.twits_2 += tweet['user'] == 'kimchy' or tweet['twits'] == '2'
+
+    @classmethod
+    def tearDownClass(cls):
+        for name, shards, rate in cls.rates:
+            sys.stderr.write(
+                '\n%s shards=%d slice=%d: %d docs in %.3fs (%s docs/s), '
+                '%d batches, throttled %dms' % (
+                    name, shards, rate['slice_id'], rate['docs'],
+                    rate['elapsed_s'], rate['docs_per_sec'], rate['batches'],
+                    rate['throttled_ms']))
+        sys.stderr.write('\n')
+
+    def seed(self, shards):
+        '''Index DOCS tweets into a new index of `shards` shards'''
+        self.es.indices.delete(index='twitter', ignore_unavailable=True)
+        self.es.indices.create(
+            index='twitter',
+            body={'settings': {'number_of_shards': shards}})
+        for ok, item in streaming_bulk(self.es, (
+                {'_index': 'twitter', '_id': i, '_source': tweet}
+                for i, tweet in enumerate(generate('tweet', DOCS))
+        ), chunk_size=1000):
+            self.assertTrue(ok, item)
+        self.es.indices.refresh(index='twitter')
+
+    def run_task(self, name, shards, start, **kwargs):
+        '''Start a by-query request as a task, follow it to completion and
+        record the throughput of its slices. Its writes are refreshed'''
+        kwargs.setdefault('requests_per_second', RPS)
+        kwargs.setdefault('scroll_size', SCROLL_SIZE)
+        task = start(
+            index='twitter',
+            wait_for_completion=False,
+            slices=SLICES,
+            conflicts='proceed',
+            **kwargs)['task']
+        finished = follow_task(self.es, task, POLL_INTERVAL, TIMEOUT)
+        self.es.indices.refresh(index='twitter')
+        self.rates.extend(
+            (name, shards, rate) for rate in slice_rates(finished))
+        return finished
+
+    def check_slices(self, response, shards):
+        '''slices=auto gives a slice per shard, which add up to the total'''
+        if SLICES == 'auto':
+            expected = shards
+        else:
+            expected = int(SLICES)
+        if expected == 1:
+            self.assertNotIn('slices', response)
+            return
+        self.assertEqual(len(response['slices']), expected)
+        self.assertEqual(
+            sum(s['total'] for s in response['slices']),
+            response['total'])
+        self.assertEqual(
+            sum(processed(s) for s in response['slices']),
+            processed(response))
+
+    def test_delete_by_query_sliced(self):
+        '''Every tweet of kimchy is deleted, whatever the number of slices'''
+        for shards in SHARDS:
+            with self.subTest(shards=shards):
+                self.seed(shards)
+                response = self.run_task(
+                    'delete_by_query', shards, self.es.delete_by_query,
+                    body=KIMCHY).response
+                self.assertEqual(response['deleted'], self.kimchy)
+                self.assertEqual(response['failures'], [])
+                self.check_slices(response, shards)
+                self.assertEqual(
+                    self.es.count(index='twitter')['count'],
+                    DOCS - self.kimchy)
+
+    def test_update_by_query_sliced(self):
+        '''Every tweet of kimchy is updated by a script exactly once'''
+        for shards in SHARDS:
+            with self.subTest(shards=shards):
+                self.seed(shards)
+                response = self.run_task(
+                    'update_by_query', shards, self.es.update_by_query,
+                    body=dict(KIMCHY, script="ctx._source.twits = '2'")
+                ).response
+                self.assertEqual(response['updated'], self.kimchy)
+                self.assertEqual(response['version_conflicts'], 0)
+                self.check_slices(response, shards)
+                self.assertEqual(
+                    self.es.count(index='twitter', body={
+                        "query": {"term": {"twits": "2"}}})['count'],
+                    self.twits_2)
+
+    def test_throttled_progress(self):
+        '''A throttled task reports growing progress while it runs'''
+        self.seed(SHARDS[-1])
+        batch = max(1, self.kimchy // 10)
+        # Ten batches of kimchy's tweets in about half a second.
+        finished = self.run_task(
+            'throttled update_by_query', SHARDS[-1], self.es.update_by_query,
+            body=KIMCHY, requests_per_second=batch * 20, scroll_size=batch)
+        self.assertEqual(finished.response['updated'], self.kimchy)
+        self.assertGreater(finished.response['throttled_millis'], 0)
+        done = [processed(status) for _, status in finished.progress]
+        self.assertGreater(len(done), 2)
+        self.assertEqual(done, sorted(done))
+
+    def test_cancel(self):
+        '''A cancelled task stops before working through every document'''
+        self.seed(SHARDS[0])
+        task = self.es.delete_by_query(
+            index='twitter',
+            body=KIMCHY,
+            wait_for_completion=False,
+            scroll_size=1,
+            requests_per_second=1)['task']
+        self.es.tasks.cancel(task_id=task)
+        response = follow_task(self.es, task, POLL_INTERVAL, TIMEOUT).response
+        self.assertEqual(response['canceled'], 'by user request')
+        self.assertLess(response['deleted'], self.kimchy)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
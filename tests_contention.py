@@ -0,0 +1,197 @@
+"""
+Optimistic concurrency control under contention on a few hot documents.
+
+Many writers increment the counters of the same small set of documents at
+once, either client-side (read the document, write it back with its
+`if_seq_no` and `if_primary_term`, start over on a conflict) or
+server-side (a scripted update with `retry_on_conflict`, repeated by the
+client when the retries run out). Afterwards every counter must equal the
+number of increments acknowledged for it, so no update was lost. Writers
+are threads sharing the test's client, or processes with a client each:
+
+    ES_CONTENTION_DOCS        hot documents (default 4)
+    ES_CONTENTION_WRITERS     concurrent writers (default 8)
+    ES_CONTENTION_UPDATES     acknowledged increments per writer (default 50)
+    ES_CONTENTION_RETRIES     retry_on_conflict of scripted updates (default 3)
+    ES_CONTENTION_PROCESSES   1 runs the writers as processes (default 0)
+
+Updates/sec, the conflict rate and the requests sent per acknowledged
+update are reported once the class is done.
+"""
+import os
+import sys
+import time
+import unittest
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from elasticsearch import ConflictError, Elasticsearch
+
+from suite_case import SuiteTestCase
+from suite_config import client_options, es_hosts
+from suite_transport import SuiteTransport
+
+HOT_DOCS = int(os.environ.get('ES_CONTENTION_DOCS', 4))
+WRITERS = int(os.environ.get('ES_CONTENTION_WRITERS', 8))
+UPDATES = int(os.environ.get('ES_CONTENTION_UPDATES', 50))
+RETRIES = int(os.environ.get('ES_CONTENTION_RETRIES', 3))
+PROCESSES = os.environ.get('ES_CONTENTION_PROCESSES', '0') != '0'
+INCREMENT = {'script': {'source': 'ctx._source.counter += 1'}}
+
+# What a writer did: acknowledged increments per document, requests sent
+# and how many of them were rejected with a conflict.
+Outcome = namedtuple('Outcome', ['increments', 'requests', 'conflicts'])
+
+
+def hot_id(writer, done):
+    '''The document a writer increments next, spreading writers evenly'''
+    return 'hot%d' % ((writer + done) % HOT_DOCS)
+
+
+def increment_if_unchanged(es, doc_id):
+    '''Read a counter and write it back incremented, unless someone else
+    wrote the document in between. Returns the requests sent'''
+    doc = es.get(index='test', id=doc_id)
+    es.index(
+        index='test',
+        id=doc_id,
+        body={'counter': doc['_source']['counter'] + 1},
+        if_seq_no=doc['_seq_no'],
+        if_primary_term=doc['_primary_term'])
+    return 2
+
+
+def increment_by_script(es, doc_id):
+    '''Increment a counter with a scripted update retried on the node'''
+    es.update(index='test', id=doc_id, body=INCREMENT,
+              retry_on_conflict=RETRIES)
+    return 1
+
+
+STRATEGIES = {
+    'if_seq_no': increment_if_unchanged,
+    'retry_on_conflict': increment_by_script,
+}
+
+
+def write(es, strategy, writer, updates):
+    '''Make `updates` acknowledged increments, starting over on every
+    conflict, and return the Outcome'''
+    increment = STRATEGIES[strategy]
+    increments = Counter()
+    requests = conflicts = 0
+    while sum(increments.values()) < updates:
+        doc_id = hot_id(writer, sum(increments.values()))
+        try:
+            requests += increment(es, doc_id)
+        except ConflictError:
+            requests += 1 if strategy == 'retry_on_conflict' else 2
+            conflicts += 1
+            continue
+        increments[doc_id] += 1
+    return Outcome(increments, requests, conflicts)
+
+
+def write_in_process(spec):
+    '''Run a writer with a client of its own'''
+    hosts, prefix, strategy, writer, updates = spec
+    es = Elasticsearch(hosts, transport_class=SuiteTransport,
+                       index_prefix=prefix, **client_options())
+    try:
+        return write(es, strategy, writer, updates)
+    finally:
+        es.close()
+
+
+class ContentionTest(SuiteTestCase):
+
+    indices = ('test',)
+    rates = []
+
+    @classmethod
+    def tearDownClass(cls):
+        for name, updates, elapsed, requests, conflicts in cls.rates:
+            sys.stderr.write(
+                '\n%s: %d updates by %d %s in %.3fs (%.0f updates/s), '
+                '%d conflicts (%.1f%% of requests), %.2f requests per '
+                'update' % (
+                    name, updates, WRITERS,
+                    'processes' if PROCESSES else 'threads', elapsed,
+                    updates / elapsed if elapsed else 0, conflicts,
+                    100.0 * conflicts / requests if requests else 0,
+                    requests / updates if updates else 0))
+        sys.stderr.write('\n')
+
+    def seed(self):
+        for i in range(HOT_DOCS):
+            self.es.index(index='test', id='hot%d' % i, body={'counter': 0})
+
+    def contend(self, strategy):
+        '''Run all writers at once and return their outcomes and the time
+        they took'''
+        if PROCESSES:
+            executor = ProcessPoolExecutor(WRITERS)
+            run = write_in_process
+            specs = [(es_hosts(), self.es.transport.index_prefix, strategy,
+                      writer, UPDATES) for writer in range(WRITERS)]
+        else:
+            executor = ThreadPoolExecutor(WRITERS)
+            specs = range(WRITERS)
+
+            def run(writer):
+                return write(self.es, strategy, writer, UPDATES)
+        start = time.perf_counter()
+        with executor:
+            outcomes = list(executor.map(run, specs))
+        return outcomes, time.perf_counter() - start
+
+    def check_no_lost_updates(self, name, outcomes, elapsed):
+        '''Every counter holds all increments acknowledged for it, and its
+        version counts one write per increment'''
+        increments = sum((o.increments for o in outcomes), Counter())
+        self.assertEqual(sum(increments.values()), WRITERS * UPDATES)
+        for i in range(HOT_DOCS):
+            doc = self.es.get(index='test', id='hot%d' % i)
+            self.assertEqual(
+                doc['_source']['counter'], increments['hot%d' % i])
+            self.assertEqual(doc['_version'], increments['hot%d' % i] + 1)
+        self.rates.append((
+            name, WRITERS * UPDATES, elapsed,
+            sum(o.requests for o in outcomes),
+            sum(o.conflicts for o in outcomes)))
+
+    def test_if_seq_no(self):
+        '''Conditional writes of concurrent writers never lose an update'''
+        self.seed()
+        outcomes, elapsed = self.contend('if_seq_no')
+        self.check_no_lost_updates('if_seq_no', outcomes, elapsed)
+
+    def test_retry_on_conflict(self):
+        '''Scripted updates retried on conflict never lose an update'''
+        self.seed()
+        outcomes, elapsed = self.contend('retry_on_conflict')
+        self.check_no_lost_updates('retry_on_conflict', outcomes, elapsed)
+
+    def test_stale_seq_no(self):
+        '''A write conditioned on a sequence number or primary term that
+         is no longer current is rejected'''
+        self.seed()
+        doc = self.es.get(index='test', id='hot0')
+        self.es.index(index='test', id='hot0', body={'counter': 1})
+        with self.assertRaises(ConflictError):
+            self.es.index(
+                index='test', id='hot0', body={'counter': 2},
+                if_seq_no=doc['_seq_no'],
+                if_primary_term=doc['_primary_term'])
+        doc = self.es.get(index='test', id='hot0')
+        with self.assertRaises(ConflictError):
+            self.es.index(
+                index='test', id='hot0', body={'counter': 2},
+                if_seq_no=doc['_seq_no'],
+                if_primary_term=doc['_primary_term'] + 1)
+        self.assertEqual(
+            self.es.get_source(index='test', id='hot0'),
+            {'counter': 1})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
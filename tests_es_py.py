@@ -1,27 +1,21 @@
 import unittest
 from elasticsearch import (
-    Elasticsearch,
     ConflictError,
     NotFoundError,
     RequestError,
 )
-from elasticsearch.client import IndicesClient
 from elasticsearch.helpers import bulk, BulkIndexError
 
+from suite_case import SuiteTestCase
 
-class ElDocumentAPITest(unittest.TestCase):
+# Every index the tests below write to.
+SUITE_INDICES = (
+    'twitter', 'rick&morty', 'client', 'eklmn', 'test', 'new_twitter')
 
-    @classmethod
-    def setUpClass(cls):
-        cls.es = Elasticsearch(
-            [{'host': 'localhost', 'port': 9200}])
 
-    def setUp(self):
-        """
-        Make sure all indices are deleted before each new test is run.
-        """
-        self.indices_client = IndicesClient(client=self.es)
-        self.indices_client.delete(index='_all')
+class ElDocumentAPITest(SuiteTestCase):
+
+    indices = SUITE_INDICES
 
     def test_create_doc_with_id(self):
         '''Check that document is created'''
@@ -146,8 +140,7 @@ class ElDocumentAPITest(unittest.TestCase):
             body={
                 "user": "kimchy",
                 "twits": "1"
-                },
-            refresh=True
+                }
             )
         self.assertEqual(
             self.es.exists_source(
@@ -245,15 +238,15 @@ class ElDocumentAPITest(unittest.TestCase):
             )
 
     def test_delete_by_query(self):
-        '''Check that document gets deleted by query. Refresh is set to 'true'
-         to make created document visible to search'''
+        '''Check that document gets deleted by query. The index is
+         refreshed to make the created document visible to search'''
         self.es.index(
             index='rick&morty',
             id=1,
             body={
                 'name': 'Rick'
-            },
-            refresh=True)
+            })
+        self.es.indices.refresh(index='rick&morty')
         q = {
             "query": {
                 "match": {
@@ -275,8 +268,7 @@ class ElDocumentAPITest(unittest.TestCase):
             id=1,
             body={
                 'name': 'Rick'
-            },
-            refresh=True)
+            })
         q = {
             "query": {
                 "match": {
@@ -297,8 +289,7 @@ class ElDocumentAPITest(unittest.TestCase):
             id=1,
             body={
                 'name': 'Rick'
-            },
-            refresh=True)
+            })
         self.es.update(
             index='rick&morty',
             id=1,
@@ -323,8 +314,7 @@ class ElDocumentAPITest(unittest.TestCase):
             id=1,
             body={
                 'name': 'Morty'
-            },
-            refresh=True)
+            })
         self.es.update(
             index='rick&morty',
             id=1,
@@ -346,8 +336,7 @@ class ElDocumentAPITest(unittest.TestCase):
             id=1,
             body={
                     "counter": 1
-            },
-            refresh=True)
+            })
 
         with self.assertRaises(RequestError):
             self.es.update(
@@ -361,15 +350,15 @@ class ElDocumentAPITest(unittest.TestCase):
             )
 
     def test_update_by_query(self):
-        '''Check that document gets updated by query. Refresh is set to 'true'
-         to make created document visible to search'''
+        '''Check that document gets updated by query. The index is
+         refreshed to make the created document visible to search'''
         self.es.index(
             index='test',
             id=1,
             body={
                 "user": "kimchy"
-                },
-            refresh=True)
+                })
+        self.es.indices.refresh(index='test')
 
         self.assertEqual(
             self.es.update_by_query(
@@ -454,6 +443,21 @@ class ElDocumentAPITest(unittest.TestCase):
                 )['docs'][2]['found'],
             False)
 
+    def test_mget_order(self):
+        '''A single mget returns every requested document in request
+        order, found or not, with its source'''
+
+        for i, name in ((1, 'Rick'), (2, 'Morty')):
+            self.es.create(index='rick&morty', id=i, body={'name': name})
+        docs = self.es.mget(
+            body={'ids': ['3', '2', '1']},
+            index='rick&morty')['docs']
+        self.assertEqual(
+            [(doc['_id'], doc['found'], doc.get('_source')) for doc in docs],
+            [('3', False, None),
+             ('2', True, {'name': 'Morty'}),
+             ('1', True, {'name': 'Rick'})])
+
     def test_bulk_index(self):
         '''Check API performs multiple indexing or delete operations
          in a single API call '''
@@ -516,8 +520,8 @@ class ElDocumentAPITest(unittest.TestCase):
             id=1,
             body={
                 'user': 'kimchy'
-                },
-            refresh=True)
+                })
+        self.es.indices.refresh(index='twitter')
 
         self.es.reindex(
             body={
@@ -549,8 +553,7 @@ class ElDocumentAPITest(unittest.TestCase):
             id=1,
             body={
                 'user': 'kimchy'
-                },
-            refresh=True)
+                })
 
         with self.assertRaises(RequestError):
             self.es.reindex(
@@ -0,0 +1,887 @@
+"""
+The Document API tests of tests_es_py.py on AsyncElasticsearch.
+
+Independent writes and reads within a test are issued concurrently with
+asyncio.gather. Every test works on its own namespaced indices, so tests
+can also run concurrently on one event loop:
+
+    python -m unittest tests_es_py_async.py
+    python tests_es_py_async.py --concurrent
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import traceback
+import unittest
+from elasticsearch import (
+    AsyncElasticsearch,
+    ConflictError,
+    NotFoundError,
+    RequestError,
+)
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch.helpers import async_bulk
+
+from suite_config import client_options, es_hosts, read_cache
+from suite_timing import CURRENT_TEST
+from suite_transport import AsyncSuiteTransport
+from tests_es_py import SUITE_INDICES
+
+
+class AsyncElDocumentAPITest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def index_prefixes(cls):
+        '''Index prefix of every test method'''
+        base = os.environ.get('ES_INDEX_PREFIX', '')
+        return {
+            name: '%sasync%d_' % (base, position)
+            for position, name in enumerate(
+                unittest.defaultTestLoader.getTestCaseNames(cls))
+        }
+
+    @classmethod
+    async def drop_leftovers(cls):
+        '''Drop leftovers of every test's indices in a single request'''
+        CURRENT_TEST.set('%s.%s' % (cls.__module__, cls.__qualname__))
+        es = AsyncElasticsearch(
+            es_hosts(), **client_options(asynchronous=True))
+        try:
+            await es.indices.delete(
+                index=','.join(
+                    prefix + index
+                    for prefix in cls.index_prefixes().values()
+                    for index in SUITE_INDICES),
+                ignore_unavailable=True)
+        finally:
+            await es.close()
+
+    @classmethod
+    def setUpClass(cls):
+        asyncio.run(cls.drop_leftovers())
+
+    async def asyncSetUp(self):
+        CURRENT_TEST.set(self.id())
+        self.es = AsyncElasticsearch(
+            es_hosts(),
+            transport_class=AsyncSuiteTransport,
+            index_prefix=self.index_prefixes()[self._testMethodName],
+            visibility=os.environ.get('ES_VISIBILITY', 'batched'),
+            read_cache=read_cache(),
+            **client_options(asynchronous=True))
+
+    async def asyncTearDown(self):
+        await self.es.transport.drop_touched_indices()
+        await self.es.close()
+
+    async def test_create_doc_with_id(self):
+        '''Check that document is created'''
+        expected_result = {
+            '_index': 'twitter',
+            '_type': '_doc',
+            '_id': '1',
+            '_version': 1,
+            '_seq_no': 0,
+            '_primary_term': 1,
+            'found': True
+        }
+        await self.es.create(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+            }
+        )
+        self.assertEqual(
+            await self.es.get(
+                index='twitter',
+                id=1,
+                _source=False),
+            expected_result)
+
+    async def test_create_existing_id(self):
+        '''Check that a 409 response returns if document with existing ID
+         is created'''
+        await self.es.create(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+            }
+        )
+        with self.assertRaises(ConflictError):
+            await self.es.create(
+                index='twitter',
+                id=1,
+                body={
+                    "user": "japchae",
+                    "twits": "1"
+                }
+            )
+
+    async def test_index_new_doc(self):
+        ''' Check automatic ID generation. Generated ID is of type string '''
+        doc = await self.es.index(
+            index='twitter',
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        self.assertIsInstance(
+            doc['_id'], str)
+
+    async def test_index_existing_doc(self):
+        ''' Unlike 'es.create', if the document already exists, updates the
+         document and increments its version'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "japchae",
+                "twits": "1"
+                }
+            )
+        self.assertEqual(
+            await self.es.get_source(
+                index='twitter', id=1),
+            {"user": "japchae", "twits": "1"})
+
+    async def test_get_doc(self):
+        '''Check that the specified JSON document is retrieved from an index'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        self.assertEqual(
+            (await self.es.get(
+                index='twitter',
+                id=1))['found'],
+            True)
+
+    async def test_exists_doc(self):
+        '''Check that the specified JSON document exists in an index'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        self.assertEqual(
+            await self.es.exists(
+                index='twitter',
+                id=1),
+            True)
+
+    async def test_source_exists(self):
+        '''Check that the specified JSON document has source'''
+        await self.es.index(
+            index='eklmn',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        self.assertEqual(
+            await self.es.exists_source(
+                index='eklmn',
+                id=1),
+            True)
+
+    async def test_doc_not_found(self):
+        '''Check that NotFoundError is returned if the requested document
+         doesn't exist in an index'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        with self.assertRaises(NotFoundError):
+            await self.es.get(
+                index='twitter',
+                id=2)
+
+    async def test_get_source(self):
+        '''Check that the source of a JSON document is retrieved
+         from an index'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        self.assertEqual(
+            await self.es.get_source(
+                index='twitter',
+                id=1),
+            {"user": "kimchy", "twits": "1"})
+
+    async def test_source_not_found(self):
+        '''Check that NotFoundError is returned if the requested document
+         doesn't exist in an index'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        with self.assertRaises(NotFoundError):
+            await self.es.get_source(
+                index='twitter',
+                id=2)
+
+    async def test_delete_doc(self):
+        '''Check that document is deleted from an index'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        await self.es.delete(
+            index='twitter',
+            id=1
+            )
+        self.assertEqual(
+            await self.es.exists(
+                index='twitter',
+                id=1
+            ),
+            False)
+
+    async def test_fail_delete_doc(self):
+        '''Check that delete operation fails if no document with such ID'''
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                "user": "kimchy",
+                "twits": "1"
+                }
+            )
+        await self.es.delete(
+            index='twitter',
+            id=1)
+        with self.assertRaises(NotFoundError):
+            await self.es.delete(
+                index='twitter',
+                id=2
+            )
+
+    async def test_delete_by_query(self):
+        '''Check that document gets deleted by query. The index is
+         refreshed to make the created document visible to search'''
+        await self.es.index(
+            index='rick&morty',
+            id=1,
+            body={
+                'name': 'Rick'
+            })
+        await self.es.indices.refresh(index='rick&morty')
+        q = {
+            "query": {
+                "match": {
+                    "name": "Rick"
+                }
+            }
+        }
+        self.assertEqual(
+            (await self.es.delete_by_query(
+                index='rick&morty',
+                body=q))['deleted'],
+            1)
+
+    async def test_fail_delete_by_query(self):
+        '''Check that delete operation fails if query doesn't match
+         any document'''
+        await self.es.index(
+            index='rick&morty',
+            id=1,
+            body={
+                'name': 'Rick'
+            })
+        q = {
+            "query": {
+                "match": {
+                    "name": "Morty"
+                }
+            }
+        }
+        self.assertEqual(
+            (await self.es.delete_by_query(
+                index='rick&morty',
+                body=q))['deleted'],
+            0)
+
+    async def test_update_doc_part(self):
+        ''' Check that partial update adds a new field to the document'''
+        await self.es.index(
+            index='rick&morty',
+            id=1,
+            body={
+                'name': 'Rick'
+            })
+        await self.es.update(
+            index='rick&morty',
+            id=1,
+            body={
+                "doc": {
+                    "age": "25"
+                    }
+            }
+            )
+        self.assertIn(
+            "age",
+            await self.es.get_source(
+                index="rick&morty",
+                id=1
+                )
+            )
+
+    async def test_update_doc_script(self):
+        ''' Check that document is updated by a script'''
+        await self.es.index(
+            index='rick&morty',
+            id=1,
+            body={
+                'name': 'Morty'
+            })
+        await self.es.update(
+            index='rick&morty',
+            id=1,
+            body={
+                    "script": "ctx._source.based_on = 'Marty McFly'"
+            })
+        self.assertIn(
+            "based_on",
+            await self.es.get_source(
+                index="rick&morty",
+                id=1
+            )
+        )
+
+    async def test_fail_update_doc_script(self):
+        '''RequestError should be raised on invalid script update'''
+        await self.es.index(
+            index='test',
+            id=1,
+            body={
+                    "counter": 1
+            })
+
+        with self.assertRaises(RequestError):
+            await self.es.update(
+                index='test',
+                id=1,
+                body={
+                    "script": {
+                        "age": "25"
+                    }
+                }
+            )
+
+    async def test_update_by_query(self):
+        '''Check that document gets updated by query. The index is
+         refreshed to make the created document visible to search'''
+        await self.es.index(
+            index='test',
+            id=1,
+            body={
+                "user": "kimchy"
+                })
+        await self.es.indices.refresh(index='test')
+
+        self.assertEqual(
+            (await self.es.update_by_query(
+                index='test',
+                body={
+                        "query": {
+                            "term": {
+                                "user": "kimchy"
+                            }
+                        }
+                    }
+                ))['updated'],
+            1)
+
+    async def test_fail_update_by_query(self):
+        '''NotFoundError should be raised if index doesn't exist'''
+
+        with self.assertRaises(NotFoundError):
+            await self.es.update_by_query(
+                index='test',
+                body={
+                        "query": {
+                            "term": {
+                                "user": "kimchy"
+                            }
+                        }
+                    }
+            )
+
+    async def test_mget(self):
+        '''Check that multiple JSON documents are retrieved by ID.
+        Order is specified in request.
+        If there is a failure getting a particular document,
+        the error is included in place of the document.'''
+
+        await asyncio.gather(
+            self.es.create(
+                index='rick&morty',
+                id=1,
+                body={
+                    'name': 'Rick'
+                    }
+                ),
+            self.es.create(
+                index='rick&morty',
+                id=2,
+                body={
+                    'name': 'Morty'
+                    }
+                )
+        )
+        body = {
+            "docs": [
+                {
+                    "_id": "1"
+                },
+                {
+                    "_id": "2"
+                },
+                {
+                    "_id": "3"
+                }
+            ]
+        }
+
+        responses = await asyncio.gather(*(
+            self.es.mget(
+                body=body,
+                index="rick&morty"
+                )
+            for _ in range(3)
+        ))
+        self.assertEqual(
+            responses[0]['docs'][0]['found'],
+            True)
+
+        self.assertEqual(
+            responses[1]['docs'][1]['found'],
+            True)
+
+        self.assertEqual(
+            responses[2]['docs'][2]['found'],
+            False)
+
+    async def test_mget_order(self):
+        '''A single mget returns every requested document in request
+        order, found or not, with its source'''
+
+        await asyncio.gather(*(
+            self.es.create(index='rick&morty', id=i, body={'name': name})
+            for i, name in ((1, 'Rick'), (2, 'Morty'))
+        ))
+        docs = (await self.es.mget(
+            body={'ids': ['3', '2', '1']},
+            index='rick&morty'))['docs']
+        self.assertEqual(
+            [(doc['_id'], doc['found'], doc.get('_source')) for doc in docs],
+            [('3', False, None),
+             ('2', True, {'name': 'Morty'}),
+             ('1', True, {'name': 'Rick'})])
+
+    async def test_bulk_index(self):
+        '''Check API performs multiple indexing or delete operations
+         in a single API call '''
+
+        actions = [
+                    {
+                        '_op_type': 'index',
+                        '_index': 'rick&morty',
+                        '_id': 1,
+                        '_source': {
+                            'character': 'Rick'
+                        }
+                    },
+                    {
+                        '_op_type': 'delete',
+                        '_index': 'rick&morty',
+                        '_id': 1
+                    }
+        ]
+
+        self.assertEqual(
+                await async_bulk(
+                    self.es, actions
+                    ),
+                (2, [])
+        )
+
+    async def test_bulk_fail(self):
+        '''BulkIndexError is raised in if requested action fails to execute'''
+
+        actions = [
+                    {
+                        '_op_type': 'index',
+                        '_index': 'twitter',
+                        '_id': 1,
+                        '_source': {
+                            'user': 'kimchy'
+                        }
+                    },
+                    {
+                        '_op_type': 'create',
+                        '_index': 'twitter',
+                        '_id': 1,
+                        '_source': {
+                            'user': 'japchae'
+                        }
+                    }
+        ]
+        with self.assertRaises(BulkIndexError):
+            await async_bulk(
+                self.es, actions
+            )
+
+    async def test_reindex(self):
+        '''Check that document is copied from one index to another'''
+
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                'user': 'kimchy'
+                })
+        await self.es.indices.refresh(index='twitter')
+
+        await self.es.reindex(
+            body={
+                "source": {
+                    "index": "twitter"
+                },
+                "dest": {
+                    "index": "new_twitter"
+                }
+            }
+        )
+
+        source, copy = await asyncio.gather(
+            self.es.get_source(
+                index='twitter',
+                id=1
+                ),
+            self.es.get_source(
+                index='new_twitter',
+                id=1
+                )
+        )
+        self.assertEqual(source, copy)
+
+    async def test_reindex_fail(self):
+        '''Check that reindex cannot write into an index its reading from'''
+
+        await self.es.index(
+            index='twitter',
+            id=1,
+            body={
+                'user': 'kimchy'
+                })
+
+        with self.assertRaises(RequestError):
+            await self.es.reindex(
+                body={
+                    "source": {
+                        "index": "twitter"
+                    },
+                    "dest": {
+                        "index": "twitter"
+                    }
+                }
+            )
+
+    async def test_temvestors(self):
+        '''Checks that expected information and statistics for terms
+         in the field of a document correspond actual'''
+
+        await asyncio.gather(
+            self.es.create(
+                index='client',
+                id=1,
+                body={
+                    "fullname": "John Doe",
+                    "text": "client test test test "
+                }),
+            self.es.create(
+                index='client',
+                id=2,
+                body={
+                    "fullname": "Jane Doe",
+                    "text": "Another bank test ..."
+                })
+        )
+        actual = await self.es.termvectors(
+            index='client',
+            id=1,
+            body={
+                "fields": ["text"],
+                "offsets": False,
+                "positions": False,
+                "term_statistics": True
+            })
+        expected = {
+            'term_vectors': {
+                'text': {
+                    'field_statistics': {
+                        'sum_doc_freq': 5, 'doc_count': 2, 'sum_ttf': 7
+                    }, 'terms': {
+                        'client': {
+                            'doc_freq': 1, 'ttf': 1, 'term_freq': 1
+                        }, 'test': {
+                            'doc_freq': 2, 'ttf': 4, 'term_freq': 3
+                        }
+                    }
+                }
+            }
+        }
+
+        subset = {k: v for k, v in actual.items() if k in expected}
+
+        self.assertDictEqual(expected, subset)
+
+    async def test_temvestors_not_found(self):
+        '''Response body contains 'found': 'False' if document is not
+         present'''
+
+        await self.es.create(
+            index='client',
+            id=1,
+            body={
+                "fullname": "John Doe",
+                "text": "client test test test "
+            })
+        await self.es.delete(index='client', id=1)
+
+        self.assertEqual(
+            (await self.es.termvectors(
+                index='client',
+                id=1,
+                body={
+                    "fields": ["text"]
+                }))['found'],
+            False)
+
+    async def test_temvestors_invalid_field(self):
+        ''' 'term_vectors' is an empty array if field is not present
+         in a document'''
+
+        await self.es.create(
+            index='client',
+            id=1,
+            body={
+                "fullname": "John Doe",
+                "text": "client test test test "
+            })
+
+        self.assertEqual(
+            (await self.es.termvectors(
+                index='client',
+                id=1,
+                body={
+                    "fields": ["not_existing_field"]
+                }))['term_vectors'],
+            {})
+
+    async def test_mtermverctors(self):
+        '''Checks the same as test_temvestors, but for multiple documents '''
+
+        await asyncio.gather(
+            self.es.index(
+                index='client',
+                id=1,
+                body={
+                    "fullname": "John Doe",
+                    "text": "client test test test "
+                }),
+            self.es.create(
+                index='client',
+                id=2,
+                body={
+                    "fullname": "Jane Doe",
+                    "text": "Another bank test ..."
+                })
+        )
+
+        response = await self.es.mtermvectors(
+            index='client',
+            body={
+                "ids": ["1", "2"],
+                "parameters": {
+                    "fields": ["text"],
+                    "offsets": False,
+                    "positions": False
+                    }
+                }
+            )
+        terms_doc1 = {
+                    'client': {
+                        'term_freq': 1
+                        },
+                    'test': {
+                        'term_freq': 3
+                        }
+                }
+        terms_doc2 = {
+                    'another': {
+                        'term_freq': 1
+                        },
+                    'bank': {
+                        'term_freq': 1
+                        },
+                    'test': {
+                        'term_freq': 1
+                        }
+                }
+        self.assertEqual(
+            response['docs'][0]['term_vectors']['text']['terms'],
+            terms_doc1)
+        self.assertEqual(
+            response['docs'][1]['term_vectors']['text']['terms'],
+            terms_doc2)
+
+    async def test_mtermverctors_not_found(self):
+        '''Response body contains 'found': 'False' if document is
+         not present'''
+
+        await self.es.indices.create(
+            index='twitter'
+            )
+
+        response = await self.es.mtermvectors(
+            index='twitter',
+            body={
+                "ids": ["1", "2"],
+                "parameters": {
+                    "fields": ["text"]
+                    }
+                }
+            )
+        self.assertEqual(
+            response['docs'][0]['found'],
+            False)
+        self.assertEqual(
+            response['docs'][1]['found'],
+            False)
+
+    async def test_mtemvestors_invalid_field(self):
+        ''' 'term_vectors' is an empty array if field is not present
+        in a document'''
+
+        await self.es.create(
+            index='client',
+            id=1,
+            body={
+                "fullname": "John Doe",
+                "text": "client test test test "
+            })
+
+        self.assertEqual(
+            (await self.es.mtermvectors(
+                index='client',
+                body={
+                    "ids": ["1", "2"],
+                    "parameters": {
+                        "fields": ["not_existing_field"]
+                    }
+                }))['docs'][0]['term_vectors'],
+            {})
+
+
+async def run_case(case):
+    '''Run one test with its set up and tear down, returning its outcome'''
+    try:
+        await case.asyncSetUp()
+        try:
+            await getattr(case, case._testMethodName)()
+        finally:
+            await case.asyncTearDown()
+    except unittest.SkipTest as e:
+        return case.id(), 'skipped', str(e)
+    except case.failureException:
+        return case.id(), 'FAIL', traceback.format_exc()
+    except Exception:
+        return case.id(), 'ERROR', traceback.format_exc()
+    return case.id(), 'ok', None
+
+
+async def run_concurrently(names):
+    '''Run test methods of AsyncElDocumentAPITest concurrently on the
+    running event loop'''
+    await AsyncElDocumentAPITest.drop_leftovers()
+    return await asyncio.gather(*(
+        run_case(AsyncElDocumentAPITest(name)) for name in names))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--concurrent', action='store_true',
+        help='run all tests concurrently on one event loop')
+    parser.add_argument(
+        'names', nargs='*',
+        help='test methods to run (default: all)')
+    args, rest = parser.parse_known_args(argv)
+    if not args.concurrent:
+        unittest.main(argv=[sys.argv[0]] + rest + args.names, verbosity=2)
+        return 0
+
+    names = args.names or unittest.defaultTestLoader.getTestCaseNames(
+        AsyncElDocumentAPITest)
+    start = time.perf_counter()
+    outcomes = asyncio.run(run_concurrently(names))
+    elapsed = time.perf_counter() - start
+    for test_id, status, detail in outcomes:
+        print('%s ... %s' % (test_id, status))
+    problems = [o for o in outcomes if o[1] in ('FAIL', 'ERROR')]
+    for test_id, status, detail in problems:
+        print('=' * 70)
+        print('%s: %s' % (status, test_id))
+        print('-' * 70)
+        print(detail)
+    print('-' * 70)
+    print('Ran %d tests concurrently in %.3fs' % (len(outcomes), elapsed))
+    print()
+    print('FAILED (problems=%d)' % len(problems) if problems else 'OK')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""
+Recovery of the client from a faulty node.
+
+The tests talk to the node through faultproxy.py, which drops
+connections, holds requests and rejects them with `429
+es_rejected_execution_exception` on cue. They check that the retries of
+the transport (`max_retries`, `retry_on_timeout`, `retry_on_status`) and
+of helpers.streaming_bulk (`max_retries`, `initial_backoff`) recover
+with the requests they should, give up when they should, and never write
+a document twice.
+
+streaming_bulk only retries rejected actions with `raise_on_error=False`;
+otherwise the first rejected action raises BulkIndexError.
+
+A retried write is only safe to repeat if it carries its id: a write the
+node applied before the connection dropped is then written again over
+itself, whereas an auto-generated id makes a second document.
+"""
+import time
+import unittest
+
+from elasticsearch import (
+    ConnectionError,
+    ConnectionTimeout,
+    Elasticsearch,
+    TransportError,
+)
+from elasticsearch.helpers import BulkIndexError, streaming_bulk
+
+from faultproxy import FaultProxy
+from suite_case import SuiteTestCase
+from suite_cassette import CASSETTE
+from suite_config import client_options, es_hosts
+from suite_transport import SuiteTransport
+
+DOCS = 20
+BACKOFF = 0.05
+# Requests are held far longer than they time out after, so the bounds
+# on elapsed time below stay clear of scheduler noise.
+TIMEOUT = 0.3
+HELD = 10.0
+
+
+@unittest.skipIf(CASSETTE.mode, 'faults are injected into live connections')
+class FaultsTest(SuiteTestCase):
+
+    indices = ('twitter',)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.proxy = FaultProxy(es_hosts()[0]).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.proxy.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        # Not in tearDown: the cleanups of the previous test, which drop
+        # its indices through the proxy, run after it.
+        self.proxy.reset()
+
+    def faulty_client(self, proxy=None, **kwargs):
+        '''A client going through the proxy'''
+        proxy = proxy or self.proxy
+        es = Elasticsearch(
+            [{'host': proxy.host, 'port': proxy.port}],
+            transport_class=SuiteTransport,
+            index_prefix=self.es.transport.index_prefix,
+            **dict(client_options(), **kwargs))
+        self.addCleanup(es.close)
+        self.addCleanup(es.transport.drop_touched_indices)
+        return es
+
+    def count(self):
+        self.es.indices.refresh(index='twitter')
+        return self.es.count(index='twitter')['count']
+
+    def test_dropped_connection_retried(self):
+        '''A request whose connection dropped before it reached the node is
+        sent again'''
+        es = self.faulty_client(max_retries=3)
+        self.proxy.inject('drop', times=2)
+        result = es.index(index='twitter', id=1, body={'user': 'kimchy'})
+        self.assertEqual(result['_version'], 1)
+        self.assertEqual(self.proxy.stats['dropped'], 2)
+        self.assertEqual(self.proxy.stats['relayed'], 1)
+
+    def test_retried_write_with_id(self):
+        '''A write retried after the node applied it overwrites itself'''
+        es = self.faulty_client(max_retries=1)
+        self.proxy.inject('drop_after')
+        result = es.index(index='twitter', id=1, body={'user': 'kimchy'})
+        self.assertEqual(result['_version'], 2)
+        self.assertEqual(self.count(), 1)
+
+    def test_retried_write_without_id(self):
+        '''A write retried after the node applied it is a second document
+        when the node picks the id'''
+        es = self.faulty_client(max_retries=1)
+        self.proxy.inject('drop_after')
+        es.index(index='twitter', body={'user': 'kimchy'})
+        self.assertEqual(self.count(), 2)
+
+    def test_retries_exhausted(self):
+        '''The client gives up after max_retries more attempts'''
+        es = self.faulty_client(max_retries=2)
+        self.proxy.inject('drop', times=3)
+        with self.assertRaises(ConnectionError):
+            es.index(index='twitter', id=1, body={'user': 'kimchy'})
+        self.assertEqual(self.proxy.stats['requests'], 3)
+        self.assertEqual(self.proxy.stats['relayed'], 0)
+
+    def test_timeout_retried(self):
+        '''With retry_on_timeout a request held past its timeout is sent
+        again, adding no more than the timeout'''
+        es = self.faulty_client(max_retries=1, retry_on_timeout=True)
+        es.index(index='twitter', id=1, body={'user': 'kimchy'})
+        self.proxy.inject('delay', match='^GET ', seconds=HELD)
+        start = time.perf_counter()
+        doc = es.get(index='twitter', id=1, request_timeout=TIMEOUT)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(doc['_source'], {'user': 'kimchy'})
+        self.assertEqual(self.proxy.stats['delayed'], 1)
+        # The index and the retried get; the held get never got through.
+        self.assertEqual(self.proxy.stats['relayed'], 2)
+        self.assertGreaterEqual(elapsed, TIMEOUT)
+        self.assertLess(elapsed, HELD / 2)
+
+    def test_timeout_raised(self):
+        '''Without retry_on_timeout a request held past its timeout fails
+        at once'''
+        es = self.faulty_client(max_retries=3)
+        self.proxy.inject('delay', match='^GET ', seconds=HELD)
+        start = time.perf_counter()
+        with self.assertRaises(ConnectionTimeout):
+            es.get(index='twitter', id=1, request_timeout=TIMEOUT)
+        self.assertLess(time.perf_counter() - start, HELD / 2)
+        self.assertEqual(self.proxy.stats['requests'], 1)
+        self.assertEqual(self.proxy.stats['relayed'], 0)
+
+    def test_rejection_not_retried(self):
+        '''A 429 is raised, unless retry_on_status includes it'''
+        es = self.faulty_client(max_retries=3)
+        self.proxy.inject('reject')
+        with self.assertRaises(TransportError) as raised:
+            es.index(index='twitter', id=1, body={'user': 'kimchy'})
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(raised.exception.error,
+                         'es_rejected_execution_exception')
+
+        es = self.faulty_client(max_retries=3, retry_on_status=(429,))
+        self.proxy.inject('reject', times=2)
+        result = es.index(index='twitter', id=1, body={'user': 'kimchy'})
+        self.assertEqual(result['_version'], 1)
+        self.assertEqual(self.proxy.stats['rejected'], 3)
+
+    def bulk(self, es, **kwargs):
+        '''Index DOCS tweets by streaming_bulk, returning the outcomes and
+        the seconds it took'''
+        start = time.perf_counter()
+        outcomes = list(streaming_bulk(es, (
+            {'_index': 'twitter', '_id': i, '_source': {'position': i}}
+            for i in range(DOCS)
+        ), initial_backoff=BACKOFF, raise_on_error=False, **kwargs))
+        return outcomes, time.perf_counter() - start
+
+    def assertWrittenOnce(self):
+        docs = self.es.mget(
+            index='twitter', body={'ids': list(range(DOCS))})['docs']
+        self.assertEqual([doc['_version'] for doc in docs], [1] * DOCS)
+
+    def test_bulk_rejected_items_retried(self):
+        '''Rejected actions are sent again after a growing backoff, and
+        only they are'''
+        es = self.faulty_client()
+        self.proxy.inject('reject_items', times=2, match='_bulk', every=2)
+        outcomes, elapsed = self.bulk(es, max_retries=2)
+        self.assertTrue(all(ok for ok, _ in outcomes))
+        self.assertEqual(self.proxy.stats['rejected_items'],
+                         DOCS // 2 + DOCS // 4)
+        self.assertEqual(self.proxy.stats['requests'], 3)
+        # Slept BACKOFF, then twice as long.
+        self.assertGreaterEqual(elapsed, 3 * BACKOFF)
+        self.assertWrittenOnce()
+
+    def test_bulk_rejected_chunk_retried(self):
+        '''A whole bulk request rejected with 429 is sent again'''
+        es = self.faulty_client()
+        self.proxy.inject('reject', times=2, match='_bulk')
+        outcomes, elapsed = self.bulk(es, max_retries=2)
+        self.assertEqual(len(outcomes), DOCS)
+        self.assertTrue(all(ok for ok, _ in outcomes))
+        self.assertEqual(self.proxy.stats['rejected'], 2)
+        self.assertEqual(self.proxy.stats['relayed'], 1)
+        self.assertGreaterEqual(elapsed, 3 * BACKOFF)
+        self.assertWrittenOnce()
+
+    def test_bulk_retries_exhausted(self):
+        '''Actions still rejected after max_retries are failed'''
+        es = self.faulty_client()
+        self.proxy.inject('reject_items', times=3, match='_bulk')
+        outcomes, _ = self.bulk(es, max_retries=2)
+        self.assertEqual(
+            [info['index']['status'] for ok, info in outcomes if not ok],
+            [429] * DOCS)
+        self.assertEqual(self.proxy.stats['requests'], 3)
+
+    def test_item_rejection_with_other_faults(self):
+        '''Faults queued on a proxy that rejects bulk actions at a rate
+        still apply, and only that share of the actions is rejected'''
+        proxy = FaultProxy(
+            es_hosts()[0], item_reject_rate=0.25, seed=3).start()
+        self.addCleanup(proxy.stop)
+        es = self.faulty_client(proxy, max_retries=0)
+        body = [
+            line for i in range(DOCS) for line in (
+                {'index': {'_index': 'twitter', '_id': i}}, {'position': i})
+        ]
+        proxy.inject('delay', match='_bulk', seconds=0.01)
+        items = es.bulk(body=body)['items']
+        rejected = sum(1 for item in items if item['index']['status'] == 429)
+        self.assertEqual(proxy.stats['delayed'], 1)
+        self.assertEqual(proxy.stats['relayed'], 1)
+        self.assertEqual(proxy.stats['rejected_items'], rejected)
+        self.assertTrue(0 < rejected < DOCS)
+
+        proxy.inject('drop_after', match='_bulk')
+        with self.assertRaises(ConnectionError):
+            es.bulk(body=body)
+        self.assertEqual(proxy.stats['dropped_after'], 1)
+        self.assertEqual(proxy.stats['relayed'], 2)
+        self.assertTrue(0 < proxy.stats['rejected_items'] - rejected < DOCS)
+
+    def test_bulk_rejected_items_raised(self):
+        '''With raise_on_error, rejected actions raise at once, however
+        many retries are allowed'''
+        es = self.faulty_client()
+        self.proxy.inject('reject_items', match='_bulk', every=2)
+        with self.assertRaises(BulkIndexError) as raised:
+            list(streaming_bulk(es, (
+                {'_index': 'twitter', '_id': i, '_source': {'position': i}}
+                for i in range(DOCS)
+            ), max_retries=2, initial_backoff=BACKOFF))
+        self.assertEqual(len(raised.exception.errors), DOCS // 2)
+        self.assertEqual(self.proxy.stats['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fixtures import CHARACTERS, TWEETS, generate, ndjson_fixture
+from suite_case import SuiteTestCase
+from suite_ndjson import ndjson_bulk, open_ndjson
+
+
+class GenerateTest(unittest.TestCase):
+
+    def test_deterministic(self):
+        '''The same seed gives the same documents, another seed others'''
+        self.assertEqual(
+            list(generate('tweet', 50, size=200, distribution='lognormal')),
+            list(generate('tweet', 50, size=200, distribution='lognormal')))
+        self.assertNotEqual(
+            list(generate('tweet', 50)), list(generate('tweet', 50, seed=1)))
+
+    def test_positions(self):
+        '''A range of positions is generated on its own'''
+        docs = list(generate('client', 100, size=300, distribution='uniform'))
+        self.assertEqual(
+            list(generate('client', 30, size=300, distribution='uniform',
+                          start=40)),
+            docs[40:70])
+
+    def test_shapes(self):
+        '''Documents have the fields of the suite's documents'''
+        for shape, docs in (('tweet', TWEETS), ('character', CHARACTERS)):
+            with self.subTest(shape=shape):
+                for doc in generate(shape, 20):
+                    self.assertEqual(set(doc), set(docs[0]))
+
+    def test_sizes(self):
+        '''Fixed sizes are met to a few bytes, distributions average out
+        near the size asked for'''
+        for doc in generate('character', 20, size=1000):
+            self.assertTrue(1000 <= len(json.dumps(doc)) < 1010)
+        for distribution in ('uniform', 'lognormal'):
+            with self.subTest(distribution=distribution):
+                sizes = [len(json.dumps(doc)) for doc in generate(
+                    'character', 2000, size=1000, distribution=distribution)]
+                self.assertLess(min(sizes), 1000)
+                self.assertGreater(max(sizes), 1000)
+                self.assertAlmostEqual(
+                    sum(sizes) / len(sizes), 1000, delta=150)
+
+
+class NdjsonFixtureTest(unittest.TestCase):
+
+    def setUp(self):
+        cache = tempfile.TemporaryDirectory()
+        self.addCleanup(cache.cleanup)
+        patcher = mock.patch.dict(os.environ, ES_FIXTURE_CACHE=cache.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        '''The file holds the generated documents and is written once'''
+        path = ndjson_fixture('tweet', 10, size=100)
+        with open(path, 'rb') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines[1::2]],
+            list(generate('tweet', 10, size=100)))
+        self.assertEqual(
+            json.loads(lines[2]), {'index': {'_id': '1'}})
+        modified = os.stat(path).st_mtime_ns
+        self.assertEqual(ndjson_fixture('tweet', 10, size=100), path)
+        self.assertEqual(os.stat(path).st_mtime_ns, modified)
+        self.assertNotEqual(ndjson_fixture('tweet', 10, size=200), path)
+
+
+class NdjsonFixtureBulkTest(SuiteTestCase):
+
+    indices = ('twitter',)
+
+    def test_ndjson_bulk(self):
+        '''A cached fixture indexes as it is into any index'''
+        with tempfile.TemporaryDirectory() as cache, \
+                mock.patch.dict(os.environ, ES_FIXTURE_CACHE=cache):
+            with open_ndjson(ndjson_fixture('tweet', 200)) as data:
+                success, errors = ndjson_bulk(
+                    self.es, data, index='twitter', chunk_size=50)
+        self.assertEqual((success, errors), (200, []))
+        self.assertEqual(
+            self.es.get_source(index='twitter', id=123),
+            list(generate('tweet', 1, start=123))[0])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
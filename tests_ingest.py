@@ -0,0 +1,175 @@
+"""
+Indexing through ingest pipelines, next to test_index_new_doc and
+test_index_existing_doc.
+
+Tweets are indexed through pipelines of set, rename, script and date
+processors (fixtures.PIPELINES), one document at a time and in bulk, and
+what was stored is checked against the `_simulate` API's transformation of
+the same documents. Pipelines are cluster-wide, so their ids carry the
+index prefix of the run (see run_parallel.py) and a `suite_` namespace,
+leaving pipelines of anyone else on the cluster alone, and are deleted
+after every test. Throughput against the unpipelined path is measured by
+bench_ingest.py.
+"""
+import unittest
+
+from elasticsearch import RequestError
+from elasticsearch.helpers import BulkIndexError, bulk
+
+from fixtures import PIPELINES
+from suite_case import SuiteTestCase
+
+TWEET = {"user": "kimchy", "twits": "1", "post_date": "2009-11-15 14:12:12"}
+INGESTED = {
+    "author": "kimchy",
+    "twits": "1",
+    "post_date": "2009-11-15 14:12:12",
+    "source": "twitter:kimchy",
+    "handle": "@kimchy",
+    "@timestamp": "2009-11-15T14:12:12.000Z"
+}
+
+
+class IngestPipelineTest(SuiteTestCase):
+
+    indices = ('twitter',)
+
+    def pipeline_id(self, name):
+        return '%ssuite_%s' % (self.es.transport.index_prefix, name)
+
+    def put_pipeline(self, name, processors, **definition):
+        '''Register a pipeline for the test, returning its id'''
+        pipeline_id = self.pipeline_id(name)
+        self.es.ingest.put_pipeline(
+            id=pipeline_id, body=dict(definition, processors=processors))
+        self.addCleanup(
+            self.es.ingest.delete_pipeline, id=pipeline_id, ignore=404)
+        return pipeline_id
+
+    def simulate(self, pipeline_id, *sources):
+        '''_source of documents after the pipeline'''
+        return [
+            doc['doc']['_source'] for doc in self.es.ingest.simulate(
+                id=pipeline_id,
+                body={'docs': [{'_source': source} for source in sources]}
+            )['docs']
+        ]
+
+    def test_simulate(self):
+        '''_simulate shows the document as the pipeline turns it out'''
+        pipeline_id = self.put_pipeline('all', PIPELINES['all'])
+        self.assertEqual(self.simulate(pipeline_id, TWEET), [INGESTED])
+
+    def test_simulate_verbose(self):
+        '''A verbose _simulate shows the document after every processor'''
+        pipeline_id = self.put_pipeline('all', PIPELINES['all'])
+        results = self.es.ingest.simulate(
+            id=pipeline_id, verbose=True,
+            body={'docs': [{'_source': TWEET}]}
+        )['docs'][0]['processor_results']
+        self.assertEqual(
+            [sorted(set(result['doc']['_source']) - set(TWEET))
+             for result in results],
+            [['source'],
+             ['handle', 'source'],
+             ['@timestamp', 'handle', 'source'],
+             ['@timestamp', 'author', 'handle', 'source']])
+        self.assertEqual(results[-1]['doc']['_source'], INGESTED)
+
+    def test_index_new_doc(self):
+        ''' Check automatic ID generation through a pipeline. The stored
+        document is the one _simulate shows '''
+        pipeline_id = self.put_pipeline('all', PIPELINES['all'])
+        doc = self.es.index(
+            index='twitter',
+            body=TWEET,
+            pipeline=pipeline_id
+            )
+        self.assertIsInstance(
+            doc['_id'], str)
+        self.assertEqual(
+            self.es.get_source(index='twitter', id=doc['_id']),
+            self.simulate(pipeline_id, TWEET)[0])
+
+    def test_index_existing_doc(self):
+        ''' A document indexed again through a pipeline is replaced by the
+        new transformed document and its version incremented '''
+        pipeline_id = self.put_pipeline('rename', PIPELINES['rename'])
+        self.es.index(index='twitter', id=1, body=TWEET)
+        doc = self.es.index(
+            index='twitter', id=1, body=TWEET, pipeline=pipeline_id)
+        self.assertEqual(doc['_version'], 2)
+        self.assertEqual(
+            self.es.get_source(index='twitter', id=1),
+            {"author": "kimchy", "twits": "1",
+             "post_date": "2009-11-15 14:12:12"})
+
+    def test_bulk(self):
+        '''Bulk actions go through the request's pipeline, their own, or
+        none with `_none`'''
+        pipeline_id = self.put_pipeline('all', PIPELINES['all'])
+        set_id = self.put_pipeline('set', PIPELINES['set'])
+        tweets = [dict(TWEET, twits=str(i)) for i in range(10)]
+        actions = [
+            {'_index': 'twitter', '_id': i, '_source': tweet}
+            for i, tweet in enumerate(tweets)
+        ]
+        actions[1]['pipeline'] = set_id
+        actions[2]['pipeline'] = '_none'
+        self.assertEqual(
+            bulk(self.es, actions, pipeline=pipeline_id), (10, []))
+        stored = self.es.mget(
+            index='twitter', body={'ids': list(range(10))})['docs']
+        expected = self.simulate(pipeline_id, *tweets)
+        expected[1] = self.simulate(set_id, tweets[1])[0]
+        expected[2] = tweets[2]
+        self.assertEqual([doc['_source'] for doc in stored], expected)
+
+    def test_failure(self):
+        '''A failing processor fails the write, naming its type'''
+        pipeline_id = self.put_pipeline('rename', PIPELINES['rename'])
+        with self.assertRaises(RequestError) as raised:
+            self.es.index(index='twitter', id=1, body={"twits": "1"},
+                          pipeline=pipeline_id)
+        self.assertEqual(
+            raised.exception.info['error']['header'],
+            {'processor_type': 'rename'})
+        with self.assertRaises(BulkIndexError) as raised:
+            bulk(self.es, [
+                {'_index': 'twitter', '_id': 1, '_source': TWEET},
+                {'_index': 'twitter', '_id': 2, '_source': {"twits": "1"}},
+            ], pipeline=pipeline_id)
+        self.assertEqual(
+            [error['index']['_id'] for error in raised.exception.errors],
+            [2])
+        self.assertEqual(raised.exception.errors[0]['index']['status'], 400)
+
+    def test_on_failure(self):
+        '''Failures are handled by the pipeline's on_failure processors,
+        or ignored'''
+        pipeline_id = self.put_pipeline(
+            'rename', PIPELINES['rename'], on_failure=[{'set': {
+                'field': 'error', 'value': '{{_ingest.on_failure_message}}'}}])
+        self.es.index(index='twitter', id=1, body={"twits": "1"},
+                      pipeline=pipeline_id)
+        self.assertEqual(
+            self.es.get_source(index='twitter', id=1),
+            {"twits": "1", "error": "field [user] doesn't exist"})
+
+        ignoring_id = self.put_pipeline('ignoring', [
+            {'rename': dict(PIPELINES['rename'][0]['rename'],
+                            ignore_failure=True)},
+        ] + PIPELINES['set'])
+        self.assertEqual(
+            self.simulate(ignoring_id, {"twits": "1"}),
+            [{"twits": "1", "source": "twitter:"}])
+
+    def test_missing_pipeline(self):
+        '''Writes through a pipeline that doesn't exist are rejected'''
+        with self.assertRaises(RequestError):
+            self.es.index(index='twitter', body=TWEET,
+                          pipeline=self.pipeline_id('none'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,117 @@
+"""
+Scaled variants of test_mget, test_mtermverctors and test_bulk_fail.
+
+The same calls as in tests_es_py.py over thousands of documents, so the
+client-side memory of their responses and result lists shows in the
+report of ES_MEMORY=1 (see suite_memory.py):
+
+    ES_MEMORY_ITEMS   documents per test (default 2000)
+
+    ES_MEMORY=1 ES_MEMORY_ITEMS=20000 python -m unittest tests_memory.py
+
+test_bulk_fail_stats_only checks what switching to `stats_only` saves.
+"""
+import os
+import tracemalloc
+import unittest
+
+from elasticsearch.helpers import BulkIndexError, bulk, streaming_bulk
+
+from fixtures import generate
+from suite_case import SuiteTestCase
+
+ITEMS = int(os.environ.get('ES_MEMORY_ITEMS', 2000))
+
+
+def retained_by(call):
+    '''Call `call`, returning its result, or the exception it raised, and
+    the bytes still allocated for it'''
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            result = call()
+        except Exception as e:
+            result = e
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+class MemoryScaleTest(SuiteTestCase):
+
+    indices = ('rick&morty', 'client', 'twitter')
+
+    def index_all(self, index, shape):
+        bulk(self.es, (
+            {'_index': index, '_id': i, '_source': doc}
+            for i, doc in enumerate(generate(shape, ITEMS))
+        ), chunk_size=1000)
+
+    def conflicting_actions(self):
+        '''Creates of ids already written, each of which fails'''
+        for i in range(ITEMS):
+            yield {'_op_type': 'create', '_index': 'twitter', '_id': i,
+                   '_source': {'user': 'japchae'}}
+
+    def test_mget(self):
+        '''Thousands of documents, and the missing ones, are retrieved by ID
+        in the order requested'''
+        self.index_all('rick&morty', 'character')
+        ids = [str(i) for i in range(ITEMS + ITEMS // 10)]
+        docs = self.es.mget(index='rick&morty', body={'ids': ids})['docs']
+        self.assertEqual([doc['_id'] for doc in docs], ids)
+        self.assertEqual(
+            [doc['found'] for doc in docs],
+            [True] * ITEMS + [False] * (ITEMS // 10))
+
+    def test_mtermverctors(self):
+        '''Term vectors of thousands of documents are returned at once'''
+        self.index_all('client', 'client')
+        docs = self.es.mtermvectors(
+            index='client',
+            body={
+                'ids': [str(i) for i in range(ITEMS)],
+                'parameters': {
+                    'fields': ['text'],
+                    'offsets': False,
+                    'positions': False
+                }
+            })['docs']
+        self.assertEqual(len(docs), ITEMS)
+        self.assertTrue(all(
+            doc['found'] and doc['term_vectors']['text']['terms']
+            for doc in docs))
+
+    def test_bulk_fail(self):
+        '''BulkIndexError lists every one of thousands of failed actions'''
+        self.index_all('twitter', 'tweet')
+        with self.assertRaises(BulkIndexError) as raised:
+            bulk(self.es, self.conflicting_actions(), chunk_size=ITEMS)
+        self.assertEqual(len(raised.exception.errors), ITEMS)
+        self.assertEqual(raised.exception.errors[0]['create']['status'], 409)
+
+    def test_bulk_fail_stats_only(self):
+        '''Counting failures instead of listing them retains a fraction of
+        the memory'''
+        self.index_all('twitter', 'tweet')
+        errors, listed = retained_by(lambda: bulk(
+            self.es, self.conflicting_actions(), chunk_size=ITEMS))
+        self.assertIsInstance(errors, BulkIndexError)
+        stats, counted = retained_by(lambda: bulk(
+            self.es, self.conflicting_actions(), chunk_size=ITEMS,
+            stats_only=True, raise_on_error=False))
+        self.assertEqual(stats, (0, ITEMS))
+        failed, streamed = retained_by(lambda: sum(
+            not ok for ok, _ in streaming_bulk(
+                self.es, self.conflicting_actions(), chunk_size=ITEMS,
+                raise_on_error=False)))
+        self.assertEqual(failed, ITEMS)
+        self.assertLess(max(counted, streamed) * 10, listed)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
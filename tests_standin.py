@@ -0,0 +1,262 @@
+import json
+import unittest
+
+from standin import DocumentStore
+
+
+class StandinTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DocumentStore()
+
+    def request(self, method, path, body=None, **params):
+        if body is not None and not isinstance(body, str):
+            body = json.dumps(body)
+        return self.store.handle(
+            method, path, params, (body or '').encode('utf-8'))
+
+    def test_search_is_near_real_time(self):
+        '''Writes are visible to search only after a refresh, while get is
+         realtime'''
+        self.request('PUT', '/twitter/_doc/1', {"user": "kimchy"})
+        self.assertEqual(
+            self.request('GET', '/twitter/_count')[1]['count'],
+            0)
+        self.assertEqual(
+            self.request('GET', '/twitter/_doc/1')[1]['found'],
+            True)
+        self.request('POST', '/twitter/_refresh')
+        self.assertEqual(
+            self.request('GET', '/twitter/_count')[1]['count'],
+            1)
+
+    def test_seq_no_and_version(self):
+        '''Every write increments the sequence number of the index and the
+         version of the document'''
+        self.request('PUT', '/twitter/_doc/1', {"user": "kimchy"})
+        self.request('PUT', '/twitter/_doc/2', {"user": "kimchy"})
+        status, response = self.request(
+            'PUT', '/twitter/_doc/1', {"user": "japchae"})
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            (response['_version'], response['_seq_no'], response['result']),
+            (2, 2, 'updated'))
+
+    def test_if_seq_no_conflict(self):
+        '''A write conditioned on an outdated sequence number is rejected'''
+        self.request('PUT', '/twitter/_doc/1', {"user": "kimchy"})
+        self.request('PUT', '/twitter/_doc/1', {"user": "japchae"})
+        status, response = self.request(
+            'PUT', '/twitter/_doc/1', {"user": "kimchy"},
+            if_seq_no='0', if_primary_term='1')
+        self.assertEqual(status, 409)
+        self.assertEqual(
+            response['error']['type'],
+            'version_conflict_engine_exception')
+
+    def test_script_update(self):
+        '''Painless subset: assignments from params and string concatenation'''
+        self.request('PUT', '/test/_doc/1', {"counter": 1})
+        self.request('POST', '/test/_update/1', {
+            "script": {
+                "source": "ctx._source.counter += params.count; "
+                          "ctx._source.label = 'n' + ctx._source.counter",
+                "params": {"count": 4}
+            }
+        })
+        self.assertEqual(
+            self.request('GET', '/test/_source/1')[1],
+            {"counter": 5, "label": "n5"})
+
+    def test_unsupported_script(self):
+        '''Scripts outside the supported subset fail to compile'''
+        self.request('PUT', '/test/_doc/1', {"counter": 1})
+        status, response = self.request('POST', '/test/_update/1', {
+            "script": "if (ctx._source.counter > 0) { ctx.op = 'delete' }"
+        })
+        self.assertEqual(status, 400)
+        self.assertEqual(response['error']['type'], 'script_exception')
+
+    def test_stored_script(self):
+        '''Updates can run a stored script by id, until it is deleted'''
+        self.request('PUT', '/test/_doc/1', {"counter": 1})
+        self.assertEqual(
+            self.request('PUT', '/_scripts/add', {"script": {
+                "lang": "painless",
+                "source": "ctx._source.counter += params.count"
+            }}),
+            (200, {'acknowledged': True}))
+        self.request('POST', '/test/_update/1', {
+            "script": {"id": "add", "params": {"count": 2}}
+        })
+        self.assertEqual(
+            self.request('GET', '/test/_source/1')[1], {"counter": 3})
+        self.request('DELETE', '/_scripts/add')
+        status, response = self.request('POST', '/test/_update/1', {
+            "script": {"id": "add", "params": {"count": 2}}
+        })
+        self.assertEqual(status, 404)
+        self.assertEqual(
+            response['error']['type'],
+            'resource_not_found_exception')
+
+    def test_ingest_pipeline(self):
+        '''Pipelines are stored, run on indexed documents, and parse dates
+        of several formats in their time zone'''
+        self.assertEqual(
+            self.request('PUT', '/_ingest/pipeline/dates', {"processors": [
+                {"date": {"field": "at", "formats": ["UNIX_MS", "dd/MM/yyyy"],
+                          "timezone": "Europe/Amsterdam"}}
+            ]}),
+            (200, {'acknowledged': True}))
+        self.assertEqual(
+            list(self.request('GET', '/_ingest/pipeline/dat*')[1]), ['dates'])
+        self.request('PUT', '/test/_doc/1', {"at": "15/11/2009"},
+                     pipeline='dates')
+        self.request('PUT', '/test/_doc/2', {"at": 1258294332000},
+                     pipeline='dates')
+        self.assertEqual(
+            [self.request('GET', '/test/_source/%d' % i)[1]['@timestamp']
+             for i in (1, 2)],
+            ['2009-11-15T00:00:00.000+01:00', '2009-11-15T15:12:12.000+01:00'])
+        self.request('DELETE', '/_ingest/pipeline/dates')
+        self.assertEqual(
+            self.request('GET', '/_ingest/pipeline/dates'), (404, {}))
+        status, response = self.request(
+            'PUT', '/test/_doc/3', {"at": "15/11/2009"}, pipeline='dates')
+        self.assertEqual(status, 400)
+
+    def test_index_stats(self):
+        '''Index stats count the documents and the bytes of their ids and
+        sources, per index and over all of them'''
+        self.request('PUT', '/test/_doc/1', {"a": 1})
+        self.request('PUT', '/other/_doc/22', {"b": "xy"})
+        status, stats = self.request('GET', '/_stats/docs,store')
+        self.assertEqual(status, 200)
+        self.assertEqual(stats['_all']['primaries'], {
+            'docs': {'count': 2, 'deleted': 0},
+            'store': {'size_in_bytes': len('1{"a":1}22{"b":"xy"}')}})
+        self.assertEqual(
+            self.request('GET', '/test/_stats/docs')[1]['indices']['test'][
+                'primaries'],
+            {'docs': {'count': 1, 'deleted': 0}})
+
+    def test_max_compilations_rate(self):
+        '''Compiling more distinct scripts than script.max_compilations_rate
+         allows trips the circuit breaker, while cached ones still run'''
+        self.request('PUT', '/test/_doc/1', {"counter": 1})
+        self.request('PUT', '/_cluster/settings', {
+            "transient": {"script.max_compilations_rate": "2/1h"}
+        })
+        statuses = [
+            self.request('POST', '/test/_update/1', {
+                "script": "ctx._source.counter += %d" % (i % 3)
+            })[0]
+            for i in range(4)
+        ]
+        self.assertEqual(statuses, [200, 200, 429, 200])
+        stats = self.request('GET', '/_nodes/stats/script')[1]
+        self.assertEqual(
+            stats['nodes']['standin']['script'],
+            {'compilations': 2, 'cache_evictions': 0,
+             'compilation_limit_triggered': 1})
+
+    def test_bulk_requires_trailing_newline(self):
+        '''Bulk bodies must be terminated by a newline'''
+        status, _ = self.request(
+            'POST', '/_bulk',
+            '{"index":{"_index":"twitter","_id":1}}\n{"user":"kimchy"}')
+        self.assertEqual(status, 400)
+
+    def test_sliced_by_query_task(self):
+        '''A by-query request not waiting for completion runs as a task
+         whose slices add up to its response'''
+        for i in range(10):
+            self.request('PUT', '/twitter/_doc/%d' % i, {"user": "kimchy"})
+        self.request('POST', '/twitter/_refresh')
+        status, response = self.request(
+            'POST', '/twitter/_delete_by_query', {"query": {"match_all": {}}},
+            wait_for_completion='false', slices='3', scroll_size='2')
+        self.assertEqual(status, 200)
+        task = response['task']
+        self.store.tasks[task].done.wait(5)
+        status, response = self.request('GET', '/_tasks/' + task)
+        self.assertEqual(response['completed'], True)
+        self.assertEqual(response['response']['deleted'], 10)
+        self.assertEqual(
+            sorted(s['slice_id'] for s in response['response']['slices']),
+            [0, 1, 2])
+        self.assertEqual(
+            sum(s['deleted'] for s in response['response']['slices']),
+            10)
+
+    def test_scroll(self):
+        '''A scroll pages through the hits of the search that opened it
+         until it is cleared'''
+        for i in range(5):
+            self.request('PUT', '/twitter/_doc/%d' % i, {"user": "kimchy"})
+        self.request('POST', '/twitter/_refresh')
+        _, page = self.request(
+            'POST', '/twitter/_search', {"sort": ["_doc"], "size": 2},
+            scroll='1m')
+        seen = [hit['_id'] for hit in page['hits']['hits']]
+        while page['hits']['hits']:
+            _, page = self.request(
+                'POST', '/_search/scroll',
+                {"scroll_id": page['_scroll_id'], "scroll": "1m"})
+            seen += [hit['_id'] for hit in page['hits']['hits']]
+        self.assertEqual(seen, ['0', '1', '2', '3', '4'])
+        self.assertEqual(
+            self.request('DELETE', '/_search/scroll',
+                         {"scroll_id": [page['_scroll_id']]}),
+            (200, {'succeeded': True, 'num_freed': 1}))
+        status, _ = self.request(
+            'POST', '/_search/scroll', {"scroll_id": page['_scroll_id']})
+        self.assertEqual(status, 404)
+
+    def test_sliced_scroll(self):
+        '''Slices split the hits of a scroll, and need a scroll'''
+        for i in range(10):
+            self.request('PUT', '/twitter/_doc/%d' % i, {"user": "kimchy"})
+        self.request('POST', '/twitter/_refresh')
+        seen = []
+        for slice_id in range(2):
+            _, page = self.request(
+                'POST', '/twitter/_search',
+                {"slice": {"id": slice_id, "max": 2}, "size": 10},
+                scroll='1m')
+            seen += [hit['_id'] for hit in page['hits']['hits']]
+        self.assertEqual(sorted(seen, key=int), [str(i) for i in range(10)])
+        status, response = self.request(
+            'POST', '/twitter/_search', {"slice": {"id": 0, "max": 2}})
+        self.assertEqual(status, 400)
+        status, response = self.request(
+            'POST', '/twitter/_search', {"slice": {"id": 2, "max": 2}},
+            scroll='1m')
+        self.assertEqual(
+            (status, response['error']['reason']),
+            (400, 'max must be greater than id'))
+
+    def test_unknown_query(self):
+        '''Queries outside the supported subset are rejected, even with no
+         document to match'''
+        for query in ({'bogus': {}},
+                      {'bool': {'must_not': [{'bogus': {}}]}}):
+            with self.subTest(query=query):
+                status, response = self.request(
+                    'POST', '/twitter/_search', {'query': query})
+                self.assertEqual(status, 400)
+                self.assertEqual(
+                    response['error']['type'], 'parsing_exception')
+
+    def test_unknown_task(self):
+        '''Tasks that never ran are not found'''
+        status, response = self.request('GET', '/_tasks/standin:404')
+        self.assertEqual(status, 404)
+        self.assertEqual(
+            response['error']['type'],
+            'resource_not_found_exception')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
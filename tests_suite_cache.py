@@ -0,0 +1,92 @@
+import unittest
+
+from suite_cache import CacheStats, ReadCache
+
+
+class ReadCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = CacheStats()
+        self.cache = ReadCache(self.stats)
+
+    def read(self, method, url, body=None, indices=('twitter',), **params):
+        '''Look a read up, storing `response` on a miss'''
+        hit, response, done = self.cache.lookup(
+            method, url, params, body, set(indices))
+        if not hit and done is not None:
+            done({'url': url})
+        return hit
+
+    def write(self, method, url, indices=('twitter',), **params):
+        _, _, done = self.cache.lookup(method, url, params, {}, set(indices))
+        done({})
+
+    def test_repeated_read(self):
+        '''An identical read is a hit, one with other params or body not'''
+        self.assertFalse(self.read('GET', '/twitter/_doc/1'))
+        self.assertTrue(self.read('GET', '/twitter/_doc/1'))
+        self.assertFalse(self.read('GET', '/twitter/_doc/1', _source='user'))
+        body = {'ids': ['1', '2']}
+        self.assertFalse(self.read('POST', '/twitter/_mget', body))
+        self.assertTrue(self.read('POST', '/twitter/_mget', dict(body)))
+        self.assertFalse(self.read('POST', '/twitter/_mget', {'ids': ['1']}))
+        self.assertEqual(
+            self.stats.snapshot()['endpoints']['GET /{index}/_doc/{id}'],
+            {'hits': 1, 'misses': 2})
+
+    def test_write_invalidates_its_indices(self):
+        '''A write drops the entries of its indices only'''
+        self.read('GET', '/twitter/_doc/1')
+        self.read('GET', '/client/_doc/1', indices=('client',))
+        self.write('POST', '/twitter/_update/2')
+        self.assertFalse(self.read('GET', '/twitter/_doc/1'))
+        self.assertTrue(self.read('GET', '/client/_doc/1', indices=('client',)))
+        self.write('POST', '/_bulk', indices=())
+        self.assertFalse(self.read('GET', '/client/_doc/1', indices=('client',)))
+        self.assertEqual(self.stats.snapshot()['invalidated'], 3)
+
+    def test_searches_are_not_cached(self):
+        '''Searches neither hit nor invalidate, refreshes invalidate'''
+        self.read('GET', '/twitter/_doc/1')
+        self.read('POST', '/twitter/_search', {'query': {'match_all': {}}})
+        self.assertFalse(self.read('POST', '/twitter/_search'))
+        self.assertTrue(self.read('GET', '/twitter/_doc/1'))
+        self.write('POST', '/twitter/_refresh')
+        self.assertFalse(self.read('GET', '/twitter/_doc/1'))
+        self.assertFalse(self.read('GET', '/twitter/_doc/2', realtime='false'))
+        self.assertFalse(self.read('GET', '/twitter/_doc/2', realtime='false'))
+
+    def test_invalidated_in_flight(self):
+        '''A response isn't stored when a write was sent meanwhile'''
+        _, _, done = self.cache.lookup(
+            'GET', '/twitter/_doc/1', {}, None, {'twitter'})
+        self.write('PUT', '/twitter/_doc/1')
+        done({'_version': 1})
+        self.assertFalse(self.read('GET', '/twitter/_doc/1'))
+
+    def test_background_task(self):
+        '''Indices of a task running in the background aren't cached until
+        they are deleted'''
+        self.write('POST', '/twitter/_update_by_query',
+                   wait_for_completion='false')
+        self.read('GET', '/twitter/_doc/1')
+        self.assertFalse(self.read('GET', '/twitter/_doc/1'))
+        self.write('DELETE', '/twitter')
+        self.read('GET', '/twitter/_doc/1')
+        self.assertTrue(self.read('GET', '/twitter/_doc/1'))
+
+    def test_add(self):
+        '''Counters of other processes are summed per endpoint'''
+        self.read('GET', '/twitter/_doc/1')
+        self.stats.add({
+            'hits': 3, 'misses': 1, 'invalidated': 2,
+            'endpoints': {'GET /{index}/_doc/{id}': {'hits': 3, 'misses': 1}}
+        })
+        self.assertEqual(self.stats.snapshot(), {
+            'hits': 3, 'misses': 2, 'invalidated': 2,
+            'endpoints': {'GET /{index}/_doc/{id}': {'hits': 3, 'misses': 2}}
+        })
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
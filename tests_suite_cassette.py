@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from elasticsearch import Elasticsearch, NotFoundError
+
+from suite_case import SuiteTestCase
+from suite_cassette import (
+    CASSETTE,
+    Cassette,
+    CassetteMismatch,
+    ReplayConnection,
+    parse_body,
+    request_of,
+)
+from suite_transport import SuiteTransport
+
+
+class ParseBodyTest(unittest.TestCase):
+
+    def test_encoding_ignored(self):
+        '''Bodies match whatever their encoding, but not their content'''
+        self.assertEqual(
+            parse_body('{"user":"kimchy","twits":"1"}'),
+            parse_body(b'{"twits": "1", "user": "kimchy"}'))
+        self.assertEqual(
+            parse_body(b'{"index":{"_id":1}}\n{"user":"kimchy"}\n'),
+            parse_body('{"index": {"_id": 1}}\n{"user": "kimchy"}'))
+        self.assertNotEqual(
+            parse_body('{"twits":"1"}'), parse_body('{"twits":1}'))
+
+
+@unittest.skipIf(CASSETTE.mode, 'the run itself records or replays')
+class CassetteTest(SuiteTestCase):
+
+    indices = ('twitter',)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'test.cassette')
+
+    def calls(self, es):
+        '''Requests answered with success, an ignored and a raised error'''
+        es.index(index='twitter', id=1, body={'user': 'kimchy'}, refresh=True)
+        results = [
+            es.get(index='twitter', id=1)['_source'],
+            es.exists(index='twitter', id=1),
+            es.exists(index='twitter', id=2),
+        ]
+        with self.assertRaises(NotFoundError):
+            es.get(index='twitter', id=2)
+        return results
+
+    def replay_client(self):
+        cassette = Cassette()
+        cassette.replay_from(self.path)
+        patcher = mock.patch('suite_cassette.CASSETTE', cassette)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return cassette, Elasticsearch(
+            transport_class=SuiteTransport, connection_class=ReplayConnection,
+            index_prefix=self.es.transport.index_prefix)
+
+    def record(self):
+        cassette = Cassette()
+        cassette.record_to(self.path)
+        with mock.patch('suite_cassette.CASSETTE', cassette):
+            results = self.calls(self.es)
+        cassette.save()
+        return results
+
+    def test_replay(self):
+        '''A replay answers like the recorded run, and plays every request
+        once'''
+        recorded = self.record()
+        cassette, es = self.replay_client()
+        self.assertEqual(self.calls(es), recorded)
+        self.assertEqual(recorded, [{'user': 'kimchy'}, True, False])
+        self.assertEqual(cassette.unplayed(), {})
+        with self.assertRaises(CassetteMismatch):
+            es.exists(index='twitter', id=1)
+
+    def test_mismatch(self):
+        '''A request not recorded fails with a diff against the next
+        recorded one'''
+        self.record()
+        cassette, es = self.replay_client()
+        with self.assertRaises(CassetteMismatch) as raised:
+            es.index(index='twitter', id=1, body={'user': 'japchae'},
+                     refresh=True)
+        message = str(raised.exception)
+        self.assertIn('-  "user": "kimchy"', message)
+        self.assertIn('+  "user": "japchae"', message)
+        self.assertEqual(
+            cassette.tests[self.id()][0],
+            dict(request_of(
+                'PUT', '/%stwitter/_doc/1' % self.es.transport.index_prefix,
+                {'refresh': b'true'},
+                '{"user":"kimchy"}'),
+                status=201, response=mock.ANY))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+from aiohttp import web
+
+from suite_connection import InstrumentedAIOHttpConnection, PoolStats
+
+
+class PoolStatsTest(unittest.TestCase):
+
+    def test_reused_requests(self):
+        '''Requests on a socket that already served one count as reused'''
+        stats = PoolStats()
+        stats.opened()
+        for served in range(3):
+            stats.requested(served)
+        stats.opened()
+        stats.requested(0)
+        self.assertEqual(stats.snapshot(), {
+            'connections_opened': 2,
+            'requests': 4,
+            'reused_requests': 2,
+            'max_requests_per_connection': 3
+        })
+
+    def test_add(self):
+        '''Counters of other processes are summed, maxima are kept'''
+        stats = PoolStats()
+        stats.opened()
+        stats.requested(0)
+        stats.add({
+            'connections_opened': 1,
+            'requests': 5,
+            'reused_requests': 4,
+            'max_requests_per_connection': 5
+        })
+        self.assertEqual(stats.snapshot(), {
+            'connections_opened': 2,
+            'requests': 6,
+            'reused_requests': 4,
+            'max_requests_per_connection': 5
+        })
+
+
+class AIOHttpConnectionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.router.add_get('/', lambda request: web.json_response({}))
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_pool_stats(self):
+        '''Sockets of the aiohttp connection are counted and reused'''
+        stats = PoolStats()
+        connection = InstrumentedAIOHttpConnection(
+            host='127.0.0.1', port=self.port)
+        with mock.patch('suite_connection.POOL_STATS', stats):
+            for _ in range(3):
+                await connection.perform_request('GET', '/')
+        await connection.close()
+        self.assertEqual(stats.snapshot(), {
+            'connections_opened': 1,
+            'requests': 3,
+            'reused_requests': 2,
+            'max_requests_per_connection': 3
+        })
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,71 @@
+import unittest
+
+from elasticsearch.helpers import bulk
+
+from fixtures import generate
+from suite_case import SuiteTestCase
+from suite_export import IdTally, scroll_export, search_after_export
+
+DOCS = 250
+
+
+class IdTallyTest(unittest.TestCase):
+
+    def test_counts(self):
+        '''Missing, repeated and unknown ids are told apart'''
+        tally = IdTally(5)
+        for doc_id in ('0', '1', '1', '3', '7', 'x'):
+            tally.add(doc_id)
+        other = IdTally(5)
+        other.add('0')
+        tally.merge(other)
+        self.assertEqual(
+            (tally.missing(), tally.duplicates(), tally.unexpected),
+            (2, 2, 2))
+
+
+class ExportTest(SuiteTestCase):
+
+    indices = ('twitter',)
+
+    def setUp(self):
+        super().setUp()
+        bulk(self.es, (
+            {'_index': 'twitter', '_id': i, '_source': dict(doc, position=i)}
+            for i, doc in enumerate(generate('tweet', DOCS))
+        ), refresh=True)
+
+    def assertExportedOnce(self, hits):
+        tally = IdTally(DOCS)
+        for hit in hits:
+            tally.add(hit['_id'])
+        self.assertEqual(
+            (tally.missing(), tally.duplicates(), tally.unexpected),
+            (0, 0, 0))
+
+    def test_scroll(self):
+        '''A scroll returns every document once'''
+        self.assertExportedOnce(scroll_export(self.es, 'twitter', size=40))
+
+    def test_sliced_scroll(self):
+        '''The slices of a scroll return every document once between
+        them'''
+        slices = [
+            list(scroll_export(self.es, 'twitter', size=40, slice_id=i,
+                               slices=3))
+            for i in range(3)
+        ]
+        self.assertTrue(all(slices))
+        self.assertExportedOnce(hit for hits in slices for hit in hits)
+
+    def test_search_after(self):
+        '''search_after pages return every document once, in sort order'''
+        hits = list(search_after_export(
+            self.es, 'twitter', 'position', size=40))
+        self.assertEqual(
+            [hit['_source']['position'] for hit in hits], list(range(DOCS)))
+        self.assertExportedOnce(hits)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
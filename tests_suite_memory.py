@@ -0,0 +1,62 @@
+import tracemalloc
+import unittest
+
+from suite_memory import MB, MemoryLog
+
+
+class MemoryLogTest(unittest.TestCase):
+
+    def setUp(self):
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        self.log = MemoryLog()
+        self.log.start(budget_mb=1)
+
+    def test_request(self):
+        '''A request's peak includes its garbage, what it retained doesn't'''
+        self.log.start_test('test')
+        with self.log.request('POST', '/twitter/_mget'):
+            garbage = bytearray(4 * MB)
+            del garbage
+            response = bytearray(MB)
+        group = self.log.endpoints['POST /{index}/_mget']
+        self.assertEqual(group['requests'], 1)
+        self.assertGreaterEqual(group['max_peak_bytes'], 4 * MB)
+        self.assertGreaterEqual(group['retained_bytes'], MB)
+        self.assertLess(group['retained_bytes'], 2 * MB)
+        self.assertEqual(group['max_test'], 'test')
+        del response
+
+    def test_test_peak(self):
+        '''A test's peak spans its requests, and tests over budget are
+        flagged'''
+        self.log.start_test('large')
+        data = bytearray(2 * MB)
+        del data
+        with self.log.request('GET', '/twitter/_doc/1'):
+            pass
+        self.log.stop_test()
+        self.log.start_test('small')
+        self.log.stop_test()
+        self.assertGreaterEqual(self.log.tests['large']['peak_bytes'], 2 * MB)
+        self.assertLess(self.log.tests['large']['retained_bytes'], MB)
+        self.assertEqual(self.log.over_budget(), ['large'])
+        self.assertIn('large  OVER BUDGET', self.log.format())
+
+    def test_add(self):
+        '''The logs of several processes add up'''
+        with self.log.request('GET', '/twitter/_doc/1'):
+            pass
+        other = MemoryLog()
+        other.add_request('GET /{index}/_doc/{id}', 'other', 10 * MB, MB)
+        other.tests['other'] = {'peak_bytes': 10 * MB, 'retained_bytes': 0}
+        self.log.add(other.snapshot())
+        group = self.log.endpoints['GET /{index}/_doc/{id}']
+        self.assertEqual(group['requests'], 2)
+        self.assertEqual(group['max_peak_bytes'], 10 * MB)
+        self.assertEqual(group['max_test'], 'other')
+        self.assertEqual(self.log.over_budget(), ['other'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
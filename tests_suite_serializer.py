@@ -0,0 +1,111 @@
+import datetime
+import decimal
+import unittest
+import uuid
+
+from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JSONSerializer
+
+from fixtures import CHARACTERS, CLIENTS, TWEETS, sized
+from suite_case import SuiteTestCase
+from suite_config import client_options, es_hosts
+from suite_serializer import SERIALIZERS
+from suite_transport import SuiteTransport
+
+# Documents of the suite and the types JSONSerializer takes on top of
+# plain JSON.
+DOCUMENTS = list(TWEETS + CHARACTERS + CLIENTS) + [
+    sized(TWEETS[0], 10000),
+    {'name': 'Mortimer "Morty" Smith', 'quote': 'Aw jeez, Rick… 😬\n\t'},
+    {'tags': ['a', 'b'], 'nested': {'level': {'deep': [1, 2.5, None, True]}}},
+    {'created': datetime.datetime(2020, 7, 1, 12, 30, 15, 250),
+     'day': datetime.date(2020, 7, 1), 'id': uuid.UUID(int=42),
+     'price': decimal.Decimal('9.99'), 'negative': -0.0},
+    {1: 'integer key', 'float': 0.1 + 0.2},
+]
+# Beyond the 64 bits of a long field.
+BIG = {'big': 2 ** 70}
+
+
+@unittest.skipIf('orjson' not in SERIALIZERS, 'orjson is not installed')
+class OrjsonSerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.json = JSONSerializer()
+        self.orjson = SERIALIZERS['orjson']()
+
+    def test_same_bytes(self):
+        '''Bodies are encoded exactly like JSONSerializer does'''
+        for doc in DOCUMENTS + [BIG]:
+            with self.subTest(doc=doc):
+                self.assertEqual(self.orjson.dumps(doc), self.json.dumps(doc))
+
+    def test_encode(self):
+        '''encode returns the UTF-8 bytes of what dumps returns, which
+        pass through dumps untouched'''
+        for doc in DOCUMENTS + [BIG]:
+            with self.subTest(doc=doc):
+                encoded = self.orjson.encode(doc)
+                self.assertEqual(encoded, self.json.dumps(doc).encode('utf-8'))
+                self.assertIs(self.orjson.dumps(encoded), encoded)
+
+    def test_exponent_floats(self):
+        '''Floats in exponent notation only differ in the sign of the
+        exponent and parse to the same value'''
+        doc = {'small': 1e-7, 'large': 1e22}
+        self.assertEqual(self.orjson.dumps(doc), '{"small":1e-7,"large":1e22}')
+        self.assertEqual(
+            self.json.loads(self.orjson.dumps(doc)),
+            self.json.loads(self.json.dumps(doc)))
+
+    def test_same_values(self):
+        '''Responses are decoded to the same values'''
+        for doc in DOCUMENTS:
+            with self.subTest(doc=doc):
+                encoded = self.json.dumps(doc)
+                self.assertEqual(
+                    self.orjson.loads(encoded), self.json.loads(encoded))
+
+    def test_big_integers(self):
+        '''Integers beyond 64 bits are decoded as floats'''
+        self.assertEqual(
+            self.orjson.loads(self.orjson.dumps(BIG)), {'big': float(2 ** 70)})
+
+    def test_strings_pass_through(self):
+        '''Bodies already encoded, like bulk NDJSON, are left alone'''
+        body = '{"index":{}}\n{"user":"kimchy"}\n'
+        self.assertIs(self.orjson.dumps(body), body)
+
+
+@unittest.skipIf('orjson' not in SERIALIZERS, 'orjson is not installed')
+class OrjsonRoundTripTest(SuiteTestCase):
+
+    indices = ('twitter',)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        options = dict(client_options(), serializer=SERIALIZERS['orjson']())
+        cls.orjson_es = Elasticsearch(
+            es_hosts(), transport_class=SuiteTransport,
+            index_prefix=cls.es.transport.index_prefix, **options)
+
+    def test_get_source(self):
+        '''Documents indexed with orjson read back byte for byte the same
+        through JSONSerializer, and the other way around'''
+        json = JSONSerializer()
+        for position, doc in enumerate(DOCUMENTS):
+            with self.subTest(doc=doc):
+                self.orjson_es.index(index='twitter', id=position, body=doc)
+                self.assertEqual(
+                    json.dumps(self.es.get_source(index='twitter', id=position)),
+                    json.dumps(doc))
+                self.es.index(index='twitter', id=position, body=doc)
+                self.assertEqual(
+                    json.dumps(self.orjson_es.get_source(
+                        index='twitter', id=position)),
+                    json.dumps(doc))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
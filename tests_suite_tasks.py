@@ -0,0 +1,68 @@
+import unittest
+
+from suite_tasks import follow_task, slice_rates
+
+SLICE = {'updated': 5, 'batches': 1, 'throttled_millis': 0}
+
+
+class FakeTasks(object):
+    """
+    Tasks API replaying polls of a task with two slices: the (running
+    seconds, running slice ids, slices of the status) of each poll.
+    """
+
+    def __init__(self, polls):
+        self.polls = list(polls)
+        self.current = None
+
+    def get(self, task_id):
+        self.current = self.polls.pop(0)
+        seconds, _, slices = self.current
+        result = {
+            'completed': not self.polls,
+            'task': {
+                'running_time_in_nanos': int(seconds * 1e9),
+                'status': {'slices': slices},
+            },
+        }
+        if not self.polls:
+            result['response'] = {'slices': slices}
+        return result
+
+    def list(self, parent_task_id, detailed):
+        _, running, _ = self.current
+        return {'nodes': {'node': {'tasks': {
+            'node:%d' % slice_id: {'status': {'slice_id': slice_id}}
+            for slice_id in running
+        }}}}
+
+
+class FakeClient(object):
+
+    def __init__(self, polls):
+        self.tasks = FakeTasks(polls)
+
+
+class FollowTaskTest(unittest.TestCase):
+
+    def test_slice_seconds(self):
+        '''Slices are timed up to the poll they are gone from after they
+        ran, or report their final status at; slices that haven't started
+        are not'''
+        done = [dict(SLICE, slice_id=0), dict(SLICE, slice_id=1)]
+        es = FakeClient([
+            (1.0, set(), [None, None]),
+            (2.0, {0}, [None, None]),
+            (3.0, {1}, [done[0], None]),
+            (4.0, set(), done),
+        ])
+        finished = follow_task(es, 'node:1', poll_interval=0)
+        self.assertEqual(finished.slice_seconds, {0: 3.0})
+        self.assertEqual(
+            [(rate['slice_id'], rate['elapsed_s'], rate['docs_per_sec'])
+             for rate in slice_rates(finished)],
+            [(0, 3.0, 1.7), (1, 4.0, 1.2)])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,62 @@
+import contextvars
+import unittest
+
+from suite_timing import RequestLog, aggregate, endpoint_of_request
+
+
+class RequestLogTest(unittest.TestCase):
+
+    def test_endpoint_of_request(self):
+        '''Index names and document ids are left out of endpoints'''
+        self.assertEqual(
+            endpoint_of_request('PUT', '/twitter/_doc/1?refresh=true'),
+            'PUT /{index}/_doc/{id}')
+        self.assertEqual(
+            endpoint_of_request('POST', '/rick%26morty/_termvectors/1'),
+            'POST /{index}/_termvectors/{id}')
+        self.assertEqual(
+            endpoint_of_request('POST', '/_bulk'),
+            'POST /_bulk')
+
+    def test_aggregate(self):
+        '''Requests are summed up per test, slowest first'''
+        log = RequestLog()
+        log.enabled = True
+        log.test = 'fast'
+        log.record('GET', '/twitter/_doc/1', 200, None, '{}', 0.001)
+        log.test = 'slow'
+        log.record('POST', '/_reindex', 200, b'{"a":1}', '{}', 0.5)
+        log.record('POST', '/_reindex', 500, b'{"a":1}', None, 1.5)
+        per_test = aggregate(log.records, 'test')
+        self.assertEqual(list(per_test), ['slow', 'fast'])
+        self.assertEqual(per_test['slow']['requests'], 2)
+        self.assertEqual(per_test['slow']['total_s'], 2.0)
+        self.assertEqual(per_test['slow']['max_s'], 1.5)
+        self.assertEqual(per_test['slow']['bytes_out'], 14)
+
+    def test_serialization_time(self):
+        '''Encoding counts towards the next request, decoding towards the
+        last one'''
+        log = RequestLog()
+        log.enabled = True
+
+        def request():
+            log.encoded(0.25)
+            log.encoded(0.5)
+            log.record('POST', '/_bulk', 200, b'{}', '{}', 1.0)
+            log.decoded(0.125)
+            log.record('GET', '/twitter/_doc/1', 200, None, '{}', 1.0)
+        contextvars.copy_context().run(request)
+        self.assertEqual(
+            [(r['encode_s'], r['decode_s']) for r in log.records],
+            [(0.75, 0.125), (0.0, 0.0)])
+
+    def test_disabled(self):
+        '''Nothing is recorded unless enabled'''
+        log = RequestLog()
+        log.record('GET', '/twitter/_doc/1', 200, None, '{}', 0.001)
+        self.assertEqual(log.records, [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
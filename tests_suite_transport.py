@@ -0,0 +1,108 @@
+import unittest
+
+from suite_transport import (
+    SuiteTransport,
+    indices_from_body,
+    indices_from_path,
+    prefix_body,
+    prefix_path,
+    strip_prefix,
+)
+
+
+class SuiteTransportTest(unittest.TestCase):
+
+    def test_indices_from_path(self):
+        '''Index names are unescaped, API endpoints are ignored'''
+        self.assertEqual(
+            indices_from_path('/rick%26morty,twitter/_doc/1'),
+            {'rick&morty', 'twitter'})
+        self.assertEqual(
+            indices_from_path('/_bulk'),
+            set())
+
+    def test_indices_from_bulk_body(self):
+        '''Indices of bulk action lines are tracked'''
+        body = (
+            '{"index":{"_index":"rick&morty","_id":1}}\n'
+            '{"character":"Rick"}\n'
+            '{"delete":{"_index":"twitter","_id":1}}\n')
+        self.assertEqual(
+            indices_from_body('/_bulk', body),
+            {'rick&morty', 'twitter'})
+
+    def test_prefix_path(self):
+        '''Every index in the path gets the prefix'''
+        self.assertEqual(
+            prefix_path('/rick%26morty,twitter/_doc/1', 'w1_'),
+            '/w1_rick%26morty,w1_twitter/_doc/1')
+        self.assertEqual(
+            prefix_path('/_mget', 'w1_'),
+            '/_mget')
+
+    def test_prefix_reindex_body(self):
+        '''Source and destination of reindex get the prefix'''
+        body = {"source": {"index": "twitter"}, "dest": {"index": "new_twitter"}}
+        self.assertEqual(
+            prefix_body('/_reindex', body, 'w1_'),
+            {"source": {"index": "w1_twitter"},
+             "dest": {"index": "w1_new_twitter"}})
+        self.assertEqual(
+            body['source']['index'],
+            'twitter')
+
+    def test_prefix_bulk_body(self):
+        '''Bulk action lines get the prefix, sources are left as is'''
+        body = '{"index":{"_index":"twitter","_id":1}}\n{"user":"kimchy"}\n'
+        self.assertEqual(
+            prefix_body('/_bulk', body, 'w1_'),
+            '{"index":{"_index":"w1_twitter","_id":1}}\n{"user":"kimchy"}\n')
+
+    def test_strip_prefix(self):
+        '''Responses report plain index names'''
+        response = {
+            'docs': [{'_index': 'w1_twitter', '_id': '1'}],
+            'user': 'w1_kimchy'
+        }
+        self.assertEqual(
+            strip_prefix(response, 'w1_'),
+            {'docs': [{'_index': 'twitter', '_id': '1'}], 'user': 'w1_kimchy'})
+
+    def test_batched_visibility(self):
+        '''Writes are refreshed in one request before the next search'''
+        transport = SuiteTransport([{}], visibility='batched')
+        for index in ('rick&morty', 'twitter'):
+            _, params, _, refresh = transport.prepare_request(
+                'PUT', '/%s/_doc/1' % index, None, {})
+            self.assertEqual((params, refresh), (None, None))
+        transport.prepare_request('GET', '/twitter/_doc/1', None, None)
+        _, _, _, refresh = transport.prepare_request(
+            'POST', '/twitter/_delete_by_query', None, {})
+        self.assertEqual(refresh, '/rick%26morty,twitter/_refresh')
+        _, _, _, refresh = transport.prepare_request(
+            'POST', '/twitter/_count', None, None)
+        self.assertEqual(refresh, '/twitter/_refresh')
+        _, _, _, refresh = transport.prepare_request(
+            'POST', '/twitter/_count', None, None)
+        self.assertIsNone(refresh)
+
+    def test_refresh_visibility(self):
+        '''Writes get the refresh parameter of the mode unless given'''
+        transport = SuiteTransport([{}], visibility='wait_for')
+        _, params, _, _ = transport.prepare_request(
+            'PUT', '/twitter/_doc/1', None, {})
+        self.assertEqual(params, {'refresh': 'wait_for'})
+        _, params, _, _ = transport.prepare_request(
+            'PUT', '/twitter/_doc/1', {'refresh': 'false'}, {})
+        self.assertEqual(params, {'refresh': 'false'})
+        transport.visibility = 'refresh'
+        _, params, _, refresh = transport.prepare_request(
+            'POST', '/twitter/_update_by_query', None, {})
+        self.assertEqual(params, {'refresh': 'true'})
+        self.assertEqual(refresh, '/twitter/_refresh')
+        with self.assertRaises(ValueError):
+            transport.visibility = 'sometimes'
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)